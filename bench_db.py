@@ -0,0 +1,114 @@
+"""
+数据库并发基准：对比在事件循环中直接执行同步查询与通过线程池执行时的事件循环延迟
+
+用法：python bench_db.py [--levels 1,4,16,64] [--duration 2] [--rows 20000]
+在临时目录中新建SQLite数据库，不影响项目的app.db
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE_INTERVAL = 0.005  # 探测任务的休眠间隔（秒）
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="数据库并发下的事件循环延迟基准")
+    parser.add_argument("--levels", default="1,4,16,64", help="并发请求数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=2.0, help="每组测试时长（秒）")
+    parser.add_argument("--rows", type=int, default=20000, help="出行历史记录条数")
+    return parser.parse_args()
+
+def seed(rows: int) -> int:
+    """写入一个用户及其出行历史，返回用户ID"""
+    from src.models.database import SessionLocal, User, TravelHistory, create_tables
+    create_tables()
+    db = SessionLocal()
+    try:
+        user = User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.bulk_insert_mappings(TravelHistory, [{
+            "user_id": user.id,
+            "start_location": "39.9,116.4",
+            "end_location": "39.95,116.45",
+            "transport_mode": random.choice(["walking", "cycling", "bus", "subway"]),
+            "distance": random.uniform(0.5, 20),
+            "duration": random.randint(5, 90),
+            "carbon_emission": random.uniform(0, 2),
+            "weather_condition": "晴天",
+            "traffic_condition": "畅通"
+        } for _ in range(rows)])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def query_history(db, user_id: int, rows: int):
+    """按用户过滤的偏移分页查询，随机偏移使每次查询都有实际扫描量"""
+    from src.models.database import TravelHistory
+    return db.query(TravelHistory).filter(
+        TravelHistory.user_id == user_id
+    ).offset(random.randint(0, max(rows - 10, 0))).limit(10).all()
+
+async def run_level(mode: str, concurrency: int, duration: float, user_id: int, rows: int):
+    from src.models.database import SessionLocal
+    from src.utils.db_executor import db_executor
+
+    lags = []
+    done = 0
+    stop_at = time.perf_counter() + duration
+
+    async def probe():
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+    async def client():
+        nonlocal done
+        while time.perf_counter() < stop_at:
+            if mode == "inline":
+                # 原实现：异步接口中直接使用同步会话
+                db = SessionLocal()
+                try:
+                    query_history(db, user_id, rows)
+                finally:
+                    db.close()
+                await asyncio.sleep(0)
+            else:
+                await db_executor.run(query_history, user_id, rows)
+            done += 1
+
+    await asyncio.gather(probe(), *(client() for _ in range(concurrency)))
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {
+        "qps": done / duration,
+        "p50": statistics.median(lags_ms),
+        "p99": lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))],
+        "max": lags_ms[-1]
+    }
+
+def main():
+    args = parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    # 数据库URL为相对路径，切换目录后即使用临时数据库
+    os.chdir(workdir)
+    print(f"临时数据库目录：{workdir}")
+    user_id = seed(args.rows)
+
+    print(f"{'方式':<10}{'并发':>6}{'查询/秒':>10}{'延迟p50(ms)':>14}{'延迟p99(ms)':>14}{'最大(ms)':>12}")
+    for mode in ("inline", "executor"):
+        for concurrency in levels:
+            result = asyncio.run(run_level(mode, concurrency, args.duration, user_id, args.rows))
+            print(f"{mode:<10}{concurrency:>6}{result['qps']:>10.0f}{result['p50']:>14.2f}{result['p99']:>14.2f}{result['max']:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 from datetime import timedelta
 from typing import Dict
 from pydantic import BaseModel, EmailStr
 
-from ..models.database import User, get_db
+from ..models.database import User
 from ..utils.auth import (
-    verify_password,
     get_password_hash,
     create_access_token,
     get_current_active_user,
     authenticate_user,
+    create_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from ..utils.db_executor import db_executor
 
 router = APIRouter(prefix="/api/v1/auth", tags=["auth"])
 
@@ -27,44 +27,17 @@ class Token(BaseModel):
     token_type: str
 
 @router.post("/register", response_model=Dict)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate):
     """用户注册"""
-    # 检查用户名是否已存在
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
-        raise HTTPException(
-            status_code=400,
-            detail="用户名已被注册"
-        )
-    
-    # 检查邮箱是否已存在
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if db_user:
-        raise HTTPException(
-            status_code=400,
-            detail="邮箱已被注册"
-        )
-    
-    # 创建新用户
-    hashed_password = get_password_hash(user.password)
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
+    # 密码哈希与数据库读写都在线程池中执行
+    hashed_password = await db_executor.call(get_password_hash, user.password)
+    await db_executor.run(create_user, user.username, user.email, hashed_password)
     return {"message": "注册成功"}
 
 @router.post("/token", response_model=Token)
-async def login(
-    form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
-):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """用户登录"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await db_executor.run(authenticate_user, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import Dict, Optional, List
 from src.utils.route_service import route_service
+from src.utils.geometry import GEOMETRY_FORMATS, MAX_ZOOM
+from src.utils.serialization import FastResponse, FastResponseRoute
 from src.utils.ai_route_service import ai_route_service
 from src.utils.weather_service import weather_service
 from src.utils.traffic_service import traffic_service
 
-router = APIRouter(prefix="/api/v1/route", tags=["route"])
+router = APIRouter(
+    prefix="/api/v1/route",
+    tags=["route"],
+    route_class=FastResponseRoute,
+    default_response_class=FastResponse
+)
 
 class RouteRequest(BaseModel):
     start: str  # 格式：经度,纬度
@@ -17,10 +24,12 @@ class RouteAnalysisRequest(BaseModel):
     routes: List[Dict]
 
 @router.post("/plan")
-async def plan_route(request: RouteRequest):
+async def plan_route(request: RouteRequest, zoom: Optional[int] = Query(None, ge=0, le=MAX_ZOOM), geometry_format: str = "list"):
     """规划路线"""
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的几何格式: {geometry_format}")
     try:
-        result = await route_service.plan_route(request.start, request.end)
+        result = await route_service.plan_route(request.start, request.end, zoom, geometry_format)
         if result["status"] == "error":
             raise HTTPException(status_code=400, detail=result["message"])
         return result
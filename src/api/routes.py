@@ -1,14 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
+import functools
 from ..models.schemas import RouteRequest, Route, UserPreference
 from ..utils.route_optimizer import RouteOptimizer
-from ..utils.weather_service import WeatherService
+from ..utils.weather_service import weather_service
 from ..utils.traffic_service import TrafficService
+from ..utils.serialization import FastResponse, FastResponseRoute, STREAM_MEDIA_TYPES, encode_event
+from ..utils.deadline import with_deadline
+from ..utils.geo import parse_lat_lon
+from ..config.settings import settings
 from datetime import datetime
 
-router = APIRouter()
+router = APIRouter(route_class=FastResponseRoute, default_response_class=FastResponse)
 route_optimizer = RouteOptimizer()
-weather_service = WeatherService()
 traffic_service = TrafficService()
 
 @router.post("/recommend", response_model=List[Dict[str, Any]])
@@ -17,23 +23,124 @@ async def recommend_routes(
     end_location: str,
     departure_time: datetime = None,
     consider_weather: bool = True,
-    consider_traffic: bool = True
+    consider_traffic: bool = True,
+    top_k: int = Query(5, ge=1, le=20)
 ):
     """
     推荐路线
     """
+    skipped = []
+    weather_info, traffic_task = _conditions(start_location, end_location, consider_weather, consider_traffic, skipped)
+    weather = _weather_of(weather_info, skipped)
+    traffic = await traffic_task if traffic_task is not None else None
     try:
-        routes = route_optimizer.get_route_recommendations(
+        # 候选方案搜索是CPU密集计算，放到线程池执行
+        loop = asyncio.get_running_loop()
+        routes = await loop.run_in_executor(None, functools.partial(
+            route_optimizer.get_route_recommendations,
             start_location=start_location,
             end_location=end_location,
             departure_time=departure_time,
-            consider_weather=consider_weather,
-            consider_traffic=consider_traffic
-        )
+            weather=weather,
+            traffic=traffic,
+            top_k=top_k
+        ))
         return routes
+    except ValueError:
+        raise HTTPException(status_code=400, detail="坐标格式错误，应为\"纬度,经度\"")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/recommend/stream")
+async def recommend_routes_stream(
+    request: Request,
+    start_location: str,
+    end_location: str,
+    departure_time: datetime = None,
+    consider_weather: bool = True,
+    consider_traffic: bool = True,
+    top_k: int = Query(5, ge=1, le=20),
+    format: Optional[str] = None
+):
+    """
+    流式推荐路线：每条候选路线就绪后立即输出（计算代价低的在前，最多top_k条），随后输出天气与交通标注
+    format为ndjson或sse，未指定时按Accept头选择
+    """
+    if format is None:
+        format = "sse" if STREAM_MEDIA_TYPES["sse"] in request.headers.get("accept", "") else "ndjson"
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+    events = _recommendation_events(start_location, end_location, departure_time, consider_weather, consider_traffic, top_k)
+    return StreamingResponse(
+        (encode_event(event, data, format) async for event, data in events),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _recommendation_events(
+    start_location: str,
+    end_location: str,
+    departure_time: Optional[datetime],
+    consider_weather: bool,
+    consider_traffic: bool,
+    top_k: int
+) -> AsyncIterator[tuple]:
+    """按就绪顺序产生(事件名, 数据)：route若干条，然后weather、traffic，最后done"""
+    skipped = []
+    weather_info, traffic_task = _conditions(start_location, end_location, consider_weather, consider_traffic, skipped)
+
+    try:
+        # 时刻表搜索是CPU密集计算，逐条在线程池中推进生成器
+        loop = asyncio.get_running_loop()
+        candidates = route_optimizer.iter_route_recommendations(start_location, end_location, departure_time)
+        routes = []
+        while len(routes) < top_k:
+            try:
+                route = await loop.run_in_executor(None, next, candidates, None)
+            except Exception as e:
+                yield "error", {"error": f"路线推荐失败: {str(e)}"}
+                return
+            if route is None:
+                break
+            routes.append(route)
+            yield "route", route
+
+        weather = _weather_of(weather_info, skipped)
+        if weather is not None:
+            yield "weather", route_optimizer.annotate_weather(routes, weather)
+        if traffic_task is not None:
+            traffic = await traffic_task
+            if traffic is not None:
+                yield "traffic", route_optimizer.annotate_traffic(routes, traffic)
+        yield "done", {"count": len(routes), "skipped": skipped}
+    finally:
+        # 客户端提前断开时取消未完成的查询
+        if traffic_task is not None and not traffic_task.done():
+            traffic_task.cancel()
+
+def _conditions(start_location: str, end_location: str, consider_weather: bool, consider_traffic: bool, skipped: List[str]) -> tuple:
+    """起点天气只读网格缓存（不等待上游）；沿途交通状况在后台查询，受截止时间限制"""
+    weather_info = traffic_task = None
+    if consider_weather:
+        try:
+            lat, lon = parse_lat_lon(start_location)
+            weather_info = weather_service.peek_weather(lat, lon)
+        except ValueError:
+            skipped.append("weather")
+    if consider_traffic:
+        traffic_task = asyncio.ensure_future(with_deadline(
+            "traffic", traffic_service.get_traffic_condition(start_location, end_location), settings.ROUTE_TRAFFIC_TIMEOUT, skipped
+        ))
+    return weather_info, traffic_task
+
+def _weather_of(weather_info: Optional[Dict[str, Any]], skipped: List[str]) -> Optional[Dict[str, Any]]:
+    if weather_info is None:
+        return None
+    if weather_info.get("status") != "1":
+        skipped.append("weather")
+        return None
+    return weather_info["weather"]
+
 @router.get("/history", response_model=List[Dict[str, Any]])
 async def get_route_history():
     """
@@ -1,60 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import timedelta
-from ..models.schemas import UserCreate, UserResponse, UserPreference, Token, TravelHistoryResponse
-from ..models.database import User, TravelHistory
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
+import base64
+import json
+from ..models.schemas import UserCreate, UserResponse, UserPreference, Token, TravelHistoryPage
+from ..models.database import User, TravelHistory, UserPreference as UserPreferenceModel
 from ..utils.auth import (
     authenticate_user,
     create_access_token,
+    create_user,
     get_current_active_user,
-    get_password_hash,
-    get_db
+    get_password_hash
 )
+from ..utils.db_executor import db_executor
 from ..config.settings import settings
 
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate):
     """用户注册"""
-    # 检查用户名是否已存在
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
-        raise HTTPException(
-            status_code=400,
-            detail="用户名已被注册"
-        )
-        
-    # 检查邮箱是否已存在
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if db_user:
-        raise HTTPException(
-            status_code=400,
-            detail="邮箱已被注册"
-        )
-        
-    # 创建新用户
-    hashed_password = get_password_hash(user.password)
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    return db_user
+    # 密码哈希与数据库读写都在线程池中执行
+    hashed_password = await db_executor.call(get_password_hash, user.password)
+    return await db_executor.run(create_user, user.username, user.email, hashed_password)
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
-):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     """用户登录获取令牌"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await db_executor.run(authenticate_user, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -76,38 +52,88 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 @router.put("/preferences", response_model=UserPreference)
 async def update_user_preferences(
     preferences: UserPreference,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user)
 ):
     """更新用户偏好设置"""
+    return await db_executor.run(_save_preferences, current_user.id, preferences)
+
+def _save_preferences(db: Session, user_id: int, preferences: UserPreference) -> UserPreference:
+    values = preferences.dict(exclude_unset=True, exclude={"user_id"})
+    if "preferred_transport_modes" in values:
+        values["preferred_transport_modes"] = json.dumps(values["preferred_transport_modes"])
+
     # 检查是否已有偏好设置
-    db_preferences = db.query(UserPreference).filter(
-        UserPreference.user_id == current_user.id
+    db_preferences = db.query(UserPreferenceModel).filter(
+        UserPreferenceModel.user_id == user_id
     ).first()
     
     if db_preferences:
         # 更新现有偏好
-        for key, value in preferences.dict(exclude_unset=True).items():
+        for key, value in values.items():
             setattr(db_preferences, key, value)
     else:
-        # 创建新的偏好设置
-        db_preferences = UserPreference(**preferences.dict(), user_id=current_user.id)
+        # 创建新的偏好设置，未提供的字段使用默认值
+        defaults = preferences.dict(exclude={"user_id"})
+        defaults["preferred_transport_modes"] = json.dumps(defaults["preferred_transport_modes"])
+        db_preferences = UserPreferenceModel(**{**defaults, **values}, user_id=user_id)
         db.add(db_preferences)
         
     db.commit()
     db.refresh(db_preferences)
-    return db_preferences
+    return UserPreference(
+        user_id=db_preferences.user_id,
+        max_walking_distance=db_preferences.max_walking_distance,
+        preferred_transport_modes=json.loads(db_preferences.preferred_transport_modes or "[]"),
+        avoid_traffic=db_preferences.avoid_traffic,
+        consider_weather=db_preferences.consider_weather,
+        carbon_conscious=db_preferences.carbon_conscious
+    )
 
-@router.get("/history", response_model=List[TravelHistoryResponse])
+@router.get("/history", response_model=TravelHistoryPage)
 async def get_travel_history(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 10
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    transport_mode: Optional[str] = None
 ):
-    """获取用户出行历史"""
-    history = db.query(TravelHistory).filter(
-        TravelHistory.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    
-    return history 
\ No newline at end of file
+    """获取用户出行历史，按时间倒序；下一页传入上一页返回的next_cursor"""
+    after = _decode_cursor(cursor) if cursor else None
+    rows = await db_executor.run(_travel_history, current_user.id, after, limit + 1, start_date, end_date, transport_mode)
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+def _travel_history(
+    db: Session,
+    user_id: int,
+    after: Optional[Tuple[datetime, int]],
+    limit: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    transport_mode: Optional[str]
+) -> List[TravelHistory]:
+    """从(created_at, id)游标之后继续取记录，所有条件都落在复合索引上"""
+    query = db.query(TravelHistory).filter(TravelHistory.user_id == user_id)
+    if transport_mode:
+        query = query.filter(TravelHistory.transport_mode == transport_mode)
+    if start_date:
+        query = query.filter(TravelHistory.created_at >= start_date)
+    if end_date:
+        query = query.filter(TravelHistory.created_at < end_date)
+    if after:
+        query = query.filter(tuple_(TravelHistory.created_at, TravelHistory.id) < after)
+    return query.order_by(TravelHistory.created_at.desc(), TravelHistory.id.desc()).limit(limit).all()
+
+def _encode_cursor(row: TravelHistory) -> str:
+    """游标为最后一条记录的(created_at, id)，编码为不透明的字符串"""
+    payload = json.dumps([row.created_at.isoformat(), row.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
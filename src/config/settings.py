@@ -14,11 +14,20 @@ class Settings(BaseSettings):
     
     # 数据库设置
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+    DB_EXECUTOR_WORKERS: int = 8  # 数据库线程池大小，即同时打开的会话数上限
+    DB_POOL_SIZE: int = 10  # 连接池常驻连接数，应不小于DB_EXECUTOR_WORKERS
+    DB_MAX_OVERFLOW: int = 10  # 超出常驻连接数后最多额外创建的连接数
+    DB_POOL_TIMEOUT: float = 30  # 等待可用连接的超时（秒）
+    DB_POOL_RECYCLE: int = 1800  # 连接最长使用时间（秒），避免被服务端断开
+    SQLITE_BUSY_TIMEOUT: float = 30  # 数据库被锁定时的等待时间（秒）
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # 内存映射大小（字节）
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024  # 每个连接的页缓存大小（KB）
     
     # API密钥
     SECRET_KEY: str = "your-secret-key-here"  # 用于JWT token
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    ADMIN_USERNAMES: str = os.getenv("ADMIN_USERNAMES", "")  # 可调用批量导入等管理接口的用户名，逗号分隔
     AMAP_API_KEY: str = ""  # 高德地图Web API密钥
     AMAP_WEB_KEY: str = ""  # 高德地图Web服务密钥
     
@@ -37,6 +46,100 @@ class Settings(BaseSettings):
     # 百度地图API配置
     BAIDU_MAP_AK: str = os.getenv("BAIDU_MAP_AK", "")
     
+    # 上游HTTP连接池配置
+    HTTP_POOL_LIMIT: int = 100  # 连接总数上限
+    HTTP_POOL_LIMIT_PER_HOST: int = 20  # 单个主机连接数上限
+    HTTP_DNS_CACHE_TTL: int = 300  # DNS缓存时间（秒）
+    HTTP_KEEPALIVE_TIMEOUT: float = 30  # 空闲连接保持时间（秒）
+    HTTP_TIMEOUT: float = 10  # 请求总超时（秒）
+    HTTP_CONNECT_TIMEOUT: float = 3  # 建立连接超时（秒）
+    
+    # Overpass瓦片缓存配置
+    OVERPASS_TILE_ZOOM: int = 15  # 瓦片缩放级别，15级瓦片边长约1公里
+    OVERPASS_TILE_TTL: float = 6 * 3600  # 瓦片缓存有效期（秒）
+    OVERPASS_BATCH_WINDOW: float = 0.05  # 合并查询的等待窗口（秒）
+    OVERPASS_CACHE_TILES: int = 5000  # 最多缓存的瓦片数
+    OVERPASS_MAX_QUERY_TILES: int = 1024  # 单次查询最多覆盖的瓦片数
+    NEARBY_MAX_RADIUS: int = 5000  # 周边站点查询的最大半径（米）
+    
+    # Nominatim限流配置
+    NOMINATIM_RATE_LIMIT: float = 1.0  # 每秒请求数
+    NOMINATIM_BURST: int = 1  # 允许的突发请求数
+    NOMINATIM_MAX_WAIT: float = 10.0  # 最长排队时间（秒），超过则直接返回错误
+    
+    # 地理编码缓存配置
+    GEOCODE_CACHE_SIZE: int = 10000  # 内存中最多缓存的地址数
+    GEOCODE_CACHE_TTL: float = 30 * 24 * 3600  # 缓存有效期（秒）
+    
+    # 距离矩阵配置
+    MATRIX_MAX_CELLS: int = 20000  # 单次请求最多的起终点组合数
+    
+    # 碳排放批量计算配置
+    CARBON_BATCH_MAX_ROUTES: int = 10000  # 单次请求最多的路线数
+    
+    # 等时圈配置
+    ISOCHRONE_CELL_SIZE: float = 200.0  # 默认网格单元边长（米）
+    ISOCHRONE_MAX_MINUTES: int = 90  # 最大时间段（分钟）
+    
+    # 路线结果缓存配置
+    ROUTE_CACHE_SIZE: int = 5000  # 最多缓存的起终点组合数
+    ROUTE_CACHE_PRECISION: int = 7  # geohash位数，7位约150米见方
+    ROUTE_CACHE_FRESH_TTL: float = 600  # 在此时间内直接使用缓存（秒）
+    ROUTE_CACHE_STALE_TTL: float = 3600  # 超过新鲜期但未超过此时间时返回旧结果并后台刷新（秒）
+    
+    # 路线规划各依赖的截止时间（秒），超时的部分被跳过
+    ROUTE_TRANSIT_TIMEOUT: float = 2.0
+    ROUTE_STREET_TIMEOUT: float = 3.0
+    ROUTE_NEARBY_TIMEOUT: float = 0.8
+    ROUTE_TRAFFIC_TIMEOUT: float = 1.0
+    
+    # 本地路网配置
+    ROUTING_GRAPH_PATH: str = os.getenv("ROUTING_GRAPH_PATH", "./data/routing_graph.npz")
+    CH_DATA_DIR: str = os.getenv("CH_DATA_DIR", "./data/ch")  # 收缩层次文件目录
+    GTFS_PATH: str = os.getenv("GTFS_PATH", "./data/timetable.npz")  # GTFS zip/目录或打包后的npz
+    TRANSIT_ACCESS_RADIUS: float = 800  # 公交接驳最大步行距离（米）
+    OSM_ROUTE_MODE: str = os.getenv("OSM_ROUTE_MODE", "auto")  # auto: 优先本地收缩层次; local: 仅本地; osrm: 仅OSRM
+    
+    # 站点空间索引配置
+    POI_SNAPSHOT_PATH: str = os.getenv("POI_SNAPSHOT_PATH", "./data/poi_snapshot.json")  # Overpass导出的站点快照
+    POI_INDEX_CELL_SIZE: float = 250  # 网格边长（米）
+    POI_SNAPSHOT_CHECK_INTERVAL: float = 300  # 快照文件更新检查间隔（秒），0表示不检查
+    
+    # 数据库坐标网格配置
+    SPATIAL_CELL_DEGREES: float = 0.01  # 网格单元的经纬度间隔（约1公里），修改后需重新回填grid_cell列
+    SPATIAL_MAX_CELL_ROWS: int = 64  # 范围查询跨越的网格行数超过此值时只按坐标列过滤
+    SPATIAL_QUERY_LIMIT: int = 5000  # 单次范围查询最多返回的记录数
+    SPATIAL_BACKFILL_BATCH: int = 5000  # 回填旧数据时每批处理的记录数
+    
+    # 批量导入配置
+    BULK_LOAD_BATCH: int = 5000  # 每个事务写入的记录数，断点随该事务一起提交
+    BULK_LOAD_DIR: str = os.getenv("BULK_LOAD_DIR", "./data/imports")  # 接口上传文件的保存目录
+    BULK_LOAD_MAX_ERRORS: int = 20  # 导入结果中保留的无效记录错误条数
+    
+    # 交通数据采集配置
+    TRAFFIC_BUFFER_SIZE: int = 12  # 每个路段在内存中保留的最新读数条数
+    TRAFFIC_READING_TTL: float = 900  # 读数有效期（秒），过期读数不参与路况判断
+    TRAFFIC_WRITE_BATCH: int = 1000  # 每个数据库事务写入的读数条数
+    TRAFFIC_BATCH_MAX: int = 50000  # 单次上报最多的读数条数
+    TRAFFIC_CORRIDOR_WIDTH: float = 500  # 路况查询时起终点连线两侧的路段范围（米）
+    CONGESTION_PROFILE_CELL_SIZE: float = 1000  # 拥堵画像的网格边长（米）
+    CONGESTION_PROFILE_MIN_SAMPLES: int = 5  # 网格样本数不足时改用全城画像
+    CONGESTION_PROFILE_PRIOR_SAMPLES: int = 10  # 置信度为n/(n+该值)
+    
+    # 天气缓存配置
+    WEATHER_CELL_SIZE: float = 5000  # 天气网格边长（米），同一单元共用一次查询结果
+    WEATHER_CACHE_TTL: float = 600  # 有效期（秒）
+    WEATHER_STALE_TTL: float = 3600  # 超过有效期但未超过此时间的结果仍可返回，同时后台刷新（秒）
+    WEATHER_CACHE_CELLS: int = 5000  # 最多缓存的单元数
+    WEATHER_REFRESH_INTERVAL: float = 60  # 后台刷新检查间隔（秒），0表示不刷新
+    WEATHER_REFRESH_AHEAD: float = 0.8  # 存在时间达到有效期的该比例时提前刷新
+    WEATHER_HOT_WINDOW: float = 1800  # 在此时间内被访问过的单元才会被后台刷新（秒）
+    WEATHER_PREFETCH_BBOX: str = os.getenv("WEATHER_PREFETCH_BBOX", "")  # 启动时预取的范围"南,西,北,东"
+    WEATHER_PREFETCH_MAX_CELLS: int = 2000  # 单次预取最多的单元数
+    WEATHER_PREFETCH_CONCURRENCY: int = 8  # 预取和刷新的并发查询数
+    WEATHER_RATE_LIMIT: float = 1.0  # OpenWeatherMap每秒请求数（免费版每分钟60次）
+    WEATHER_BURST: int = 10
+    
     class Config:
         env_file = ".env"
 
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, Request, HTTPException
+from fastapi import FastAPI, Depends, Request, HTTPException, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -6,24 +6,50 @@ from fastapi.responses import HTMLResponse, FileResponse
 from sqlalchemy.orm import Session
 import uvicorn
 from src.api import routes, users
-from src.models.database import create_tables
-from src.utils.auth import get_db
+from src.models.database import create_tables, engine, User
 from src.config.settings import settings
 from src.utils.osm_service import osm_service
 from src.utils.route_planner import route_planner
 from src.utils.weather_service import weather_service
 from src.utils.traffic_service import traffic_service
+from src.utils.traffic_store import traffic_store
+from src.utils.congestion_profile import congestion_profile
+from src.utils.db_executor import db_executor
+from src.utils.bulk_loader import bulk_loader, BULK_DATASETS, BULK_FORMATS, upload_path, find_upload
+from src.utils.spatial_query import SPATIAL_DATASETS, backfill_coordinates, query_bbox, query_radius, to_dict
 from src.utils.route_service import route_service
-from src.models.schemas import Location, RouteRequest
+from src.utils.routing_engine import routing_engine
+from src.utils.raptor import transit_router
+from src.utils.spatial_index import poi_index
+from src.utils.http_client import http_client
+from src.utils.geocode_cache import geocode_cache
+from src.utils.route_cache import route_cache
+from src.utils.rate_limiter import rate_limiter
+from src.utils.overpass_cache import overpass_cache
+from src.utils.matrix import matrix_service, MATRIX_MODES
+from src.utils.carbon import carbon_engine
+from src.utils.isochrone import isochrone_service, ISOCHRONE_MODES, ISOCHRONE_FORMATS
+from src.utils.geometry import GEOMETRY_FORMATS, MAX_ZOOM
+from src.utils.serialization import FastResponse, FastResponseRoute
+from src.models.schemas import Location, RouteRequest, MatrixRequest, CarbonBatchRequest, TrafficReadingBatch
 from src.api.auth import router as auth_router
+from src.utils.auth import get_current_admin_user
 import os
+import asyncio
+import uuid
+import aiofiles
 from pathlib import Path
+from datetime import datetime
+from typing import Optional
 
 app = FastAPI(
     title="城市绿色出行优化系统",
     description="AI赋能的城市绿色出行优化系统API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastResponse
 )
+# 直接定义在app上的接口使用orjson/MessagePack序列化
+app.router.route_class = FastResponseRoute
 
 # 配置CORS
 app.add_middleware(
@@ -69,6 +95,41 @@ async def startup_event():
     """启动时执行的事件"""
     # 创建数据库表
     create_tables()
+    # 旧数据的位置字符串迁移到坐标列
+    backfill_coordinates()
+    # 加载拥堵画像和有效期内的交通读数
+    congestion_profile.load()
+    traffic_store.warm()
+    # 创建上游服务共享连接池
+    await http_client.start()
+    # 预加载本地路网图
+    if os.path.exists(settings.ROUTING_GRAPH_PATH):
+        routing_engine.load()
+    # 预加载公交时刻表
+    if os.path.exists(settings.GTFS_PATH):
+        transit_router.load()
+    # 预加载步行/骑行收缩层次
+    osm_service.load_hierarchies()
+    # 加载站点空间索引，并定期检查快照更新
+    if os.path.exists(settings.POI_SNAPSHOT_PATH):
+        poi_index.load()
+    if settings.POI_SNAPSHOT_CHECK_INTERVAL > 0:
+        asyncio.create_task(poi_index.watch(settings.POI_SNAPSHOT_CHECK_INTERVAL))
+    # 预取城市范围的天气，并定期在后台刷新热点单元
+    if settings.WEATHER_PREFETCH_BBOX:
+        south, west, north, east = map(float, settings.WEATHER_PREFETCH_BBOX.split(","))
+        asyncio.create_task(weather_service.prefetch(south, west, north, east))
+    if settings.WEATHER_REFRESH_INTERVAL > 0:
+        asyncio.create_task(weather_service.watch(settings.WEATHER_REFRESH_INTERVAL))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭时执行的事件"""
+    await http_client.close()
+    # 批量导入在当前批次提交后停止，之后可从断点续传
+    bulk_loader.shutdown()
+    db_executor.shutdown()
+    engine.dispose()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -96,6 +157,22 @@ async def geocode(address: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/metrics")
+async def get_metrics():
+    """缓存命中率等运行指标"""
+    return {
+        "status": "1",
+        "geocode_cache": geocode_cache.get_stats(),
+        "route_cache": route_cache.get_stats(),
+        "rate_limits": rate_limiter.get_stats(),
+        "overpass_cache": overpass_cache.get_stats(),
+        "traffic_store": traffic_store.get_stats(),
+        "congestion_profile": congestion_profile.get_stats(),
+        "weather_cache": weather_service.get_stats(),
+        "db_executor": db_executor.get_stats(),
+        "bulk_loader": bulk_loader.get_stats()
+    }
+
 @app.get("/api/v1/weather")
 async def get_weather_info(lat: float, lon: float):
     """获取指定位置的天气信息"""
@@ -108,13 +185,30 @@ async def get_weather_info(lat: float, lon: float):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/weather/prefetch")
+async def prefetch_weather(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    admin: User = Depends(get_current_admin_user)
+):
+    """预取范围内所有网格单元的天气，此后这些单元在后台保持刷新"""
+    if south > north or west > east:
+        raise HTTPException(status_code=400, detail="范围格式错误")
+    result = await weather_service.prefetch(south, west, north, east)
+    if result["status"] == "0":
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
 @app.get("/api/v1/route")
 async def get_route(
     origin: str,
     destination: str,
     consider_weather: bool = True,
     max_walking_distance: int = 2000,
-    preferred_modes: str = "walking,bus,subway"
+    preferred_modes: str = "walking,bus,subway",
+    departure_time: Optional[datetime] = None
 ):
     """综合路线规划服务"""
     try:
@@ -122,35 +216,36 @@ async def get_route(
         origin_lat, origin_lon = map(float, origin.split(","))
         dest_lat, dest_lon = map(float, destination.split(","))
         
-        # 获取天气信息
-        if consider_weather:
-            weather_info = await weather_service.get_weather(origin_lat, origin_lon)
-            if weather_info["status"] == "0":
-                raise HTTPException(status_code=500, detail="无法获取天气信息")
-            
-            # 如果天气不适合户外活动，返回提示
-            if not weather_info["weather"]["is_suitable_for_outdoor"]:
-                return {
-                    "status": "0",
-                    "warning": "当前天气不适合户外活动",
-                    "weather": weather_info["weather"]
-                }
-        
         # 设置路线偏好
         preferences = {
             "max_walking_distance": max_walking_distance,
             "preferred_modes": preferred_modes.split(",")
         }
         
-        # 计算路线
+        # 天气只读网格缓存，未缓存时后台获取并跳过天气判断，不等待上游
+        skipped = []
+        weather_info = weather_service.peek_weather(origin_lat, origin_lon) if consider_weather else None
         route_result = await route_planner.calculate_multi_modal_route(
             origin_lat,
             origin_lon,
             dest_lat,
             dest_lon,
-            preferences
+            preferences,
+            departure_time
         )
         
+        if weather_info is not None:
+            if weather_info["status"] == "0":
+                skipped.append("weather")
+            # 如果天气不适合户外活动，返回提示
+            elif not weather_info["weather"].get("is_suitable_for_outdoor", True):
+                return {
+                    "status": "0",
+                    "warning": "当前天气不适合户外活动",
+                    "weather": weather_info["weather"]
+                }
+        route_result["skipped"] = skipped + route_result.get("skipped", [])
+        
         if route_result["status"] == "1":
             return route_result
         else:
@@ -159,21 +254,115 @@ async def get_route(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/matrix")
+async def get_matrix(matrix_request: MatrixRequest):
+    """多起点多终点的距离、耗时和碳排放矩阵"""
+    if not matrix_request.origins or not matrix_request.destinations:
+        raise HTTPException(status_code=400, detail="起点和终点不能为空")
+    if len(matrix_request.origins) * len(matrix_request.destinations) > settings.MATRIX_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"起终点组合数超过上限{settings.MATRIX_MAX_CELLS}")
+    unknown = [m for m in matrix_request.modes if m not in MATRIX_MODES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的出行方式: {','.join(unknown)}")
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            matrix_service.compute,
+            [(o.latitude, o.longitude) for o in matrix_request.origins],
+            [(d.latitude, d.longitude) for d in matrix_request.destinations],
+            matrix_request.modes,
+            matrix_request.departure_time
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/v1/isochrone")
+async def get_isochrone(
+    lat: float,
+    lon: float,
+    bands: str = "15,30,45",
+    modes: str = "walking,cycling,transit",
+    departure_time: Optional[datetime] = None,
+    cell_size: Optional[float] = None,
+    format: str = "cells"
+):
+    """等时圈：各时间段（分钟）内步行、骑行、公交可到达的网格单元"""
+    try:
+        minutes = sorted({int(b) for b in bands.split(",") if b.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="时间段格式错误，应为逗号分隔的分钟数")
+    if not minutes or minutes[0] <= 0 or minutes[-1] > settings.ISOCHRONE_MAX_MINUTES:
+        raise HTTPException(status_code=400, detail=f"时间段应在1到{settings.ISOCHRONE_MAX_MINUTES}分钟之间")
+    mode_list = [m for m in modes.split(",") if m]
+    unknown = [m for m in mode_list if m not in ISOCHRONE_MODES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的出行方式: {','.join(unknown)}")
+    if format not in ISOCHRONE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+    if cell_size is not None and cell_size < 50:
+        raise HTTPException(status_code=400, detail="网格单元边长不能小于50米")
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None, isochrone_service.compute, lat, lon, minutes, mode_list, departure_time, cell_size, format
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if result["status"] == "0":
+        raise HTTPException(status_code=503, detail=result["error"])
+    return result
+
+@app.post("/api/v1/carbon/batch")
+async def score_carbon(carbon_request: CarbonBatchRequest):
+    """批量计算路线的碳排放及相对私家车的节省量（千克CO2）"""
+    if len(carbon_request.routes) > settings.CARBON_BATCH_MAX_ROUTES:
+        raise HTTPException(status_code=400, detail=f"路线数超过上限{settings.CARBON_BATCH_MAX_ROUTES}")
+    return carbon_engine.score_routes([
+        [{"mode": s.mode, "distance": s.distance} for s in route.segments]
+        for route in carbon_request.routes
+    ])
+
 @app.get("/api/v1/transit/nearby")
-async def get_nearby_transit(lat: float, lon: float, radius: int = 1000):
+async def get_nearby_transit(
+    lat: float,
+    lon: float,
+    radius: int = Query(1000, gt=0, le=settings.NEARBY_MAX_RADIUS),
+    limit: Optional[int] = Query(None, ge=1)
+):
     """获取周边公交和地铁站"""
     try:
-        result = await route_planner.get_transit_stops(lat, lon, radius)
+        result = await route_planner.get_transit_stops(lat, lon, radius, limit)
         return {"status": "1", "stops": result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/bikes/nearby")
-async def get_nearby_bikes(lat: float, lon: float, radius: int = 1000):
+async def get_nearby_bikes(
+    lat: float,
+    lon: float,
+    radius: int = Query(1000, gt=0, le=settings.NEARBY_MAX_RADIUS),
+    limit: Optional[int] = Query(None, ge=1)
+):
     """获取周边共享单车站点"""
     try:
-        result = await route_planner.get_bike_stations(lat, lon, radius)
+        result = await route_planner.get_bike_stations(lat, lon, radius, limit)
         return {"status": "1", "stations": result}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/stations/refresh")
+async def refresh_stations():
+    """重新导入站点快照并替换内存索引，无需重启服务"""
+    try:
+        counts = await poi_index.refresh()
+        return {"status": "1", "counts": counts}
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="站点快照文件不存在")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -189,15 +378,100 @@ async def get_traffic_info():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/traffic/readings")
+async def ingest_traffic_readings(batch: TrafficReadingBatch, admin: User = Depends(get_current_admin_user)):
+    """批量上报路段交通读数，分批写入数据库后更新内存中的路况；仅限管理员（ADMIN_USERNAMES）"""
+    if len(batch.readings) > settings.TRAFFIC_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"读数条数超过上限{settings.TRAFFIC_BATCH_MAX}")
+    result = await traffic_store.ingest([reading.dict() for reading in batch.readings])
+    return {"status": "1", **result}
+
+@app.get("/api/v1/traffic/segments/{segment_id}")
+async def get_traffic_segment(segment_id: str):
+    """路段最近的交通读数"""
+    readings = traffic_store.history(segment_id)
+    if not readings:
+        raise HTTPException(status_code=404, detail="路段没有交通读数")
+    return {"status": "1", "segment_id": segment_id, "readings": readings}
+
+@app.post("/api/v1/bulk/{dataset}")
+async def bulk_load(dataset: str, file: UploadFile = File(...), admin: User = Depends(get_current_admin_user)):
+    """上传CSV/Parquet/JSON文件批量导入出行历史（travel_history）、交通读数（traffic）或天气（weather），在后台执行；仅限管理员（ADMIN_USERNAMES）"""
+    if dataset not in BULK_DATASETS:
+        raise HTTPException(status_code=404, detail=f"不支持的数据集: {dataset}")
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    if suffix not in BULK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的文件格式，应为{'/'.join(BULK_FORMATS)}")
+    job_id = uuid.uuid4().hex
+    path = upload_path(dataset, job_id, suffix)
+    os.makedirs(settings.BULK_LOAD_DIR, exist_ok=True)
+    async with aiofiles.open(path, "wb") as f:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            await f.write(chunk)
+    return {"status": "1", "job": bulk_loader.start(dataset, path, job_id)}
+
+@app.get("/api/v1/bulk/jobs/{job_id}")
+async def get_bulk_job(job_id: str, admin: User = Depends(get_current_admin_user)):
+    """导入任务的状态和进度（已处理、写入、无效记录数及每秒写入条数）"""
+    job = bulk_loader.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return {"status": "1", "job": job}
+
+@app.post("/api/v1/bulk/jobs/{job_id}/resume")
+async def resume_bulk_job(job_id: str, admin: User = Depends(get_current_admin_user)):
+    """失败或服务重启后从断点继续导入（上传的文件在导入完成前保留）"""
+    found = find_upload(job_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="导入文件不存在或已导入完成")
+    dataset, path = found
+    return {"status": "1", "job": bulk_loader.start(dataset, path, job_id)}
+
+@app.get("/api/v1/spatial/{dataset}")
+async def query_spatial(
+    dataset: str,
+    bbox: Optional[str] = None,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    radius: Optional[float] = None,
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """按范围（bbox="南,西,北,东"）或半径（lat、lon、radius米）查询交通、天气、交通服务记录"""
+    model = SPATIAL_DATASETS.get(dataset)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"不支持的数据集: {dataset}")
+    if bbox is not None:
+        try:
+            south, west, north, east = map(float, bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox格式错误，应为\"南,西,北,东\"")
+        rows = await db_executor.run(query_bbox, model, south, west, north, east, limit)
+        return {"status": "1", "count": len(rows), "records": [to_dict(row) for row in rows]}
+    if lat is None or lon is None or radius is None:
+        raise HTTPException(status_code=400, detail="需要bbox或lat、lon、radius参数")
+    found = await db_executor.run(query_radius, model, lat, lon, radius, limit)
+    return {
+        "status": "1",
+        "count": len(found),
+        "records": [{**to_dict(row), "distance": round(distance, 1)} for distance, row in found]
+    }
+
 @app.post("/api/v1/route")
-async def plan_route(route_request: RouteRequest):
-    """规划路线"""
+async def plan_route(route_request: RouteRequest, zoom: Optional[int] = Query(None, ge=0, le=MAX_ZOOM), geometry_format: str = "list"):
+    """规划路线，zoom为地图缩放级别（用于简化几何），geometry_format为list/array/encoded"""
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的几何格式: {geometry_format}")
     result = await route_service.plan_route(
         route_request.start_location,
-        route_request.end_location
+        route_request.end_location,
+        zoom,
+        geometry_format
     )
-    if result["status"] == "0":
-        raise HTTPException(status_code=500, detail=result["error"])
+    if result["status"] == "error":
+        raise HTTPException(status_code=500, detail=result["message"])
     return result
 
 if __name__ == "__main__":
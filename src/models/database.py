@@ -1,13 +1,53 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool, StaticPool
 from datetime import datetime
 import os
 from ..config.settings import settings
+from ..utils.geo import parse_location, grid_cell
 
-# 创建数据库引擎
-SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+def create_db_engine(url: str = None):
+    """按配置创建数据库引擎：显式的连接池大小与pre-ping，SQLite连接额外设置WAL等参数"""
+    url = url or settings.DATABASE_URL
+    if not url.startswith("sqlite"):
+        # PostgreSQL等服务端数据库
+        return create_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    connect_args = {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT}
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        # 内存数据库只能共用一个连接
+        return create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    sqlite_engine = create_engine(
+        url,
+        connect_args=connect_args,
+        poolclass=QueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=True
+    )
+    event.listen(sqlite_engine, "connect", _set_sqlite_pragmas)
+    return sqlite_engine
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL模式下读写互不阻塞，synchronous=NORMAL在WAL下仍能保证一致性"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+# 创建数据库引擎（全局唯一）
+engine = create_db_engine()
 
 # 创建SessionLocal类
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -43,11 +83,22 @@ class UserPreference(Base):
 
 class TravelHistory(Base):
     __tablename__ = "travel_history"
+    __table_args__ = (
+        # 出行历史按(user_id, created_at, id)游标分页；按出行方式筛选时使用第二个索引
+        Index("ix_travel_history_user_created", "user_id", "created_at", "id"),
+        Index("ix_travel_history_user_mode_created", "user_id", "transport_mode", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     start_location = Column(String)  # JSON字符串存储
     end_location = Column(String)  # JSON字符串存储
+    start_latitude = Column(Float)
+    start_longitude = Column(Float)
+    start_cell = Column(Integer, index=True)  # 起点所在网格单元，见spatial_query
+    end_latitude = Column(Float)
+    end_longitude = Column(Float)
+    end_cell = Column(Integer, index=True)
     transport_mode = Column(String)
     distance = Column(Float)
     duration = Column(Integer)  # 分钟
@@ -61,18 +112,38 @@ class TrafficData(Base):
     __tablename__ = "traffic_data"
 
     id = Column(Integer, primary_key=True, index=True)
+    segment_id = Column(String, index=True)  # 路段编号
     location = Column(String)  # JSON字符串存储
+    latitude = Column(Float)
+    longitude = Column(Float)
+    grid_cell = Column(Integer, index=True)  # 所在网格单元，见spatial_query
     timestamp = Column(DateTime, default=datetime.now)
     congestion_level = Column(Float)
     average_speed = Column(Float)
     incident_type = Column(String, nullable=True)
     data_source = Column(String)
 
+class CongestionProfileEntry(Base):
+    __tablename__ = "congestion_profiles"
+    __table_args__ = (UniqueConstraint("cell", "weekday", "hour"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    cell = Column(String)  # 网格单元"行:列"，all表示全城
+    weekday = Column(Integer)  # 0为周一
+    hour = Column(Integer)
+    count = Column(Integer)
+    mean = Column(Float)  # 拥堵系数均值
+    m2 = Column(Float)  # 与均值之差的平方和（Welford算法）
+    updated_at = Column(DateTime, default=datetime.now)
+
 class WeatherData(Base):
     __tablename__ = "weather_data"
 
     id = Column(Integer, primary_key=True, index=True)
     location = Column(String)  # JSON字符串存储
+    latitude = Column(Float)
+    longitude = Column(Float)
+    grid_cell = Column(Integer, index=True)  # 所在网格单元，见spatial_query
     timestamp = Column(DateTime, default=datetime.now)
     temperature = Column(Float)
     humidity = Column(Float)
@@ -86,6 +157,9 @@ class TransportationService(Base):
     id = Column(Integer, primary_key=True, index=True)
     service_type = Column(String)  # bus, subway, shared_bike
     location = Column(String)  # JSON字符串存储
+    latitude = Column(Float)
+    longitude = Column(Float)
+    grid_cell = Column(Integer, index=True)  # 所在网格单元，见spatial_query
     status = Column(String)
     capacity = Column(String)
     next_arrival = Column(String, nullable=True)
@@ -107,16 +181,87 @@ class RouteHistory(Base):
     # 关联到用户
     user = relationship("User", back_populates="route_history")
 
+class GeocodeCacheEntry(Base):
+    __tablename__ = "geocode_cache"
+    __table_args__ = (UniqueConstraint("provider", "address_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String)  # osm, baidu, amap
+    address_key = Column(String)  # 归一化后的地址
+    result = Column(Text)  # JSON字符串存储
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BulkLoadCheckpoint(Base):
+    __tablename__ = "bulk_load_checkpoints"
+    __table_args__ = (UniqueConstraint("source", "dataset"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String)  # 导入文件的绝对路径
+    dataset = Column(String)  # travel_history, traffic, weather
+    file_size = Column(Integer)  # 用于发现断点续传时文件已被替换
+    records = Column(Integer, default=0)  # 已处理的输入记录数（含无效记录），续传时跳过
+    written = Column(Integer, default=0)
+    rejected = Column(Integer, default=0)
+    completed = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.now)
+
+# 含坐标的表：(位置字符串列, 纬度列, 经度列, 网格单元列)
+SPATIAL_COLUMNS = {
+    TravelHistory: [
+        ("start_location", "start_latitude", "start_longitude", "start_cell"),
+        ("end_location", "end_latitude", "end_longitude", "end_cell")
+    ],
+    TrafficData: [("location", "latitude", "longitude", "grid_cell")],
+    WeatherData: [("location", "latitude", "longitude", "grid_cell")],
+    TransportationService: [("location", "latitude", "longitude", "grid_cell")]
+}
+
+def _fill_coordinates(mapper, connection, target):
+    """ORM写入时由位置字符串补全坐标列和网格单元列；位置字符串被修改而坐标未被修改时重新解析"""
+    state = inspect(target)
+    for location_attr, lat_attr, lon_attr, cell_attr in SPATIAL_COLUMNS[type(target)]:
+        location_changed = state.attrs[location_attr].history.has_changes()
+        if getattr(target, lat_attr) is None or (location_changed and not state.attrs[lat_attr].history.has_changes()):
+            point = parse_location(getattr(target, location_attr))
+            if point is None:
+                continue
+            setattr(target, lat_attr, point[0])
+            setattr(target, lon_attr, point[1])
+        if getattr(target, lat_attr) is not None:
+            setattr(target, cell_attr, grid_cell(getattr(target, lat_attr), getattr(target, lon_attr), settings.SPATIAL_CELL_DEGREES))
+
+for _model in SPATIAL_COLUMNS:
+    event.listen(_model, "before_insert", _fill_coordinates)
+    event.listen(_model, "before_update", _fill_coordinates)
+
 # 创建数据库表
 def create_tables():
     """创建所有数据库表"""
     try:
         Base.metadata.create_all(bind=engine)
+        add_missing_columns()
         print("数据库表创建成功")
     except Exception as e:
         print(f"创建数据库表时出错: {str(e)}")
         raise
 
+def add_missing_columns():
+    """create_all不会修改已有的表：为旧数据库补充模型中新增的列及其索引"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        if missing:
+            with engine.begin() as conn:
+                for column in missing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"已为表{table.name}添加列{column.name}")
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 # 数据库依赖项
 def get_db():
     db = SessionLocal()
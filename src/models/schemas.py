@@ -9,6 +9,7 @@ class TransportMode(str, Enum):
     BUS = "bus"
     SUBWAY = "subway"
     SHARED_BIKE = "shared_bike"
+    CAR = "car"
 
 class Location(BaseModel):
     latitude: float
@@ -24,6 +25,60 @@ class RouteRequest(BaseModel):
         "consider_traffic": True
     }
 
+class MatrixRequest(BaseModel):
+    origins: List[Location]
+    destinations: List[Location]
+    modes: List[str] = ["walking", "cycling", "transit"]
+    departure_time: Optional[datetime] = None  # 公交矩阵的出发时间，默认当前时间
+
+class CarbonSegment(BaseModel):
+    mode: TransportMode
+    distance: float  # 公里
+
+class CarbonRoute(BaseModel):
+    segments: List[CarbonSegment]
+
+class CarbonBatchRequest(BaseModel):
+    routes: List[CarbonRoute]
+
+class TrafficReading(BaseModel):
+    segment_id: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    congestion_level: float  # 拥堵系数，1.0为畅通
+    average_speed: float  # 公里/小时
+    timestamp: Optional[datetime] = None  # 默认为接收时间
+    incident_type: Optional[str] = None
+    data_source: str = "api"
+
+class TrafficReadingBatch(BaseModel):
+    readings: List[TrafficReading]
+
+class TravelHistoryRecord(BaseModel):
+    """批量导入的一条出行历史"""
+    user_id: int
+    start_location: str  # "纬度,经度"或JSON
+    end_location: str
+    transport_mode: TransportMode
+    distance: float  # 公里
+    duration: int  # 分钟
+    carbon_emission: float = 0.0  # 千克CO2
+    weather_condition: Optional[str] = None
+    traffic_condition: Optional[str] = None
+    created_at: Optional[datetime] = None  # 默认为导入时间
+
+class WeatherRecord(BaseModel):
+    """批量导入的一条天气观测，位置为location字符串或经纬度"""
+    location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    timestamp: Optional[datetime] = None  # 默认为导入时间
+    temperature: float
+    humidity: Optional[float] = None
+    wind_speed: Optional[float] = None
+    condition: Optional[str] = None
+    is_raining: Optional[bool] = None
+
 class RouteSegment(BaseModel):
     mode: TransportMode
     distance: float  # 公里
@@ -103,4 +158,8 @@ class TravelHistoryResponse(BaseModel):
     created_at: datetime
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+class TravelHistoryPage(BaseModel):
+    items: List[TravelHistoryResponse]
+    next_cursor: Optional[str] = None  # 为空表示没有更多记录
@@ -4,7 +4,9 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
-from ..models.database import TravelHistory, TrafficData, WeatherData
+from ..models.database import TravelHistory, WeatherData
+from .carbon import carbon_engine
+from .congestion_profile import congestion_profile
 from sqlalchemy.orm import Session
 
 class TravelAnalytics:
@@ -56,34 +58,26 @@ class TravelAnalytics:
         time: datetime
     ) -> float:
         """预测交通拥堵程度"""
-        # 获取历史交通数据
-        historical_data = pd.DataFrame([
-            {
-                "hour": d.timestamp.hour,
-                "day_of_week": d.timestamp.weekday(),
-                "congestion_level": d.congestion_level
-            }
-            for d in self.db.query(TrafficData).filter(
-                TrafficData.timestamp >= time - timedelta(days=30)
-            ).all()
-        ])
-        
-        if historical_data.empty:
-            return 0.5  # 默认中等拥堵程度
-            
-        # 简单时间序列预测
-        target_hour = time.hour
-        target_day = time.weekday()
-        
-        similar_conditions = historical_data[
-            (historical_data["hour"] == target_hour) &
-            (historical_data["day_of_week"] == target_day)
-        ]
-        
-        if similar_conditions.empty:
-            return 0.5
-            
-        return similar_conditions["congestion_level"].mean()
+        return self.predict_traffic_profile(location, time)["congestion_level"]
+
+    def predict_traffic_profile(
+        self,
+        location: Dict[str, float],
+        time: datetime
+    ) -> Dict[str, Any]:
+        """预测交通拥堵程度及其标准差、置信度和样本数：查询增量维护的拥堵画像，不再扫描历史数据"""
+        lat = location.get("lat", location.get("latitude"))
+        lon = location.get("lon", location.get("longitude"))
+        profile = congestion_profile.predict(lat, lon, time)
+        if profile is None:
+            return {"congestion_level": 0.5, "confidence": 0.0, "samples": 0}  # 默认中等拥堵程度
+        return {
+            "congestion_level": profile["congestion_factor"],
+            "std": profile["std"],
+            "confidence": profile["confidence"],
+            "samples": profile["samples"],
+            "scope": profile["scope"]
+        }
         
     def cluster_users_by_behavior(self, n_clusters: int = 3) -> Dict[str, List[int]]:
         """根据用户行为进行聚类"""
@@ -152,9 +146,6 @@ class TravelAnalytics:
     def _calculate_carbon_savings(self, history: List[TravelHistory]) -> float:
         """计算碳排放节省量"""
         # 假设所有行程都使用私家车的基准碳排放
-        car_emission_factor = 0.2  # kg CO2/km
-        
-        actual_emissions = sum(h.carbon_emission for h in history)
-        baseline_emissions = sum(h.distance * car_emission_factor for h in history)
-        
-        return baseline_emissions - actual_emissions 
\ No newline at end of file
+        distances = np.fromiter((h.distance or 0.0 for h in history), dtype=np.float64, count=len(history))
+        emissions = np.fromiter((h.carbon_emission or 0.0 for h in history), dtype=np.float64, count=len(history))
+        return float(carbon_engine.savings(distances, emissions).sum()) 
\ No newline at end of file
@@ -4,23 +4,10 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy import create_engine
-from ..models.database import User, get_db
+from sqlalchemy.orm import Session, raiseload, selectinload
 from ..config.settings import settings
-
-# 创建数据库引擎和会话
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# 数据库会话依赖
-def get_db():
-    """获取数据库会话"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from ..models.database import User
+from .db_executor import db_executor
 
 # 配置密码加密
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -52,7 +39,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     """获取当前用户"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -67,7 +54,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    user = await db_executor.run(_load_current_user, username)
     if user is None:
         raise credentials_exception
     return user
@@ -78,13 +65,54 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="用户已被禁用")
     return current_user
 
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+    """获取当前管理员用户（用户名在ADMIN_USERNAMES中）"""
+    admins = {name.strip() for name in settings.ADMIN_USERNAMES.split(",") if name.strip()}
+    if current_user.username not in admins:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return current_user
+
+def get_user(db: Session, username: str) -> Optional[User]:
+    """按用户名查询用户"""
+    return db.query(User).filter(User.username == username).first()
+
+def _load_current_user(db: Session, username: str) -> Optional[User]:
+    """查询当前用户并预先加载偏好设置；返回时会话已关闭，出行和路线历史数据量大，需按用户ID另行查询"""
+    return db.query(User).options(
+        selectinload(User.preferences),
+        raiseload(User.travel_history),
+        raiseload(User.route_history)
+    ).filter(User.username == username).first()
+
+def create_user(db: Session, username: str, email: str, hashed_password: str) -> User:
+    """创建用户，用户名或邮箱已被注册时抛出400错误"""
+    if get_user(db, username):
+        raise HTTPException(
+            status_code=400,
+            detail="用户名已被注册"
+        )
+    if db.query(User).filter(User.email == email).first():
+        raise HTTPException(
+            status_code=400,
+            detail="邮箱已被注册"
+        )
+    db_user = User(
+        username=username,
+        email=email,
+        hashed_password=hashed_password
+    )
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
 def authenticate_user(
     db: Session,
     username: str,
     password: str
 ) -> Optional[User]:
     """用户认证"""
-    user = db.query(User).filter(User.username == username).first()
+    user = get_user(db, username)
     if not user:
         return None
     if not verify_password(password, user.hashed_password):
@@ -0,0 +1,332 @@
+"""
+批量导入：分块流式读取CSV/Parquet/JSON历史数据，用现有模型校验后按批次executemany写入（PostgreSQL使用COPY），
+断点与每批数据在同一事务中提交，失败后重新运行即从断点继续
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import select
+from ..config.settings import settings
+from ..models.database import engine, SPATIAL_COLUMNS, BulkLoadCheckpoint, TravelHistory, TrafficData, WeatherData
+from ..models.schemas import TravelHistoryRecord, TrafficReading, WeatherRecord
+from .congestion_profile import congestion_profile
+from .geo import parse_location, grid_cell
+from .traffic_store import traffic_store, local_time
+
+# 数据集 -> (模型, 校验用的schema)
+BULK_DATASETS = {
+    "travel_history": (TravelHistory, TravelHistoryRecord),
+    "traffic": (TrafficData, TrafficReading),
+    "weather": (WeatherData, WeatherRecord)
+}
+
+BULK_FORMATS = (".csv", ".parquet", ".json", ".jsonl")
+
+class BulkLoader:
+    """导入任务在单独的单线程池中依次执行：SQLite同时只有一个写入者，长时间导入也不占用db_executor"""
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or settings.BULK_LOAD_BATCH
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk")
+        self._stopping = threading.Event()
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"loads": 0, "failed": 0, "written": 0, "rejected": 0}
+
+    def load(self, dataset: str, path: str, restart: bool = False,
+             progress: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """导入文件，返回处理、写入、无效的记录数和写入速度；restart为True时忽略已有断点从头导入（已写入的记录不会删除）"""
+        if dataset not in BULK_DATASETS:
+            raise ValueError(f"不支持的数据集: {dataset}")
+        if not path.endswith(BULK_FORMATS):
+            raise ValueError(f"不支持的文件格式，应为{'/'.join(BULK_FORMATS)}")
+        model, schema = BULK_DATASETS[dataset]
+        source = os.path.abspath(path)
+        checkpoint = self._checkpoint(source, dataset, os.path.getsize(source), restart)
+        table = model.__table__
+        columns = [column.name for column in table.columns if column.name != "id"]
+        result = {
+            "dataset": dataset,
+            "source": source,
+            "resumed_from": checkpoint["records"],
+            "records": checkpoint["records"],
+            "written": checkpoint["written"],
+            "rejected": checkpoint["rejected"],
+            "errors": [],
+            "completed": checkpoint["completed"]
+        }
+        started = time.perf_counter()
+        new_rows = 0
+        if not checkpoint["completed"]:
+            records = islice(_read_records(source, self.batch_size), checkpoint["records"], None)
+            finished = False
+            while not self._stopping.is_set():
+                chunk = list(islice(records, self.batch_size))
+                if not chunk:
+                    finished = True
+                    break
+                rows = []
+                for offset, record in enumerate(chunk):
+                    try:
+                        rows.append(schema.parse_obj(record).dict())
+                    except ValidationError as e:
+                        result["rejected"] += 1
+                        if len(result["errors"]) < settings.BULK_LOAD_MAX_ERRORS:
+                            # 记录号从1开始，对应文件中的第几条数据
+                            result["errors"].append({"record": result["records"] + offset + 1, "error": str(e)})
+                rows = self._rows(dataset, rows)
+                with engine.begin() as conn:
+                    if rows:
+                        _insert(conn, table, columns, rows)
+                    result["records"] += len(chunk)
+                    result["written"] += len(rows)
+                    self._save_checkpoint(conn, checkpoint["id"], result, completed=False)
+                if dataset == "traffic":
+                    # 提交后才计入内存缓冲区和拥堵画像，失败重试时不会重复计数
+                    traffic_store.apply(rows)
+                    congestion_profile.flush()
+                new_rows += len(rows)
+                self.stats["written"] += len(rows)
+                if progress:
+                    progress(_with_rate(result, new_rows, started))
+            if finished:
+                with engine.begin() as conn:
+                    self._save_checkpoint(conn, checkpoint["id"], result, completed=True)
+                result["completed"] = True
+        self.stats["loads"] += 1
+        self.stats["rejected"] += result["rejected"] - checkpoint["rejected"]
+        return _with_rate(result, new_rows, started)
+
+    def _rows(self, dataset: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """校验后的记录转为数据库行：补全默认时间、坐标列和网格单元列（executemany不经过ORM事件）"""
+        if dataset == "traffic":
+            return traffic_store.rows(records)
+        now = datetime.now()
+        model = BULK_DATASETS[dataset][0]
+        for row in records:
+            if dataset == "travel_history":
+                row["transport_mode"] = row["transport_mode"].value
+                row["created_at"] = local_time(row["created_at"]) or now
+            else:
+                row["timestamp"] = local_time(row["timestamp"]) or now
+                if row["location"] is None and row["latitude"] is not None and row["longitude"] is not None:
+                    row["location"] = json.dumps({"lat": row["latitude"], "lon": row["longitude"]})
+            _fill_coordinates(model, row)
+        return records
+
+    def _checkpoint(self, source: str, dataset: str, file_size: int, restart: bool) -> Dict[str, Any]:
+        """读取或创建断点；文件大小与断点不一致时拒绝续传"""
+        table = BulkLoadCheckpoint.__table__
+        with engine.begin() as conn:
+            row = conn.execute(select(table).where(table.c.source == source, table.c.dataset == dataset)).mappings().first()
+            if row is not None and not restart and row["file_size"] != file_size:
+                raise ValueError("文件与断点记录不一致，请使用restart重新导入")
+            if row is None:
+                values = {"source": source, "dataset": dataset, "file_size": file_size, "records": 0, "written": 0,
+                          "rejected": 0, "completed": False, "updated_at": datetime.now()}
+                checkpoint_id = conn.execute(table.insert().values(**values)).inserted_primary_key[0]
+                return {"id": checkpoint_id, **values}
+            if restart:
+                conn.execute(table.update().where(table.c.id == row["id"]).values(
+                    file_size=file_size, records=0, written=0, rejected=0, completed=False, updated_at=datetime.now()
+                ))
+                return {**row, "file_size": file_size, "records": 0, "written": 0, "rejected": 0, "completed": False}
+            return dict(row)
+
+    def _save_checkpoint(self, conn, checkpoint_id: int, result: Dict[str, Any], completed: bool) -> None:
+        table = BulkLoadCheckpoint.__table__
+        conn.execute(table.update().where(table.c.id == checkpoint_id).values(
+            records=result["records"],
+            written=result["written"],
+            rejected=result["rejected"],
+            completed=completed,
+            updated_at=datetime.now()
+        ))
+
+    def start(self, dataset: str, path: str, job_id: str = None, restart: bool = False) -> Dict[str, Any]:
+        """在后台提交导入任务，进度可通过jobs查询；同一任务重复提交时从断点继续"""
+        job_id = job_id or uuid.uuid4().hex
+        job = self.jobs.get(job_id)
+        if job is not None and job["status"] in ("pending", "running"):
+            return job
+        job = self.jobs[job_id] = {"job_id": job_id, "dataset": dataset, "status": "pending", "progress": None, "error": None}
+
+        def update(progress: Dict[str, Any]) -> None:
+            job["progress"] = progress
+
+        def run() -> None:
+            job["status"] = "running"
+            try:
+                job["progress"] = self.load(dataset, path, restart=restart, progress=update)
+                if not job["progress"]["completed"]:
+                    # 服务关闭时在批次之间停止，断点已保存
+                    job["status"] = "stopped"
+                    return
+                job["status"] = "completed"
+                # 导入完成后删除上传的文件，失败或停止时保留以便续传
+                if os.path.dirname(os.path.abspath(path)) == os.path.abspath(settings.BULK_LOAD_DIR):
+                    os.remove(path)
+            except Exception as e:
+                self.stats["failed"] += 1
+                job["status"] = "failed"
+                job["error"] = str(e)
+                print(f"批量导入失败：{str(e)}")
+
+        asyncio.get_running_loop().run_in_executor(self._executor, run)
+        return job
+
+    def shutdown(self) -> None:
+        """当前批次提交后停止导入，排队中的任务不再执行，之后可从断点续传"""
+        self._stopping.set()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "running": sum(1 for job in self.jobs.values() if job["status"] == "running")}
+
+def _insert(conn, table, columns: List[str], rows: List[Dict[str, Any]]) -> None:
+    """PostgreSQL使用COPY，其他数据库使用executemany"""
+    if conn.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["\\N" if row.get(c) is None else row[c] for c in columns])
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
+            )
+        finally:
+            cursor.close()
+        return
+    # executemany要求每行的键相同
+    conn.execute(table.insert(), [{c: row.get(c) for c in columns} for row in rows])
+
+def _fill_coordinates(model, row: Dict[str, Any]) -> None:
+    """由位置字符串补全坐标列，并计算网格单元"""
+    for location_attr, lat_attr, lon_attr, cell_attr in SPATIAL_COLUMNS[model]:
+        if row.get(lat_attr) is None or row.get(lon_attr) is None:
+            point = parse_location(row.get(location_attr))
+            if point is None:
+                continue
+            row[lat_attr], row[lon_attr] = point
+        row[cell_attr] = grid_cell(row[lat_attr], row[lon_attr], settings.SPATIAL_CELL_DEGREES)
+
+def _with_rate(result: Dict[str, Any], new_rows: int, started: float) -> Dict[str, Any]:
+    elapsed = time.perf_counter() - started
+    return {**result, "elapsed": round(elapsed, 3), "rows_per_sec": round(new_rows / elapsed, 1) if elapsed > 0 else 0.0}
+
+def _read_records(path: str, batch_size: int) -> Iterator[Dict[str, Any]]:
+    """逐条读取记录，CSV中的空字段视为缺失"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("读取Parquet文件需要安装pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            for record in batch.to_pylist():
+                yield {k: v for k, v in record.items() if v is not None}
+        return
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if v not in ("", None)}
+        return
+    with open(path, encoding="utf-8") as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from _iter_json_array(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _iter_json_array(f, chunk_size: int = 1 << 16, max_item: int = 1 << 24) -> Iterator[Any]:
+    """逐个解析JSON数组的元素，每次只读入一块文本，不把整个文件载入内存"""
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()[1:]
+    pos = 0
+    eof = False
+    while True:
+        # 跳过元素之间的空白和逗号
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        end = None
+        if pos < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                pass
+        # 元素跨越块边界时（块末尾的数字等标量也可能不完整）读入下一块后重试
+        if end is None or (end == len(buffer) and not eof):
+            if eof or len(buffer) - pos > max_item:
+                raise ValueError("JSON数组格式错误或不完整")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
+
+def upload_path(dataset: str, job_id: str, suffix: str) -> str:
+    """接口上传文件的保存路径，文件名中包含数据集和任务ID，服务重启后仍可续传"""
+    return os.path.join(settings.BULK_LOAD_DIR, f"{dataset}-{job_id}{suffix}")
+
+def find_upload(job_id: str) -> Optional[Tuple[str, str]]:
+    """按任务ID查找保留的上传文件，返回(数据集, 路径)"""
+    if not os.path.isdir(settings.BULK_LOAD_DIR):
+        return None
+    for name in os.listdir(settings.BULK_LOAD_DIR):
+        stem, suffix = os.path.splitext(name)
+        dataset, _, file_job_id = stem.rpartition("-")
+        if file_job_id == job_id and dataset in BULK_DATASETS:
+            return dataset, os.path.join(settings.BULK_LOAD_DIR, name)
+    return None
+
+bulk_loader = BulkLoader()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口：python -m src.utils.bulk_loader <数据集> <文件> [--restart]"""
+    parser = argparse.ArgumentParser(description="批量导入出行历史、交通读数和天气数据")
+    parser.add_argument("dataset", choices=sorted(BULK_DATASETS))
+    parser.add_argument("path", help="CSV、Parquet或JSON文件")
+    parser.add_argument("--batch-size", type=int, default=None, help="每个事务写入的记录数")
+    parser.add_argument("--restart", action="store_true", help="忽略断点，从头导入")
+    args = parser.parse_args(argv)
+
+    from ..models.database import create_tables
+    create_tables()
+    if args.dataset == "traffic":
+        # 导入的交通读数在已有拥堵画像上累加
+        congestion_profile.load()
+    loader = BulkLoader(args.batch_size) if args.batch_size else bulk_loader
+
+    def report(progress: Dict[str, Any]) -> None:
+        print(f"已处理{progress['records']}条，写入{progress['written']}条，无效{progress['rejected']}条，{progress['rows_per_sec']:.0f}条/秒")
+
+    result = loader.load(args.dataset, args.path, restart=args.restart, progress=report)
+    loader.shutdown()
+    for error in result["errors"]:
+        print(f"第{error['record']}条记录无效：{error['error']}")
+    print(f"导入完成：处理{result['records']}条，写入{result['written']}条，无效{result['rejected']}条，"
+          f"用时{result['elapsed']}秒，{result['rows_per_sec']:.0f}条/秒")
+    if result["resumed_from"]:
+        print(f"本次从第{result['resumed_from'] + 1}条记录续传")
+
+if __name__ == "__main__":
+    main()
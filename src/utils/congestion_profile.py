@@ -0,0 +1,160 @@
+"""
+拥堵画像：按(网格单元, 星期, 小时)增量维护拥堵系数的样本数、均值与方差，读数到达时更新，预测时直接查表
+"""
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from ..config.settings import settings
+from ..models.database import SessionLocal, CongestionProfileEntry, TrafficData
+from .geo import EARTH_RADIUS
+
+# 全城画像使用的单元名，无位置的读数只计入全城画像
+CITY_CELL = "all"
+
+ProfileKey = Tuple[str, int, int]
+
+class CongestionProfile:
+    """内存中保存全部画像（单元数×168项），数据库表作为持久化副本"""
+
+    def __init__(self, cell_size: float = None):
+        self.cell_size = cell_size or settings.CONGESTION_PROFILE_CELL_SIZE
+        self._dlat = math.degrees(self.cell_size / EARTH_RADIUS)
+        # 键 -> [样本数, 均值, 与均值之差的平方和]
+        self._stats: Dict[ProfileKey, List[float]] = {}
+        self._ids: Dict[ProfileKey, int] = {}
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def cell_of(self, lat: float, lon: float) -> str:
+        """坐标所在的网格单元，经向宽度按该行中心纬度换算"""
+        row = math.floor(lat / self._dlat)
+        dlon = self._dlat / max(math.cos(math.radians((row + 0.5) * self._dlat)), 1e-6)
+        return f"{row}:{math.floor(lon / dlon)}"
+
+    def update(self, readings: Iterable[Dict[str, Any]]) -> None:
+        """读数计入画像，读数需含timestamp、congestion_level，可选latitude/longitude"""
+        with self._lock:
+            for reading in readings:
+                timestamp = reading["timestamp"]
+                level = reading["congestion_level"]
+                self._add((CITY_CELL, timestamp.weekday(), timestamp.hour), level)
+                if reading.get("latitude") is not None and reading.get("longitude") is not None:
+                    cell = self.cell_of(reading["latitude"], reading["longitude"])
+                    self._add((cell, timestamp.weekday(), timestamp.hour), level)
+
+    def _add(self, key: ProfileKey, value: float) -> None:
+        """Welford增量更新均值与平方和"""
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = [0, 0.0, 0.0]
+        stats[0] += 1
+        delta = value - stats[1]
+        stats[1] += delta / stats[0]
+        stats[2] += delta * (value - stats[1])
+        self._dirty.add(key)
+
+    def predict(self, lat: Optional[float], lon: Optional[float], when: datetime) -> Optional[Dict[str, Any]]:
+        """某位置某时刻的拥堵系数估计；网格样本不足时用全城画像，完全没有样本时返回None"""
+        if when.tzinfo is not None:
+            when = when.astimezone().replace(tzinfo=None)
+        weekday, hour = when.weekday(), when.hour
+        stats, scope = None, "cell"
+        if lat is not None and lon is not None:
+            stats = self._stats.get((self.cell_of(lat, lon), weekday, hour))
+        if stats is None or stats[0] < settings.CONGESTION_PROFILE_MIN_SAMPLES:
+            stats, scope = self._stats.get((CITY_CELL, weekday, hour)), "city"
+        if stats is None:
+            return None
+        count, mean, m2 = stats
+        return {
+            "congestion_factor": round(mean, 3),
+            "std": round(math.sqrt(m2 / (count - 1)), 3) if count > 1 else 0.0,
+            "samples": int(count),
+            "confidence": round(count / (count + settings.CONGESTION_PROFILE_PRIOR_SAMPLES), 3),
+            "scope": scope
+        }
+
+    def flush(self) -> int:
+        """把变化的画像写回数据库，返回写入的条数"""
+        with self._flush_lock:
+            with self._lock:
+                dirty = {key: tuple(self._stats[key]) for key in self._dirty}
+                self._dirty.clear()
+            if not dirty:
+                return 0
+            now = datetime.now()
+            updates, inserts = [], []
+            for (cell, weekday, hour), (count, mean, m2) in dirty.items():
+                row = {"cell": cell, "weekday": weekday, "hour": hour, "count": count, "mean": mean, "m2": m2, "updated_at": now}
+                entry_id = self._ids.get((cell, weekday, hour))
+                if entry_id is None:
+                    inserts.append(row)
+                else:
+                    updates.append({"id": entry_id, **row})
+            db = SessionLocal()
+            try:
+                db.bulk_update_mappings(CongestionProfileEntry, updates)
+                db.bulk_insert_mappings(CongestionProfileEntry, inserts, return_defaults=True)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                with self._lock:
+                    self._dirty.update(dirty)
+                print(f"拥堵画像写入失败：{str(e)}")
+                return 0
+            finally:
+                db.close()
+            for row in inserts:
+                self._ids[(row["cell"], row["weekday"], row["hour"])] = row["id"]
+            return len(dirty)
+
+    def load(self) -> int:
+        """启动时加载画像；画像表为空而已有历史读数时从TrafficData重建"""
+        db = SessionLocal()
+        try:
+            entries = db.query(CongestionProfileEntry).all()
+        finally:
+            db.close()
+        with self._lock:
+            self._stats = {(e.cell, e.weekday, e.hour): [e.count, e.mean, e.m2] for e in entries}
+            self._ids = {(e.cell, e.weekday, e.hour): e.id for e in entries}
+            self._dirty.clear()
+        if not entries:
+            self.rebuild()
+        return len(self._stats)
+
+    def rebuild(self) -> int:
+        """清空画像后从TrafficData全部历史读数重新计算，返回读数条数"""
+        db = SessionLocal()
+        total = 0
+        try:
+            db.query(CongestionProfileEntry).delete()
+            db.commit()
+            with self._lock:
+                self._stats, self._ids = {}, {}
+                self._dirty.clear()
+            batch = []
+            query = db.query(TrafficData.timestamp, TrafficData.congestion_level, TrafficData.latitude, TrafficData.longitude).filter(
+                TrafficData.timestamp.isnot(None),
+                TrafficData.congestion_level.isnot(None)
+            )
+            for timestamp, level, lat, lon in query.yield_per(5000):
+                batch.append({"timestamp": timestamp, "congestion_level": level, "latitude": lat, "longitude": lon})
+                if len(batch) >= 5000:
+                    self.update(batch)
+                    total += len(batch)
+                    batch = []
+            self.update(batch)
+            total += len(batch)
+        finally:
+            db.close()
+        if total:
+            self.flush()
+        return total
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"profiles": len(self._stats), "pending": len(self._dirty)}
+
+congestion_profile = CongestionProfile()
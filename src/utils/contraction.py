@@ -0,0 +1,384 @@
+"""
+收缩层次（Contraction Hierarchies）预处理与查询，用于步行/骑行点对点路线
+"""
+import argparse
+import heapq
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from .routing_graph import RoutingGraph, EDGE_WALK, EDGE_BIKE, SNAP_CELL_SIZE
+from .routing_engine import MODE_SPEEDS, WALKING, CYCLING
+from .spatial_index import GridIndex
+
+# 预处理的出行配置：名称 -> (边掩码, 速度米/秒)
+PROFILES = {
+    "foot": (EDGE_WALK, MODE_SPEEDS[WALKING]),
+    "bike": (EDGE_BIKE, MODE_SPEEDS[CYCLING]),
+}
+
+# 见证搜索的最大扩展节点数，越大捷径越少、预处理越慢
+WITNESS_SETTLE_LIMIT = 60
+
+class ContractionHierarchy:
+    """已完成收缩的层次图，上行边以CSR数组存储"""
+
+    def __init__(
+        self,
+        profile: str,
+        node_lat: np.ndarray,
+        node_lon: np.ndarray,
+        rank: np.ndarray,
+        fwd_indptr: np.ndarray,
+        fwd_indices: np.ndarray,
+        fwd_weight: np.ndarray,
+        fwd_dist: np.ndarray,
+        fwd_mid: np.ndarray,
+        bwd_indptr: np.ndarray,
+        bwd_indices: np.ndarray,
+        bwd_weight: np.ndarray,
+        bwd_dist: np.ndarray,
+        bwd_mid: np.ndarray
+    ):
+        self.profile = str(profile)
+        self.node_lat = np.ascontiguousarray(node_lat, dtype=np.float64)
+        self.node_lon = np.ascontiguousarray(node_lon, dtype=np.float64)
+        self.rank = np.ascontiguousarray(rank, dtype=np.int32)
+        self.fwd = tuple(np.ascontiguousarray(a) for a in (fwd_indptr, fwd_indices, fwd_weight, fwd_dist, fwd_mid))
+        self.bwd = tuple(np.ascontiguousarray(a) for a in (bwd_indptr, bwd_indices, bwd_weight, bwd_dist, bwd_mid))
+        self._fwd_view = tuple(memoryview(a) for a in self.fwd)
+        self._bwd_view = tuple(memoryview(a) for a in self.bwd)
+
+        # 可通行节点的网格索引，用于快速吸附到最近节点
+        degree = np.diff(self.fwd[0]) + np.diff(self.bwd[0])
+        self._snap_nodes = np.nonzero(degree > 0)[0]
+        self._snap_index = GridIndex(
+            list(zip(self.node_lat[self._snap_nodes].tolist(), self.node_lon[self._snap_nodes].tolist())),
+            SNAP_CELL_SIZE
+        )
+
+    def nearest_node(self, lat: float, lon: float) -> int:
+        """查找最近的可通行节点"""
+        found = self._snap_index.nearest(lat, lon, 1)
+        return int(self._snap_nodes[found[0][1]]) if found else 0
+
+    def query(self, source: int, target: int) -> Optional[Tuple[float, float, List[int]]]:
+        """双向上行Dijkstra查询，返回(耗时秒, 距离米, 节点序列)"""
+        if source == target:
+            return 0.0, 0.0, [source]
+
+        dist_f = {source: 0.0}
+        dist_b = {target: 0.0}
+        parent_f = {source: (-1, 0.0)}
+        parent_b = {target: (-1, 0.0)}
+        heap_f = [(0.0, source)]
+        heap_b = [(0.0, target)]
+        settled_f = set()
+        settled_b = set()
+        best = float("inf")
+        meet = -1
+
+        while heap_f or heap_b:
+            top_f = heap_f[0][0] if heap_f else float("inf")
+            top_b = heap_b[0][0] if heap_b else float("inf")
+            if min(top_f, top_b) >= best:
+                break
+            if top_f <= top_b:
+                best, meet = self._step(heap_f, dist_f, parent_f, settled_f, dist_b, self._fwd_view, best, meet)
+            else:
+                best, meet = self._step(heap_b, dist_b, parent_b, settled_b, dist_f, self._bwd_view, best, meet)
+
+        if meet < 0:
+            return None
+
+        # 拼接正向和反向的上行路径，并展开捷径
+        up = []
+        node = meet
+        while node != -1:
+            up.append(node)
+            node = parent_f[node][0]
+        up.reverse()
+        down = []
+        node = parent_b[meet][0]
+        while node != -1:
+            down.append(node)
+            node = parent_b[node][0]
+        packed = up + down
+
+        nodes = [packed[0]]
+        distance = 0.0
+        for u, v in zip(packed, packed[1:]):
+            distance += self._unpack(u, v, nodes)
+        return best, distance, nodes
+
+    @staticmethod
+    def _step(heap, dist, parent, settled, other_dist, view, best, meet):
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            return best, meet
+        settled.add(u)
+        if u in other_dist and d + other_dist[u] < best:
+            best, meet = d + other_dist[u], u
+        indptr, indices, weight, _, _ = view
+        for i in range(indptr[u], indptr[u + 1]):
+            v = indices[i]
+            nd = d + weight[i]
+            if nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                parent[v] = (u, nd)
+                heapq.heappush(heap, (nd, v))
+        return best, meet
+
+    def _find_edge(self, u: int, v: int) -> Tuple[float, int]:
+        """查找原图方向上的边u->v，返回(距离, 中间节点)"""
+        if self.rank[u] < self.rank[v]:
+            indptr, indices, _, dist, mid = self._fwd_view
+            owner, other = u, v
+        else:
+            indptr, indices, _, dist, mid = self._bwd_view
+            owner, other = v, u
+        best = None
+        for i in range(indptr[owner], indptr[owner + 1]):
+            if indices[i] == other and (best is None or dist[i] < dist[best]):
+                best = i
+        return dist[best], mid[best]
+
+    def _unpack(self, u: int, v: int, nodes: List[int]) -> float:
+        """递归展开捷径u->v，将途经节点追加到nodes，返回路段距离"""
+        stack = [(u, v)]
+        distance = 0.0
+        while stack:
+            a, b = stack.pop()
+            d, m = self._find_edge(a, b)
+            if m < 0:
+                nodes.append(b)
+                distance += d
+            else:
+                stack.append((m, b))
+                stack.append((a, m))
+        return distance
+
+    def many_to_many(self, sources: List[int], targets: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        多对多查询（桶算法）：每个终点做一次反向上行搜索写入桶，每个起点做一次正向上行搜索扫描桶
+        返回(耗时秒矩阵, 距离米矩阵)，不可达为inf
+        """
+        buckets: Dict[int, List[Tuple[int, float, float]]] = {}
+        target_spaces: Dict[int, Dict[int, Tuple[float, float]]] = {}
+        for j, t in enumerate(targets):
+            if t not in target_spaces:
+                target_spaces[t] = self._upward_search(t, self._bwd_view)
+            for v, (d, m) in target_spaces[t].items():
+                buckets.setdefault(v, []).append((j, d, m))
+
+        durations = np.full((len(sources), len(targets)), np.inf)
+        distances = np.full((len(sources), len(targets)), np.inf)
+        rows: Dict[int, Tuple[List[float], List[float]]] = {}
+        inf = float("inf")
+        for i, s in enumerate(sources):
+            if s not in rows:
+                best = [inf] * len(targets)
+                meters = [inf] * len(targets)
+                for v, (d, m) in self._upward_search(s, self._fwd_view).items():
+                    for j, dt, mt in buckets.get(v, ()):
+                        if d + dt < best[j]:
+                            best[j] = d + dt
+                            meters[j] = m + mt
+                rows[s] = (best, meters)
+            durations[i], distances[i] = rows[s]
+        return durations, distances
+
+    @staticmethod
+    def _upward_search(source: int, view) -> Dict[int, Tuple[float, float]]:
+        """上行图中的完整Dijkstra搜索，返回节点 -> (耗时, 距离)"""
+        indptr, indices, weight, length, _ = view
+        tentative = {source: 0.0}
+        settled: Dict[int, Tuple[float, float]] = {}
+        heap = [(0.0, 0.0, source)]
+        heappush, heappop, inf = heapq.heappush, heapq.heappop, float("inf")
+        while heap:
+            d, m, u = heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = (d, m)
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                nd = d + weight[i]
+                if nd < tentative.get(v, inf):
+                    tentative[v] = nd
+                    heappush(heap, (nd, m + length[i], v))
+        return settled
+
+    def route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> Optional[Dict[str, Any]]:
+        """点对点路线，返回与OSRM一致的distance/duration/geometry字段"""
+        result = self.query(self.nearest_node(start_lat, start_lon), self.nearest_node(end_lat, end_lon))
+        if result is None:
+            return None
+        duration, distance, nodes = result
+        return {
+            "distance": round(distance, 1),
+            "duration": round(duration, 1),
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[float(self.node_lon[n]), float(self.node_lat[n])] for n in nodes]
+            }
+        }
+
+    def save(self, path: str) -> None:
+        """保存为压缩的npz文件"""
+        names = ("indptr", "indices", "weight", "dist", "mid")
+        arrays = {f"fwd_{n}": a for n, a in zip(names, self.fwd)}
+        arrays.update({f"bwd_{n}": a for n, a in zip(names, self.bwd)})
+        np.savez_compressed(
+            path,
+            profile=np.asarray(self.profile),
+            node_lat=self.node_lat,
+            node_lon=self.node_lon,
+            rank=self.rank,
+            **arrays
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ContractionHierarchy":
+        """从npz文件加载"""
+        with np.load(path, allow_pickle=False) as data:
+            kwargs = {key: data[key] for key in data.files}
+        kwargs["profile"] = str(kwargs["profile"])
+        return cls(**kwargs)
+
+def build_hierarchy(graph: RoutingGraph, profile: str) -> ContractionHierarchy:
+    """对路网图的指定出行配置执行节点收缩"""
+    edge_mask, speed = PROFILES[profile]
+    n = graph.num_nodes
+    out: List[Dict[int, Tuple[float, float, int]]] = [dict() for _ in range(n)]
+    inn: List[Dict[int, Tuple[float, float, int]]] = [dict() for _ in range(n)]
+
+    sources = np.repeat(np.arange(n), np.diff(graph.indptr))
+    usable = (graph.edge_modes & edge_mask) != 0
+    for u, v, length in zip(sources[usable].tolist(), graph.indices[usable].tolist(), graph.edge_length[usable].tolist()):
+        if u == v:
+            continue
+        w = length / speed
+        if v not in out[u] or w < out[u][v][0]:
+            out[u][v] = (w, length, -1)
+            inn[v][u] = (w, length, -1)
+
+    contracted = [False] * n
+    deleted_neighbors = [0] * n
+    fwd_edges: List[List[Tuple[int, float, float, int]]] = [[] for _ in range(n)]
+    bwd_edges: List[List[Tuple[int, float, float, int]]] = [[] for _ in range(n)]
+
+    def shortcuts_for(v: int) -> List[Tuple[int, int, float, float]]:
+        result = []
+        for u, (w_in, d_in, _) in inn[v].items():
+            targets = {x: (w_in + w_out, d_in + d_out) for x, (w_out, d_out, _) in out[v].items() if x != u}
+            if not targets:
+                continue
+            limit = max(w for w, _ in targets.values())
+            witness = _witness_search(out, u, v, limit)
+            for x, (w, d) in targets.items():
+                if witness.get(x, float("inf")) > w:
+                    result.append((u, x, w, d))
+        return result
+
+    def priority(v: int) -> int:
+        return len(shortcuts_for(v)) - len(inn[v]) - len(out[v]) + deleted_neighbors[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.zeros(n, dtype=np.int32)
+    order = 0
+    while heap:
+        p, v = heapq.heappop(heap)
+        if contracted[v]:
+            continue
+        # 惰性更新：优先级变化后重新入堆
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+
+        for u, x, w, d in shortcuts_for(v):
+            if x not in out[u] or w < out[u][x][0]:
+                out[u][x] = (w, d, v)
+                inn[x][u] = (w, d, v)
+
+        # v的剩余边全部指向更高层级的节点
+        for x, (w, d, m) in out[v].items():
+            fwd_edges[v].append((x, w, d, m))
+            del inn[x][v]
+            deleted_neighbors[x] += 1
+        for u, (w, d, m) in inn[v].items():
+            bwd_edges[v].append((u, w, d, m))
+            del out[u][v]
+            deleted_neighbors[u] += 1
+        out[v] = {}
+        inn[v] = {}
+        contracted[v] = True
+        rank[v] = order
+        order += 1
+
+    return ContractionHierarchy(
+        profile, graph.node_lat, graph.node_lon, rank,
+        *_to_csr(fwd_edges), *_to_csr(bwd_edges)
+    )
+
+def _witness_search(out, source: int, excluded: int, limit: float) -> Dict[int, float]:
+    """不经过excluded节点的有限Dijkstra，用于判断是否需要捷径"""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and settled < WITNESS_SETTLE_LIMIT:
+        d, u = heapq.heappop(heap)
+        if d > dist.get(u, float("inf")):
+            continue
+        if d > limit:
+            break
+        settled += 1
+        for v, (w, _, _) in out[u].items():
+            if v == excluded:
+                continue
+            nd = d + w
+            if nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+def _to_csr(edges: List[List[Tuple[int, float, float, int]]]):
+    counts = np.asarray([len(e) for e in edges], dtype=np.int64)
+    indptr = np.zeros(len(edges) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    flat = [edge for bucket in edges for edge in bucket]
+    return (
+        indptr,
+        np.asarray([e[0] for e in flat], dtype=np.int32),
+        np.asarray([e[1] for e in flat], dtype=np.float64),
+        np.asarray([e[2] for e in flat], dtype=np.float64),
+        np.asarray([e[3] for e in flat], dtype=np.int32),
+    )
+
+def hierarchy_path(data_dir: str, profile: str) -> str:
+    """收缩层次文件路径"""
+    return os.path.join(data_dir, f"ch_{profile}.npz")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口：python -m src.utils.contraction build <graph.npz> <输出目录>"""
+    parser = argparse.ArgumentParser(description="为步行/骑行配置预处理收缩层次")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="由路网图构建收缩层次")
+    build.add_argument("graph", help="routing_graph生成的npz文件")
+    build.add_argument("output_dir", help="输出目录")
+    build.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args(argv)
+
+    graph = RoutingGraph.load(args.graph)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for profile in args.profiles:
+        started = time.time()
+        hierarchy = build_hierarchy(graph, profile)
+        path = hierarchy_path(args.output_dir, profile)
+        hierarchy.save(path)
+        print(f"{profile}: 已保存 {path}（{len(hierarchy.fwd[1]) + len(hierarchy.bwd[1])}条上行边，耗时{time.time() - started:.1f}秒）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+数据库访问线程池：异步接口中的同步SQLAlchemy调用统一放到有界线程池执行，不阻塞事件循环
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+from ..config.settings import settings
+from ..models.database import SessionLocal
+
+T = TypeVar("T")
+
+class DatabaseExecutor:
+    """线程数即同时打开的会话数上限，超出的调用在线程池队列中等待"""
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or settings.DB_EXECUTOR_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+        self.pending = 0
+        self.stats = {"calls": 0, "errors": 0, "total_wait": 0.0, "max_wait": 0.0, "total_time": 0.0, "max_time": 0.0, "max_pending": 0}
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """用新会话在线程池中执行fn(db, *args, **kwargs)，返回前关闭会话"""
+        def call() -> T:
+            db = SessionLocal()
+            try:
+                return fn(db, *args, **kwargs)
+            finally:
+                db.close()
+        return await self.call(call)
+
+    async def call(self, fn: Callable[..., T], *args: Any) -> T:
+        """在线程池中执行任意阻塞函数（如密码哈希）"""
+        submitted = time.perf_counter()
+        started = 0.0
+
+        def timed() -> T:
+            nonlocal started
+            started = time.perf_counter()
+            return fn(*args)
+
+        self.pending += 1
+        self.stats["max_pending"] = max(self.stats["max_pending"], self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.pending -= 1
+            finished = time.perf_counter()
+            if started:
+                self._record(started - submitted, finished - started)
+
+    def _record(self, wait: float, elapsed: float) -> None:
+        self.stats["calls"] += 1
+        self.stats["total_wait"] += wait
+        self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+        self.stats["total_time"] += elapsed
+        self.stats["max_time"] = max(self.stats["max_time"], elapsed)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "total_wait": round(self.stats["total_wait"], 3),
+            "max_wait": round(self.stats["max_wait"], 4),
+            "total_time": round(self.stats["total_time"], 3),
+            "max_time": round(self.stats["max_time"], 4),
+            "avg_wait": round(self.stats["total_wait"] / calls, 4) if calls else 0.0,
+            "avg_time": round(self.stats["total_time"] / calls, 4) if calls else 0.0
+        }
+
+db_executor = DatabaseExecutor()
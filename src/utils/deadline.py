@@ -0,0 +1,16 @@
+"""
+带截止时间的依赖调用：超时或失败时降级为默认值，而不是让整个请求失败
+"""
+import asyncio
+from typing import Any, Awaitable, List
+
+async def with_deadline(name: str, awaitable: Awaitable, timeout: float, skipped: List[str], default: Any = None) -> Any:
+    """在截止时间内等待依赖结果；超时或出错时将name记入skipped并返回default"""
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        print(f"依赖{name}超过截止时间{timeout}秒，已跳过")
+    except Exception as e:
+        print(f"依赖{name}调用失败，已跳过：{str(e)}")
+    skipped.append(name)
+    return default
@@ -0,0 +1,102 @@
+import json
+import math
+from typing import Optional, Tuple
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # 地球平均半径（米）
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """计算两点间的球面距离（米）"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+def haversine_np(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """向量化的球面距离计算（米），参数可为数组或标量"""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def parse_lat_lon(value: str) -> Tuple[float, float]:
+    """解析"纬度,经度"格式的坐标字符串"""
+    lat, lon = value.split(",")
+    return float(lat), float(lon)
+
+def parse_location(value) -> Optional[Tuple[float, float]]:
+    """解析数据库中旧的位置字符串："纬度,经度"、JSON对象{lat, lon}/{latitude, longitude}或JSON数组[纬度, 经度]"""
+    if not value:
+        return None
+    try:
+        if isinstance(value, str) and value.lstrip()[:1] in "[{":
+            value = json.loads(value)
+        if isinstance(value, dict):
+            lat = value.get("lat", value.get("latitude"))
+            lon = value.get("lon", value.get("lng", value.get("longitude")))
+        elif isinstance(value, (list, tuple)):
+            lat, lon = value[0], value[1]
+        else:
+            lat, lon = parse_lat_lon(value)
+        lat, lon = float(lat), float(lon)
+    except (ValueError, TypeError, IndexError, KeyError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+def grid_cell(lat: float, lon: float, degrees: float) -> int:
+    """固定经纬度间隔的网格单元编号：行号×每行单元数+列号，同一行内相邻单元编号连续"""
+    columns = round(360 / degrees)
+    row = math.floor((lat + 90) / degrees)
+    column = math.floor((lon + 180) / degrees) % columns
+    return row * columns + column
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat: float, lon: float, precision: int = 7) -> str:
+    """计算geohash编码，precision为字符数（7位约150米见方）"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # 偶数位编码经度，奇数位编码纬度
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+def lat_lon_to_tile(lat: float, lon: float, zoom: int) -> Tuple[int, int]:
+    """经纬度所在的slippy地图瓦片编号(x, y)"""
+    n = 1 << zoom
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_bounds(x: int, y: int, zoom: int) -> Tuple[float, float, float, float]:
+    """瓦片的边界(south, west, north, east)"""
+    n = 1 << zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
@@ -0,0 +1,147 @@
+"""
+地理编码缓存：地址归一化、内存LRU（带过期时间）、SQLite持久化与并发请求合并
+"""
+import asyncio
+import json
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Callable, Awaitable, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..config.settings import settings
+from ..models.database import GeocodeCacheEntry
+from .db_executor import db_executor
+
+def normalize_address(address: str) -> str:
+    """地址归一化：全角转半角、统一大小写、合并空白"""
+    address = unicodedata.normalize("NFKC", address).casefold()
+    return " ".join(address.split())
+
+class GeocodeCache:
+    """按(服务商, 归一化地址)缓存地理编码结果"""
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = max_size or settings.GEOCODE_CACHE_SIZE
+        self.ttl = ttl or settings.GEOCODE_CACHE_TTL
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.stats = {"hits": 0, "db_hits": 0, "misses": 0, "coalesced": 0}
+
+    async def get_or_fetch(
+        self,
+        provider: str,
+        address: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        cacheable: Callable[[Dict[str, Any]], bool]
+    ) -> Dict[str, Any]:
+        """命中缓存直接返回；否则调用fetch，同一地址的并发请求共享一次上游调用"""
+        key = (provider, normalize_address(address))
+        result = self._get(key)
+        if result is not None:
+            self.stats["hits"] += 1
+            return result
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._load_or_fetch(key, fetch, cacheable))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+        # 任一调用方被取消（超时、客户端断开）都不会取消共享的查询
+        return await asyncio.shield(task)
+
+    async def _load_or_fetch(
+        self,
+        key: Tuple[str, str],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        cacheable: Callable[[Dict[str, Any]], bool]
+    ) -> Dict[str, Any]:
+        result = await self._load(key)
+        if result is not None:
+            self.stats["db_hits"] += 1
+            return result
+        self.stats["misses"] += 1
+        result = await fetch()
+        if cacheable(result):
+            self._put(key, result)
+            await self._store(key, result)
+        return result
+
+    def _fetch_done(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # 所有等待者都已取消时，取出异常避免“异常未被获取”的警告
+        if not task.cancelled():
+            task.exception()
+
+    def _get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _put(self, key: Tuple[str, str], result: Dict[str, Any], age: float = 0) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl - age, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        """从SQLite读取未过期的结果并放入内存"""
+        try:
+            row = await db_executor.run(self._read_row, key)
+        except Exception as e:
+            print(f"地理编码缓存读取失败：{str(e)}")
+            return None
+        if row is None:
+            return None
+        result, created_at = row
+        age = (datetime.utcnow() - created_at).total_seconds()
+        if age >= self.ttl:
+            return None
+        self._put(key, result, age)
+        return result
+
+    async def _store(self, key: Tuple[str, str], result: Dict[str, Any]) -> None:
+        try:
+            await db_executor.run(self._write_row, key, result)
+        except Exception as e:
+            # 持久化失败不影响本次请求，内存缓存仍然有效
+            print(f"地理编码缓存写入失败：{str(e)}")
+
+    @staticmethod
+    def _read_row(db: Session, key: Tuple[str, str]) -> Optional[Tuple[Dict[str, Any], datetime]]:
+        entry = db.query(GeocodeCacheEntry).filter(
+            GeocodeCacheEntry.provider == key[0],
+            GeocodeCacheEntry.address_key == key[1]
+        ).first()
+        return (json.loads(entry.result), entry.created_at) if entry else None
+
+    @staticmethod
+    def _write_row(db: Session, key: Tuple[str, str], result: Dict[str, Any]) -> None:
+        entry = db.query(GeocodeCacheEntry).filter(
+            GeocodeCacheEntry.provider == key[0],
+            GeocodeCacheEntry.address_key == key[1]
+        ).first()
+        if entry is None:
+            entry = GeocodeCacheEntry(provider=key[0], address_key=key[1])
+            db.add(entry)
+        entry.result = json.dumps(result, ensure_ascii=False)
+        entry.created_at = datetime.utcnow()
+        db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["db_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": round((self.stats["hits"] + self.stats["db_hits"]) / lookups, 4) if lookups else 0.0
+        }
+
+geocode_cache = GeocodeCache()
@@ -1,5 +1,6 @@
-import aiohttp
 from src.config.settings import settings
+from src.utils.http_client import http_client
+from src.utils.geocode_cache import geocode_cache
 
 class GeocodeService:
     def __init__(self):
@@ -7,7 +8,12 @@ class GeocodeService:
         self.ak = settings.BAIDU_MAP_AK  # 从配置中获取API密钥
 
     async def geocode(self, address: str) -> dict:
-        """将地址转换为经纬度坐标"""
+        """将地址转换为经纬度坐标（带缓存）"""
+        return await geocode_cache.get_or_fetch(
+            "baidu", address, lambda: self._geocode(address), lambda r: r.get("status") == "success"
+        )
+
+    async def _geocode(self, address: str) -> dict:
         params = {
             "address": address,
             "output": "json",
@@ -15,23 +21,23 @@ class GeocodeService:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.base_url, params=params) as resp:
-                    data = await resp.json()
+            session = http_client.session
+            async with session.get(self.base_url, params=params) as resp:
+                data = await resp.json()
                     
-                    if data["status"] == 0 and "result" in data:
-                        location = data["result"]["location"]
-                        return {
-                            "status": "success",
-                            "location": {
-                                "lng": location["lng"],
-                                "lat": location["lat"]
-                            }
-                        }
+                if data["status"] == 0 and "result" in data:
+                    location = data["result"]["location"]
                     return {
-                        "status": "error",
-                        "message": data.get("message", "地址解析失败")
+                        "status": "success",
+                        "location": {
+                            "lng": location["lng"],
+                            "lat": location["lat"]
+                        }
                     }
+                return {
+                    "status": "error",
+                    "message": data.get("message", "地址解析失败")
+                }
         except Exception as e:
             return {
                 "status": "error",
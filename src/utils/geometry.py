@@ -0,0 +1,79 @@
+"""
+路线几何：以numpy数组存储坐标，按缩放级别做Douglas–Peucker简化，并输出为不同格式
+"""
+import math
+from typing import List, Optional, Union
+import numpy as np
+import polyline
+from .geo import EARTH_RADIUS
+
+# 输出格式：list为"经度,纬度"字符串列表（兼容旧接口），array为[经度, 纬度]数组，encoded为Google编码折线
+GEOMETRY_FORMATS = ("list", "array", "encoded")
+
+# 允许的地图缩放级别范围
+MAX_ZOOM = 22
+
+# 简化容差对应的屏幕像素数
+PIXEL_TOLERANCE = 1.0
+
+def parse_amap_polyline(text: str) -> np.ndarray:
+    """解析高德"lng,lat;lng,lat"格式的折线，返回(N, 2)的[经度, 纬度]数组"""
+    if not text:
+        return np.empty((0, 2))
+    return np.array(text.replace(";", ",").split(","), dtype=np.float64).reshape(-1, 2)
+
+def zoom_tolerance(zoom: int, lat: float) -> float:
+    """Web墨卡托缩放级别下一个像素对应的地面距离（米）"""
+    return 2 * math.pi * EARTH_RADIUS * math.cos(math.radians(lat)) / (256 * (1 << zoom)) * PIXEL_TOLERANCE
+
+def simplify(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas–Peucker简化，tolerance为米"""
+    n = len(coords)
+    if n < 3 or tolerance <= 0:
+        return coords
+    # 局部等距投影到平面米制坐标
+    cos_lat = math.cos(math.radians(float(coords[:, 1].mean())))
+    x = np.radians(coords[:, 0]) * cos_lat * EARTH_RADIUS
+    y = np.radians(coords[:, 1]) * EARTH_RADIUS
+
+    xs, ys = x.tolist(), y.tolist()
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        dx, dy = xs[b] - xs[a], ys[b] - ys[a]
+        length = math.hypot(dx, dy)
+        if b - a > 64:
+            # 长区间向量化计算各点到弦的距离
+            px, py = x[a + 1:b] - xs[a], y[a + 1:b] - ys[a]
+            distances = np.abs(px * dy - py * dx) / length if length else np.hypot(px, py)
+            i = int(np.argmax(distances))
+            farthest, m = float(distances[i]), a + 1 + i
+        else:
+            # 短区间用纯Python循环，避免numpy的调用开销
+            farthest, m = -1.0, a
+            for j in range(a + 1, b):
+                px, py = xs[j] - xs[a], ys[j] - ys[a]
+                d = abs(px * dy - py * dx) / length if length else math.hypot(px, py)
+                if d > farthest:
+                    farthest, m = d, j
+        if farthest > tolerance:
+            keep[m] = True
+            stack.append((a, m))
+            stack.append((m, b))
+    return coords[keep]
+
+def format_geometry(coords: np.ndarray, fmt: str = "list", zoom: Optional[int] = None) -> Union[str, List]:
+    """按缩放级别简化后输出为指定格式"""
+    if zoom is not None and len(coords):
+        coords = simplify(coords, zoom_tolerance(zoom, float(coords[:, 1].mean())))
+    if fmt == "encoded":
+        # 编码折线的坐标顺序为(纬度, 经度)
+        return polyline.encode(coords[:, ::-1].tolist(), 5)
+    if fmt == "array":
+        return np.round(coords, 6).tolist()
+    return [f"{lon:.6f},{lat:.6f}" for lon, lat in coords.tolist()]
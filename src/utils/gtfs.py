@@ -0,0 +1,331 @@
+"""
+GTFS时刻表加载：将stop_times与trips打包为按线路、站点排序的扁平数组
+"""
+import argparse
+import csv
+import io
+import os
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Iterator
+import numpy as np
+from .geo import haversine_np
+
+# GTFS route_type中视为地铁/轨道交通的类型
+SUBWAY_ROUTE_TYPES = {0, 1, 2, 5, 7, 12}
+
+# 自动生成站间步行换乘的最大距离（米）与步行速度（米/秒）
+FOOTPATH_RADIUS = 300.0
+FOOTPATH_SPEED = 1.3
+
+class TransitTimetable:
+    """RAPTOR所需的扁平化时刻表
+
+    pattern（站点序列相同的一组班次）的到发时刻按“站点优先”存储：
+    第i个站点上所有班次的时刻连续排列，便于在单个站点上二分查找最早可乘班次。
+    """
+
+    def __init__(
+        self,
+        stop_ids: np.ndarray,
+        stop_names: np.ndarray,
+        stop_lat: np.ndarray,
+        stop_lon: np.ndarray,
+        pattern_route_names: np.ndarray,
+        pattern_route_types: np.ndarray,
+        pattern_stops_ptr: np.ndarray,
+        pattern_stops: np.ndarray,
+        pattern_trips_ptr: np.ndarray,
+        trip_service: np.ndarray,
+        pattern_times_ptr: np.ndarray,
+        arrivals: np.ndarray,
+        departures: np.ndarray,
+        stop_patterns_ptr: np.ndarray,
+        stop_patterns: np.ndarray,
+        stop_pattern_pos: np.ndarray,
+        transfer_ptr: np.ndarray,
+        transfer_to: np.ndarray,
+        transfer_time: np.ndarray,
+        service_ids: np.ndarray,
+        service_weekdays: np.ndarray,
+        service_start: np.ndarray,
+        service_end: np.ndarray,
+        exception_service: np.ndarray,
+        exception_date: np.ndarray,
+        exception_type: np.ndarray
+    ):
+        self.stop_ids = np.asarray(stop_ids, dtype=str)
+        self.stop_names = np.asarray(stop_names, dtype=str)
+        self.stop_lat = np.ascontiguousarray(stop_lat, dtype=np.float64)
+        self.stop_lon = np.ascontiguousarray(stop_lon, dtype=np.float64)
+        self.pattern_route_names = np.asarray(pattern_route_names, dtype=str)
+        self.pattern_route_types = np.ascontiguousarray(pattern_route_types, dtype=np.int16)
+        self.pattern_stops_ptr = np.ascontiguousarray(pattern_stops_ptr, dtype=np.int64)
+        self.pattern_stops = np.ascontiguousarray(pattern_stops, dtype=np.int32)
+        self.pattern_trips_ptr = np.ascontiguousarray(pattern_trips_ptr, dtype=np.int64)
+        self.trip_service = np.ascontiguousarray(trip_service, dtype=np.int32)
+        self.pattern_times_ptr = np.ascontiguousarray(pattern_times_ptr, dtype=np.int64)
+        self.arrivals = np.ascontiguousarray(arrivals, dtype=np.int32)
+        self.departures = np.ascontiguousarray(departures, dtype=np.int32)
+        self.stop_patterns_ptr = np.ascontiguousarray(stop_patterns_ptr, dtype=np.int64)
+        self.stop_patterns = np.ascontiguousarray(stop_patterns, dtype=np.int32)
+        self.stop_pattern_pos = np.ascontiguousarray(stop_pattern_pos, dtype=np.int32)
+        self.transfer_ptr = np.ascontiguousarray(transfer_ptr, dtype=np.int64)
+        self.transfer_to = np.ascontiguousarray(transfer_to, dtype=np.int32)
+        self.transfer_time = np.ascontiguousarray(transfer_time, dtype=np.int32)
+        self.service_ids = np.asarray(service_ids, dtype=str)
+        self.service_weekdays = np.ascontiguousarray(service_weekdays, dtype=np.uint8)
+        self.service_start = np.ascontiguousarray(service_start, dtype=np.int32)
+        self.service_end = np.ascontiguousarray(service_end, dtype=np.int32)
+        self.exception_service = np.ascontiguousarray(exception_service, dtype=np.int32)
+        self.exception_date = np.ascontiguousarray(exception_date, dtype=np.int32)
+        self.exception_type = np.ascontiguousarray(exception_type, dtype=np.int8)
+        self._service_cache: Dict[int, np.ndarray] = {}
+
+    @property
+    def num_stops(self) -> int:
+        return len(self.stop_ids)
+
+    @property
+    def num_patterns(self) -> int:
+        return len(self.pattern_stops_ptr) - 1
+
+    def active_trips(self, day: date) -> np.ndarray:
+        """返回指定日期各班次是否运营的布尔数组"""
+        key = _date_key(day)
+        if key not in self._service_cache:
+            services = (
+                ((self.service_weekdays >> day.weekday()) & 1).astype(bool)
+                & (self.service_start <= key)
+                & (self.service_end >= key)
+            )
+            on_day = self.exception_date == key
+            services[self.exception_service[on_day & (self.exception_type == 1)]] = True
+            services[self.exception_service[on_day & (self.exception_type == 2)]] = False
+            if len(self._service_cache) >= 8:
+                self._service_cache.clear()
+            self._service_cache[key] = services[self.trip_service]
+        return self._service_cache[key]
+
+    def save(self, path: str) -> None:
+        """保存为压缩的npz文件"""
+        np.savez_compressed(path, **{name: getattr(self, name) for name in _ARRAY_FIELDS})
+
+    @classmethod
+    def load(cls, path: str) -> "TransitTimetable":
+        """加载npz文件或GTFS数据（zip文件或目录）"""
+        if path.endswith(".npz"):
+            with np.load(path, allow_pickle=False) as data:
+                return cls(**{key: data[key] for key in data.files})
+        return load_gtfs(path)
+
+_ARRAY_FIELDS = [
+    "stop_ids", "stop_names", "stop_lat", "stop_lon",
+    "pattern_route_names", "pattern_route_types",
+    "pattern_stops_ptr", "pattern_stops", "pattern_trips_ptr", "trip_service",
+    "pattern_times_ptr", "arrivals", "departures",
+    "stop_patterns_ptr", "stop_patterns", "stop_pattern_pos",
+    "transfer_ptr", "transfer_to", "transfer_time",
+    "service_ids", "service_weekdays", "service_start", "service_end",
+    "exception_service", "exception_date", "exception_type",
+]
+
+def _date_key(day: date) -> int:
+    return day.year * 10000 + day.month * 100 + day.day
+
+def _parse_time(value: str) -> int:
+    """HH:MM:SS转换为当日秒数（允许超过24小时）"""
+    h, m, s = value.strip().split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+def _read_table(path: str, name: str) -> Iterator[Dict[str, str]]:
+    """读取GTFS中的一张表，文件不存在时返回空"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            if name not in archive.namelist():
+                return
+            with archive.open(name) as raw:
+                yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig"))
+    else:
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, "r", encoding="utf-8-sig", newline="") as f:
+            yield from csv.DictReader(f)
+
+def load_gtfs(path: str) -> TransitTimetable:
+    """解析GTFS数据并打包为扁平数组"""
+    # 站点
+    stop_index: Dict[str, int] = {}
+    stop_ids, stop_names, stop_lat, stop_lon = [], [], [], []
+    for row in _read_table(path, "stops.txt"):
+        if row.get("location_type", "") not in ("", "0"):
+            continue
+        stop_index[row["stop_id"]] = len(stop_ids)
+        stop_ids.append(row["stop_id"])
+        stop_names.append(row.get("stop_name", ""))
+        stop_lat.append(float(row["stop_lat"]))
+        stop_lon.append(float(row["stop_lon"]))
+
+    routes = {
+        row["route_id"]: (row.get("route_short_name") or row.get("route_long_name") or row["route_id"], int(row.get("route_type") or 3))
+        for row in _read_table(path, "routes.txt")
+    }
+
+    # 服务日历
+    service_index: Dict[str, int] = {}
+    service_weekdays, service_start, service_end = [], [], []
+    weekday_columns = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+    for row in _read_table(path, "calendar.txt"):
+        service_index[row["service_id"]] = len(service_index)
+        service_weekdays.append(sum((row.get(day) == "1") << i for i, day in enumerate(weekday_columns)))
+        service_start.append(int(row["start_date"]))
+        service_end.append(int(row["end_date"]))
+    exception_service, exception_date, exception_type = [], [], []
+    for row in _read_table(path, "calendar_dates.txt"):
+        if row["service_id"] not in service_index:
+            # 仅由calendar_dates定义的服务：默认不运营，依赖例外日期启用
+            service_index[row["service_id"]] = len(service_index)
+            service_weekdays.append(0)
+            service_start.append(0)
+            service_end.append(0)
+        exception_service.append(service_index[row["service_id"]])
+        exception_date.append(int(row["date"]))
+        exception_type.append(int(row["exception_type"]))
+
+    trips: Dict[str, Dict[str, Any]] = {}
+    for row in _read_table(path, "trips.txt"):
+        service = row.get("service_id", "")
+        if service not in service_index:
+            # 缺少日历的服务视为每日运营
+            service_index[service] = len(service_index)
+            service_weekdays.append(0x7F)
+            service_start.append(0)
+            service_end.append(99991231)
+        trips[row["trip_id"]] = {"route_id": row["route_id"], "service": service_index[service], "stops": []}
+
+    for row in _read_table(path, "stop_times.txt"):
+        trip = trips.get(row["trip_id"])
+        stop = stop_index.get(row["stop_id"])
+        if trip is None or stop is None or not row.get("arrival_time") or not row.get("departure_time"):
+            continue
+        trip["stops"].append((int(row["stop_sequence"]), stop, _parse_time(row["arrival_time"]), _parse_time(row["departure_time"])))
+
+    # 按(线路, 站点序列)分组为pattern
+    patterns: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for trip in trips.values():
+        if len(trip["stops"]) < 2:
+            continue
+        trip["stops"].sort()
+        key = (trip["route_id"], tuple(s[1] for s in trip["stops"]))
+        patterns[key].append(trip)
+
+    pattern_route_names, pattern_route_types = [], []
+    pattern_stops_ptr, pattern_stops = [0], []
+    pattern_trips_ptr, trip_service = [0], []
+    pattern_times_ptr, arrivals, departures = [0], [], []
+    for (route_id, stops), pattern_trips in sorted(patterns.items()):
+        # 按首站发车时间排序（假定同一pattern内班次不超车）
+        pattern_trips.sort(key=lambda t: t["stops"][0][3])
+        name, route_type = routes.get(route_id, (route_id, 3))
+        pattern_route_names.append(name)
+        pattern_route_types.append(route_type)
+        pattern_stops.extend(stops)
+        pattern_stops_ptr.append(len(pattern_stops))
+        trip_service.extend(t["service"] for t in pattern_trips)
+        pattern_trips_ptr.append(len(trip_service))
+        for i in range(len(stops)):
+            arrivals.extend(t["stops"][i][2] for t in pattern_trips)
+            departures.extend(t["stops"][i][3] for t in pattern_trips)
+        pattern_times_ptr.append(len(arrivals))
+
+    # 站点 -> 经过该站点的pattern及站点在其中的位置
+    stop_to_patterns: List[List[tuple]] = [[] for _ in stop_ids]
+    for p in range(len(pattern_route_names)):
+        for pos in range(pattern_stops_ptr[p], pattern_stops_ptr[p + 1]):
+            stop_to_patterns[pattern_stops[pos]].append((p, pos - pattern_stops_ptr[p]))
+    stop_patterns_ptr = np.zeros(len(stop_ids) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in stop_to_patterns], out=stop_patterns_ptr[1:])
+    flat = [item for items in stop_to_patterns for item in items]
+
+    lat = np.asarray(stop_lat, dtype=np.float64)
+    lon = np.asarray(stop_lon, dtype=np.float64)
+    transfer_ptr, transfer_to, transfer_time = _build_footpaths(path, stop_index, lat, lon)
+
+    return TransitTimetable(
+        stop_ids=stop_ids,
+        stop_names=stop_names,
+        stop_lat=lat,
+        stop_lon=lon,
+        pattern_route_names=pattern_route_names,
+        pattern_route_types=pattern_route_types,
+        pattern_stops_ptr=pattern_stops_ptr,
+        pattern_stops=pattern_stops,
+        pattern_trips_ptr=pattern_trips_ptr,
+        trip_service=trip_service,
+        pattern_times_ptr=pattern_times_ptr,
+        arrivals=arrivals,
+        departures=departures,
+        stop_patterns_ptr=stop_patterns_ptr,
+        stop_patterns=[p for p, _ in flat],
+        stop_pattern_pos=[pos for _, pos in flat],
+        transfer_ptr=transfer_ptr,
+        transfer_to=transfer_to,
+        transfer_time=transfer_time,
+        service_ids=sorted(service_index, key=service_index.get),
+        service_weekdays=service_weekdays,
+        service_start=service_start,
+        service_end=service_end,
+        exception_service=exception_service,
+        exception_date=exception_date,
+        exception_type=exception_type
+    )
+
+def _build_footpaths(path: str, stop_index: Dict[str, int], lat: np.ndarray, lon: np.ndarray):
+    """生成站间步行换乘：transfers.txt中的显式换乘加上邻近站点间的步行"""
+    footpaths: Dict[tuple, int] = {}
+    # 按纬度排序后用滑动窗口查找邻近站点，避免O(n^2)
+    order = np.argsort(lat)
+    sorted_lat = lat[order]
+    window = FOOTPATH_RADIUS / 111000.0
+    for i, stop in enumerate(order.tolist()):
+        hi = int(np.searchsorted(sorted_lat, lat[stop] + window, side="right"))
+        candidates = order[i + 1:hi]
+        if not len(candidates):
+            continue
+        distances = haversine_np(lat[candidates], lon[candidates], lat[stop], lon[stop])
+        for other, distance in zip(candidates[distances <= FOOTPATH_RADIUS].tolist(), distances[distances <= FOOTPATH_RADIUS].tolist()):
+            seconds = int(distance / FOOTPATH_SPEED)
+            footpaths[(stop, other)] = seconds
+            footpaths[(other, stop)] = seconds
+
+    for row in _read_table(path, "transfers.txt"):
+        a, b = stop_index.get(row["from_stop_id"]), stop_index.get(row["to_stop_id"])
+        if a is None or b is None or a == b or row.get("transfer_type") == "3":
+            continue
+        if row.get("min_transfer_time"):
+            footpaths[(a, b)] = int(row["min_transfer_time"])
+
+    items = sorted(footpaths.items())
+    transfer_ptr = np.zeros(len(lat) + 1, dtype=np.int64)
+    np.cumsum(np.bincount([a for (a, _), _ in items], minlength=len(lat)), out=transfer_ptr[1:])
+    return transfer_ptr, [b for (_, b), _ in items], [t for _, t in items]
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口：python -m src.utils.gtfs build <gtfs.zip|目录> <timetable.npz>"""
+    parser = argparse.ArgumentParser(description="将GTFS数据打包为RAPTOR时刻表")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="解析GTFS并保存为npz")
+    build.add_argument("source", help="GTFS zip文件或目录")
+    build.add_argument("output", help="输出的npz文件路径")
+    args = parser.parse_args(argv)
+
+    started = datetime.now()
+    timetable = load_gtfs(args.source)
+    timetable.save(args.output)
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"时刻表已保存: {args.output}（{timetable.num_stops}个站点，{timetable.num_patterns}条线路模式，{len(timetable.trip_service)}个班次，耗时{elapsed:.1f}秒）")
+
+if __name__ == "__main__":
+    main()
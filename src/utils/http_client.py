@@ -0,0 +1,41 @@
+"""
+共享HTTP客户端：所有上游服务复用同一连接池（keep-alive、DNS缓存、默认超时）
+"""
+import aiohttp
+from typing import Optional
+from ..config.settings import settings
+
+class HttpClient:
+    """应用生命周期内共享的aiohttp会话，启动时创建，关闭时释放"""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """当前会话；在应用生命周期之外（脚本、测试）使用时按需创建"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.HTTP_POOL_LIMIT,
+                limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=settings.HTTP_TIMEOUT,
+                connect=settings.HTTP_CONNECT_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def start(self) -> None:
+        """创建连接池（需在事件循环中调用）"""
+        self.session
+
+    async def close(self) -> None:
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+http_client = HttpClient()
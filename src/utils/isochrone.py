@@ -0,0 +1,170 @@
+"""
+等时圈：一次一对多搜索求出从起点出发在各时间段内可到达的范围，按网格单元输出
+"""
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from ..config.settings import settings
+from .geo import EARTH_RADIUS, haversine
+from .gtfs import FOOTPATH_SPEED
+from .raptor import transit_router
+from .routing_engine import routing_engine, WALKING, CYCLING, BUS, SUBWAY
+from .routing_graph import EDGE_WALK
+
+ISOCHRONE_MODES = ("walking", "cycling", "transit")
+ISOCHRONE_FORMATS = ("cells", "geojson")
+
+# 公交站点与路网步行节点的最大匹配距离（米）
+STOP_SNAP_DISTANCE = 300.0
+
+class IsochroneService:
+    """
+    在本地路网上做有界多模式Dijkstra；有时刻表时先用RAPTOR求出可达站点，
+    再把各站点的到达时刻作为额外起始节点一起参与路网搜索
+    """
+
+    def __init__(self):
+        self._snap_key = None
+        self._stop_nodes: Optional[np.ndarray] = None
+        self._stop_snap: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def compute(
+        self,
+        lat: float,
+        lon: float,
+        bands: List[int],
+        modes: List[str],
+        departure_time: datetime = None,
+        cell_size: float = None,
+        fmt: str = "cells"
+    ) -> Dict[str, Any]:
+        """bands为升序的分钟数，返回每个时间段新增可达的网格单元"""
+        router = routing_engine.router
+        if router is None:
+            return {"status": "0", "error": "本地路网数据未加载"}
+        graph = router.graph
+        cell_size = cell_size or settings.ISOCHRONE_CELL_SIZE
+        max_seconds = bands[-1] * 60
+
+        origin = graph.nearest_node(lat, lon, EDGE_WALK)
+        access = haversine(lat, lon, graph.node_lat[origin], graph.node_lon[origin]) / FOOTPATH_SPEED
+        seeds = {origin: access}
+
+        allowed = [WALKING]
+        if "cycling" in modes:
+            allowed.append(CYCLING)
+        skipped = []
+        if "transit" in modes:
+            if transit_router.is_available:
+                self._add_transit_seeds(seeds, lat, lon, max_seconds, departure_time)
+            else:
+                # 没有时刻表时退化为路网中不考虑班次的公交/地铁边
+                allowed += [BUS, SUBWAY]
+                skipped.append("timetable")
+
+        seconds = router.one_to_all(seeds, allowed, max_seconds)
+        reached = np.nonzero(np.isfinite(seconds))[0]
+        cells, cell_seconds = _to_cells(graph.node_lat[reached], graph.node_lon[reached], seconds[reached], lat, cell_size)
+
+        band_index = np.searchsorted(np.asarray(bands) * 60, cell_seconds, side="left")
+        result_bands = []
+        for i, minutes in enumerate(bands):
+            selected = cells[band_index == i]
+            result_bands.append({"minutes": minutes, "count": int(len(selected)), "cells": selected})
+
+        result = {
+            "status": "1",
+            "origin": {"lat": lat, "lon": lon},
+            "cell_size": cell_size,
+            "skipped": skipped
+        }
+        if fmt == "geojson":
+            result["geojson"] = _to_geojson(result_bands, lat, cell_size)
+        else:
+            result["bands"] = [
+                {**band, "cells": _cell_centers(band["cells"], lat, cell_size)} for band in result_bands
+            ]
+        return result
+
+    def _add_transit_seeds(self, seeds: Dict[int, float], lat: float, lon: float, max_seconds: int, departure_time: Optional[datetime]) -> None:
+        """可达站点按到达时刻加入起始节点（取站点附近的步行节点）"""
+        reach = transit_router.reach(lat, lon, max_seconds, departure_time)
+        if not reach:
+            return
+        stop_nodes, stop_snap = self._stop_mapping()
+        for stop, arrival in reach.items():
+            node = int(stop_nodes[stop])
+            if node < 0:
+                continue
+            cost = arrival + stop_snap[stop]
+            if cost <= max_seconds and cost < seeds.get(node, math.inf):
+                seeds[node] = cost
+
+    def _stop_mapping(self) -> Tuple[np.ndarray, np.ndarray]:
+        """各公交站点最近的步行节点及接驳步行秒数，路网或时刻表重新加载后重建"""
+        graph = routing_engine.graph
+        timetable = transit_router.raptor.timetable
+        key = (id(graph), id(timetable))
+        if self._snap_key != key:
+            with self._lock:
+                if self._snap_key != key:
+                    index, walkable = graph.snap_index(EDGE_WALK)
+                    nodes = np.full(timetable.num_stops, -1, dtype=np.int64)
+                    snap = np.zeros(timetable.num_stops)
+                    for stop, (stop_lat, stop_lon) in enumerate(zip(timetable.stop_lat.tolist(), timetable.stop_lon.tolist())):
+                        found = index.nearest(stop_lat, stop_lon, 1, STOP_SNAP_DISTANCE)
+                        if found:
+                            nodes[stop] = walkable[found[0][1]]
+                            snap[stop] = found[0][0] / FOOTPATH_SPEED
+                    self._stop_nodes, self._stop_snap = nodes, snap
+                    self._snap_key = key
+        return self._stop_nodes, self._stop_snap
+
+def _cell_degrees(origin_lat: float, cell_size: float) -> Tuple[float, float]:
+    """网格单元在纬度、经度方向上的度数"""
+    dlat = math.degrees(cell_size / EARTH_RADIUS)
+    return dlat, dlat / max(math.cos(math.radians(origin_lat)), 1e-6)
+
+def _to_cells(lats: np.ndarray, lons: np.ndarray, seconds: np.ndarray, origin_lat: float, cell_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """节点归入网格单元，每个单元取其中最早的到达时间，返回(单元行列号数组, 秒数)"""
+    if not len(seconds):
+        return np.empty((0, 2), dtype=np.int64), seconds
+    dlat, dlon = _cell_degrees(origin_lat, cell_size)
+    rows = np.floor(lats / dlat).astype(np.int64)
+    cols = np.floor(lons / dlon).astype(np.int64)
+    # 按(行, 列, 秒数)排序后每个单元的第一项即最早到达
+    order = np.lexsort((seconds, cols, rows))
+    rows, cols, seconds = rows[order], cols[order], seconds[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    return np.stack([rows[first], cols[first]], axis=1), seconds[first]
+
+def _cell_centers(cells: np.ndarray, origin_lat: float, cell_size: float) -> List[List[float]]:
+    """单元中心的[纬度, 经度]"""
+    dlat, dlon = _cell_degrees(origin_lat, cell_size)
+    centers = np.stack([(cells[:, 0] + 0.5) * dlat, (cells[:, 1] + 0.5) * dlon], axis=1)
+    return np.round(centers, 6).tolist()
+
+def _to_geojson(bands: List[Dict[str, Any]], origin_lat: float, cell_size: float) -> Dict[str, Any]:
+    """每个时间段输出为一个MultiPolygon要素，单元为正方形"""
+    dlat, dlon = _cell_degrees(origin_lat, cell_size)
+    features = []
+    for band in bands:
+        cells = band["cells"]
+        s, w = cells[:, 0] * dlat, cells[:, 1] * dlon
+        n, e = s + dlat, w + dlon
+        polygons = [
+            [[[w0, s0], [e0, s0], [e0, n0], [w0, n0], [w0, s0]]]
+            for s0, w0, n0, e0 in np.round(np.stack([s, w, n, e], axis=1), 6).tolist()
+        ]
+        features.append({
+            "type": "Feature",
+            "properties": {"minutes": band["minutes"], "count": band["count"]},
+            "geometry": {"type": "MultiPolygon", "coordinates": polygons}
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+isochrone_service = IsochroneService()
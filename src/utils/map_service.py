@@ -1,5 +1,6 @@
-import aiohttp
 from src.config.settings import settings
+from src.utils.http_client import http_client
+from src.utils.geocode_cache import geocode_cache
 
 class MapService:
     def __init__(self):
@@ -7,40 +8,45 @@ class MapService:
         self.base_url = "https://restapi.amap.com/v3"
     
     async def geocode(self, address: str) -> dict:
-        """地理编码服务"""
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "key": self.api_key,
-                "address": address,
-                "output": "JSON"
-            }
-            async with session.get(f"{self.base_url}/geocode/geo", params=params) as response:
-                return await response.json()
+        """地理编码服务（带缓存）"""
+        return await geocode_cache.get_or_fetch(
+            "amap", address, lambda: self._geocode(address), lambda r: r.get("status") == "1" and bool(r.get("geocodes"))
+        )
+    
+    async def _geocode(self, address: str) -> dict:
+        session = http_client.session
+        params = {
+            "key": self.api_key,
+            "address": address,
+            "output": "JSON"
+        }
+        async with session.get(f"{self.base_url}/geocode/geo", params=params) as response:
+            return await response.json()
     
     async def calculate_route(self, origin: str, destination: str) -> dict:
         """路径规划服务"""
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "key": self.api_key,
-                "origin": origin,
-                "destination": destination,
-                "output": "JSON",
-                "extensions": "all"
-            }
-            async with session.get(f"{self.base_url}/direction/walking", params=params) as response:
-                return await response.json()
+        session = http_client.session
+        params = {
+            "key": self.api_key,
+            "origin": origin,
+            "destination": destination,
+            "output": "JSON",
+            "extensions": "all"
+        }
+        async with session.get(f"{self.base_url}/direction/walking", params=params) as response:
+            return await response.json()
     
     async def search_around(self, location: str, keywords: str, radius: int = 1000) -> dict:
         """周边搜索服务"""
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "key": self.api_key,
-                "location": location,
-                "keywords": keywords,
-                "radius": radius,
-                "output": "JSON"
-            }
-            async with session.get(f"{self.base_url}/place/around", params=params) as response:
-                return await response.json()
+        session = http_client.session
+        params = {
+            "key": self.api_key,
+            "location": location,
+            "keywords": keywords,
+            "radius": radius,
+            "output": "JSON"
+        }
+        async with session.get(f"{self.base_url}/place/around", params=params) as response:
+            return await response.json()
 
 map_service = MapService() 
\ No newline at end of file
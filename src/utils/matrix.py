@@ -0,0 +1,95 @@
+"""
+多起点多终点的距离/耗时/碳排放矩阵
+"""
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+import numpy as np
+from .osm_service import osm_service
+from .raptor import transit_router
+from .carbon import carbon_engine
+
+MATRIX_MODES = ("walking", "cycling", "transit")
+
+# 步行/骑行使用的收缩层次配置
+MODE_PROFILES = {"walking": "foot", "cycling": "bike"}
+
+class MatrixService:
+    """步行、骑行基于收缩层次的多对多搜索，公交基于每个起点一次的RAPTOR搜索"""
+
+    def compute(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+        modes: List[str],
+        departure_time: datetime = None
+    ) -> Dict[str, Any]:
+        """
+        返回各方式的矩阵，按行优先展开为一维数组（下标 = 起点序号 * 终点数 + 终点序号）
+        distance单位米，duration单位分钟，carbon单位千克CO2，不可达为null
+        """
+        matrices = {}
+        skipped = []
+        for mode in modes:
+            if mode in MODE_PROFILES:
+                result = self._street_matrix(mode, origins, destinations)
+            elif mode == "transit":
+                result = self._transit_matrix(origins, destinations, departure_time)
+            else:
+                result = None
+            if result is None:
+                skipped.append(mode)
+            else:
+                matrices[mode] = result
+        return {
+            "status": "1",
+            "shape": [len(origins), len(destinations)],
+            "matrices": matrices,
+            "skipped": skipped
+        }
+
+    def _street_matrix(self, mode: str, origins, destinations) -> Dict[str, List]:
+        hierarchy = osm_service.get_hierarchy(MODE_PROFILES[mode])
+        if hierarchy is None:
+            return None
+        sources = [hierarchy.nearest_node(lat, lon) for lat, lon in origins]
+        targets = [hierarchy.nearest_node(lat, lon) for lat, lon in destinations]
+        durations, distances = hierarchy.many_to_many(sources, targets)
+        reachable = np.isfinite(distances)
+        carbon = np.where(reachable, np.where(reachable, distances, 0.0) / 1000 * carbon_engine.factor(mode), np.inf)
+        return {
+            "distance": _flatten(distances, 1),
+            "duration": _flatten(durations / 60, 1),
+            "carbon": _flatten(carbon, 3)
+        }
+
+    def _transit_matrix(self, origins, destinations, departure_time) -> Dict[str, List]:
+        if not transit_router.is_available:
+            return None
+        shape = (len(origins), len(destinations))
+        durations = np.full(shape, np.inf)
+        distances = np.full(shape, np.inf)
+        # 各乘车路段展开为(单元格, 方式, 公里)三列，一次计算全部排放
+        cells, modes, kilometers = [], [], []
+        for i, row in enumerate(transit_router.matrix(origins, destinations, departure_time)):
+            for j, cell in enumerate(row):
+                if cell is None:
+                    continue
+                durations[i, j] = cell["duration"]
+                distances[i, j] = cell["distance"]
+                for mode, meters in cell["ride_distance"].items():
+                    cells.append(i * shape[1] + j)
+                    modes.append(mode)
+                    kilometers.append(meters / 1000)
+        carbon = carbon_engine.score(cells, modes, kilometers, durations.size)["emission"].reshape(shape)
+        carbon[~np.isfinite(durations)] = np.inf
+        return {
+            "distance": _flatten(distances, 1),
+            "duration": _flatten(durations / 60, 1),
+            "carbon": _flatten(carbon, 3)
+        }
+
+def _flatten(matrix: np.ndarray, digits: int) -> List:
+    """按行优先展开并保留小数位，inf转为None"""
+    return [None if v == float("inf") else round(v, digits) for v in matrix.ravel().tolist()]
+
+matrix_service = MatrixService()
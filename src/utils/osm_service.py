@@ -1,6 +1,14 @@
 import aiohttp
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import asyncio
+import os
+from ..config.settings import settings
+from .http_client import http_client
+from .geocode_cache import geocode_cache
+from .geo import parse_lat_lon
+from .route_cache import route_cache
+from .rate_limiter import rate_limiter, RateLimitExceeded
+from .contraction import ContractionHierarchy, PROFILES, hierarchy_path
 
 class OSMService:
     def __init__(self):
@@ -11,9 +19,29 @@ class OSMService:
         }
         self.timeout = aiohttp.ClientTimeout(total=10)  # 10秒超时
         self.base_url = "https://nominatim.openstreetmap.org/search"
+        self._hierarchies: Dict[str, Optional[ContractionHierarchy]] = {}
+    
+    def load_hierarchies(self) -> None:
+        """（重新）加载各出行配置的收缩层次文件"""
+        for profile in PROFILES:
+            path = hierarchy_path(settings.CH_DATA_DIR, profile)
+            self._hierarchies[profile] = ContractionHierarchy.load(path) if os.path.exists(path) else None
+            if self._hierarchies[profile] is not None:
+                print(f"收缩层次加载成功: {path}")
+    
+    def get_hierarchy(self, profile: str) -> Optional[ContractionHierarchy]:
+        if profile not in self._hierarchies:
+            path = hierarchy_path(settings.CH_DATA_DIR, profile)
+            self._hierarchies[profile] = ContractionHierarchy.load(path) if os.path.exists(path) else None
+        return self._hierarchies[profile]
     
     async def geocode(self, address: str) -> Dict[str, Any]:
-        """将地址转换为坐标"""
+        """将地址转换为坐标（带缓存）"""
+        return await geocode_cache.get_or_fetch(
+            "osm", address, lambda: self._geocode(address), lambda r: r.get("status") == "1"
+        )
+    
+    async def _geocode(self, address: str) -> Dict[str, Any]:
         try:
             params = {
                 "q": address,
@@ -26,97 +54,134 @@ class OSMService:
                 "User-Agent": "GreenTransportApp/1.0"
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.base_url, params=params, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data and len(data) > 0:
-                            location = data[0]
-                            return {
-                                "status": "1",
-                                "location": {
-                                    "latitude": float(location["lat"]),
-                                    "longitude": float(location["lon"]),
-                                    "address": location.get("display_name", "")
-                                }
+            # 遵守Nominatim使用政策，全局限流
+            await rate_limiter.acquire(self.base_url)
+            session = http_client.session
+            async with session.get(self.base_url, params=params, headers=headers) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if data and len(data) > 0:
+                        location = data[0]
+                        return {
+                            "status": "1",
+                            "location": {
+                                "latitude": float(location["lat"]),
+                                "longitude": float(location["lon"]),
+                                "address": location.get("display_name", "")
                             }
-                        return {"status": "0", "error": "未找到该地址"}
-                    return {"status": "0", "error": f"地理编码请求失败: {response.status}"}
+                        }
+                    return {"status": "0", "error": "未找到该地址"}
+                return {"status": "0", "error": f"地理编码请求失败: {response.status}"}
+        except RateLimitExceeded:
+            return {"status": "0", "error": "地理编码请求过多，请稍后重试"}
         except Exception as e:
             print(f"地理编码错误: {str(e)}")
             return {"status": "0", "error": f"地理编码失败: {str(e)}"}
     
-    async def calculate_route(self, origin: str, destination: str) -> Dict[str, Any]:
-        """路径规划服务"""
+    async def calculate_route(self, origin: str, destination: str, profile: str = "foot") -> Dict[str, Any]:
+        """路径规划服务，profile为foot（步行）或bike（骑行）"""
+        if settings.OSM_ROUTE_MODE != "osrm":
+            hierarchy = self.get_hierarchy(profile)
+            if hierarchy is not None:
+                return self._calculate_local_route(hierarchy, origin, destination)
+            if settings.OSM_ROUTE_MODE == "local":
+                return {"status": "0", "error": f"本地路网数据未加载 ({profile})"}
+        
+        # 相近起终点的OSRM结果复用缓存
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                # OSRM需要经度在前，纬度在后
-                coords = f"{origin.split(',')[1]},{origin.split(',')[0]};{destination.split(',')[1]},{destination.split(',')[0]}"
-                url = f"{self.osrm_url}/route/v1/foot/{coords}"
-                params = {
-                    "overview": "full",
-                    "geometries": "geojson",
-                    "steps": "true"
-                }
+            key = route_cache.key(profile, *parse_lat_lon(origin), *parse_lat_lon(destination))
+        except ValueError:
+            return await self._calculate_osrm_route(origin, destination, profile)
+        return await route_cache.get_or_fetch(
+            key, lambda: self._calculate_osrm_route(origin, destination, profile), lambda r: r.get("status") == "1"
+        )
+    
+    async def _calculate_osrm_route(self, origin: str, destination: str, profile: str) -> Dict[str, Any]:
+        try:
+            session = http_client.session
+            # OSRM需要经度在前，纬度在后
+            coords = f"{origin.split(',')[1]},{origin.split(',')[0]};{destination.split(',')[1]},{destination.split(',')[0]}"
+            url = f"{self.osrm_url}/route/v1/{profile}/{coords}"
+            params = {
+                "overview": "full",
+                "geometries": "geojson",
+                "steps": "true"
+            }
                 
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("code") == "Ok":
-                            route = data["routes"][0]
-                            return {
-                                "status": "1",
-                                "route": {
-                                    "distance": route["distance"],
-                                    "duration": route["duration"],
-                                    "geometry": route["geometry"]
-                                }
+            async with session.get(url, params=params, timeout=self.timeout) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if data.get("code") == "Ok":
+                        route = data["routes"][0]
+                        return {
+                            "status": "1",
+                            "route": {
+                                "distance": route["distance"],
+                                "duration": route["duration"],
+                                "geometry": route["geometry"]
                             }
-                        return {"status": "0", "error": "无法规划路线"}
-                    else:
-                        return {"status": "0", "error": f"路径规划服务错误 (HTTP {response.status})"}
+                        }
+                    return {"status": "0", "error": "无法规划路线"}
+                else:
+                    return {"status": "0", "error": f"路径规划服务错误 (HTTP {response.status})"}
         except asyncio.TimeoutError:
             return {"status": "0", "error": "请求超时，请稍后重试"}
         except Exception as e:
             return {"status": "0", "error": f"路径规划请求失败: {str(e)}"}
     
+    def _calculate_local_route(self, hierarchy: ContractionHierarchy, origin: str, destination: str) -> Dict[str, Any]:
+        """基于本地收缩层次的路径规划，返回格式与OSRM一致"""
+        try:
+            origin_lat, origin_lon = map(float, origin.split(","))
+            dest_lat, dest_lon = map(float, destination.split(","))
+        except ValueError:
+            return {"status": "0", "error": "坐标格式错误，应为\"纬度,经度\""}
+        
+        route = hierarchy.route(origin_lat, origin_lon, dest_lat, dest_lon)
+        if route is None:
+            return {"status": "0", "error": "无法规划路线"}
+        return {"status": "1", "route": route}
+    
     async def search_around(self, location: str, keywords: str, radius: int = 1000) -> Dict[str, Any]:
         """周边搜索服务"""
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                lat, lon = location.split(",")
-                params = {
-                    "format": "json",
-                    "lat": lat,
-                    "lon": lon,
-                    "q": keywords,
-                    "limit": 10,
-                    "radius": radius,
-                    "countrycodes": "cn"
-                }
-                
-                # 添加延迟以遵守Nominatim使用政策
-                await asyncio.sleep(1)
-                
-                async with session.get(
-                    f"{self.nominatim_url}/search",
-                    params=params,
-                    headers=self.headers
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {
-                            "status": "1",
-                            "pois": [{
-                                "name": item["display_name"],
-                                "location": f"{item['lat']},{item['lon']}",
-                                "distance": item.get("distance", "未知")
-                            } for item in data]
-                        }
-                    else:
-                        return {"status": "0", "error": f"周边搜索服务错误 (HTTP {response.status})"}
+            session = http_client.session
+            lat, lon = location.split(",")
+            params = {
+                "format": "json",
+                "lat": lat,
+                "lon": lon,
+                "q": keywords,
+                "limit": 10,
+                "radius": radius,
+                "countrycodes": "cn"
+            }
+            
+            # 遵守Nominatim使用政策，全局限流
+            await rate_limiter.acquire(self.nominatim_url)
+            
+            async with session.get(
+                f"{self.nominatim_url}/search",
+                params=params,
+                headers=self.headers,
+                timeout=self.timeout
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return {
+                        "status": "1",
+                        "pois": [{
+                            "name": item["display_name"],
+                            "location": f"{item['lat']},{item['lon']}",
+                            "distance": item.get("distance", "未知")
+                        } for item in data]
+                    }
+                else:
+                    return {"status": "0", "error": f"周边搜索服务错误 (HTTP {response.status})"}
         except asyncio.TimeoutError:
             return {"status": "0", "error": "请求超时，请稍后重试"}
+        except RateLimitExceeded:
+            return {"status": "0", "error": "周边搜索请求过多，请稍后重试"}
         except Exception as e:
             return {"status": "0", "error": f"周边搜索请求失败: {str(e)}"}
 
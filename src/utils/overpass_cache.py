@@ -0,0 +1,133 @@
+"""
+Overpass站点查询的瓦片缓存：按固定缩放级别的slippy瓦片缓存结果，短时间内的缺失瓦片合并为一次bbox查询
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Set, Tuple
+from ..config.settings import settings
+from .geo import haversine, lat_lon_to_tile, tile_bounds, EARTH_RADIUS
+from .http_client import http_client
+from .rate_limiter import rate_limiter
+
+Tile = Tuple[int, int]
+
+# 同一批次中按上级瓦片（缩放级别减3，即8x8个瓦片）分组，避免相距很远的请求合成一个巨大的bbox
+GROUP_SHIFT = 3
+
+class OverpassTileCache:
+    """公交站、地铁站、共享单车站点的Overpass瓦片缓存"""
+
+    def __init__(self, url: str = "https://overpass-api.de/api/interpreter", zoom: int = None, ttl: float = None, window: float = None, max_tiles: int = None):
+        self.url = url
+        self.zoom = zoom or settings.OVERPASS_TILE_ZOOM
+        self.ttl = ttl or settings.OVERPASS_TILE_TTL
+        self.window = window if window is not None else settings.OVERPASS_BATCH_WINDOW
+        self.max_tiles = max_tiles or settings.OVERPASS_CACHE_TILES
+        self._tiles: "OrderedDict[Tile, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._pending: Dict[Tile, asyncio.Future] = {}
+        self._flush_handle = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"tile_hits": 0, "tile_misses": 0, "queries": 0, "queried_tiles": 0}
+
+    async def elements_around(self, lat: float, lon: float, radius: float) -> List[Dict[str, Any]]:
+        """半径内的站点元素（Overpass原始格式），缓存未命中的瓦片等待批量查询"""
+        now = time.monotonic()
+        elements = []
+        waits = []
+        for tile in self._tiles_around(lat, lon, radius):
+            entry = self._tiles.get(tile)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._tiles.move_to_end(tile)
+                elements.extend(entry[1])
+                self.stats["tile_hits"] += 1
+            else:
+                waits.append(asyncio.shield(self._request_tile(tile)))
+                self.stats["tile_misses"] += 1
+        for tile_elements in await asyncio.gather(*waits):
+            elements.extend(tile_elements)
+        # 在本地按调用方的半径裁剪
+        return [e for e in elements if haversine(lat, lon, e["lat"], e["lon"]) <= radius]
+
+    def _tiles_around(self, lat: float, lon: float, radius: float) -> List[Tile]:
+        """半径外接矩形覆盖的瓦片，数量超过上限时抛出ValueError"""
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        x0, y0 = lat_lon_to_tile(lat + dlat, lon - dlon, self.zoom)
+        x1, y1 = lat_lon_to_tile(lat - dlat, lon + dlon, self.zoom)
+        count = (x1 - x0 + 1) * (y1 - y0 + 1)
+        if count > settings.OVERPASS_MAX_QUERY_TILES:
+            raise ValueError(f"查询范围覆盖{count}个瓦片，超过上限{settings.OVERPASS_MAX_QUERY_TILES}")
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def _request_tile(self, tile: Tile) -> asyncio.Future:
+        """登记缺失瓦片，批次窗口结束后统一查询"""
+        future = self._pending.get(tile)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[tile] = future
+            if self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        groups: Dict[Tile, Dict[Tile, asyncio.Future]] = {}
+        for tile, future in pending.items():
+            groups.setdefault((tile[0] >> GROUP_SHIFT, tile[1] >> GROUP_SHIFT), {})[tile] = future
+        for group in groups.values():
+            task = asyncio.ensure_future(self._fetch_group(group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_group(self, group: Dict[Tile, asyncio.Future]) -> None:
+        """一次bbox查询覆盖组内所有缺失瓦片，再按瓦片拆分结果"""
+        bounds = [tile_bounds(x, y, self.zoom) for x, y in group]
+        bbox = f"{min(b[0] for b in bounds)},{min(b[1] for b in bounds)},{max(b[2] for b in bounds)},{max(b[3] for b in bounds)}"
+        query = f"""
+        [out:json][timeout:25];
+        (
+          node["highway"="bus_stop"]({bbox});
+          node["railway"="station"]({bbox});
+          node["amenity"="bicycle_rental"]({bbox});
+        );
+        out body;
+        """
+        self.stats["queries"] += 1
+        self.stats["queried_tiles"] += len(group)
+        try:
+            await rate_limiter.acquire(self.url)
+            async with http_client.session.get(self.url, params={"data": query}) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Overpass服务错误 (HTTP {response.status})")
+                data = await response.json()
+        except Exception as e:
+            for future in group.values():
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()
+            return
+
+        by_tile: Dict[Tile, List[Dict[str, Any]]] = {tile: [] for tile in group}
+        for element in data.get("elements", []):
+            if "lat" not in element:
+                continue
+            tile = lat_lon_to_tile(element["lat"], element["lon"], self.zoom)
+            if tile in by_tile:
+                by_tile[tile].append(element)
+        now = time.monotonic()
+        for tile, elements in by_tile.items():
+            self._tiles[tile] = (now, elements)
+            self._tiles.move_to_end(tile)
+            if not group[tile].done():
+                group[tile].set_result(elements)
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "cached_tiles": len(self._tiles), "pending_tiles": len(self._pending)}
+
+overpass_cache = OverpassTileCache()
@@ -0,0 +1,455 @@
+"""
+RAPTOR公交/地铁时刻表路径搜索
+"""
+import bisect
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from ..config.settings import settings
+from .geo import haversine_np
+from .gtfs import TransitTimetable, SUBWAY_ROUTE_TYPES, FOOTPATH_SPEED
+
+INF = 1 << 30
+
+class Raptor:
+    """基于扁平时刻表的轮次式（round-based）公共交通搜索"""
+
+    def __init__(self, timetable: TransitTimetable):
+        self.timetable = timetable
+        tt = timetable
+        self._pattern_stops_ptr = memoryview(tt.pattern_stops_ptr)
+        self._pattern_stops = memoryview(tt.pattern_stops)
+        self._pattern_trips_ptr = memoryview(tt.pattern_trips_ptr)
+        self._pattern_times_ptr = memoryview(tt.pattern_times_ptr)
+        self._arrivals = memoryview(tt.arrivals)
+        self._departures = memoryview(tt.departures)
+        self._stop_patterns_ptr = memoryview(tt.stop_patterns_ptr)
+        self._stop_patterns = memoryview(tt.stop_patterns)
+        self._stop_pattern_pos = memoryview(tt.stop_pattern_pos)
+        self._transfer_ptr = memoryview(tt.transfer_ptr)
+        self._transfer_to = memoryview(tt.transfer_to)
+        self._transfer_time = memoryview(tt.transfer_time)
+
+    def search(
+        self,
+        sources: Dict[int, int],
+        targets: Dict[int, int],
+        departure: datetime,
+        max_rounds: int = 4
+    ) -> List[Dict[str, Any]]:
+        """
+        sources: 起点可达站点 -> 步行接驳秒数
+        targets: 终点可达站点 -> 步行离站秒数
+        返回按换乘次数递增、到达时间递减的帕累托最优行程
+        """
+        rounds, labels, day_start = self._run(sources, [targets], departure, max_rounds)
+        return self._collect_journeys(rounds, labels, targets, day_start)
+
+    def search_many(
+        self,
+        sources: Dict[int, int],
+        target_sets: List[Dict[int, int]],
+        departure: datetime,
+        max_rounds: int = 4
+    ) -> List[Optional[Dict[str, Any]]]:
+        """一次搜索求出到多个终点的最早到达行程，target_sets中每项为一个终点的(站点 -> 步行离站秒数)"""
+        rounds, labels, day_start = self._run(sources, target_sets, departure, max_rounds)
+        results = []
+        for targets in target_sets:
+            journeys = self._collect_journeys(rounds, labels, targets, day_start) if targets else []
+            results.append(journeys[-1] if journeys else None)
+        return results
+
+    def reach(self, sources: Dict[int, int], departure: datetime, max_seconds: int, max_rounds: int = 4) -> Dict[int, int]:
+        """一对多搜索：max_seconds内可到达的全部站点 -> 自出发起的最早到达秒数"""
+        rounds, _, day_start = self._run(sources, [], departure, max_rounds, max_seconds)
+        t0 = int((departure - day_start).total_seconds())
+        earliest: Dict[int, int] = {}
+        for tau in rounds:
+            for stop, arrival in tau.items():
+                if arrival - t0 < earliest.get(stop, INF):
+                    earliest[stop] = arrival - t0
+        return earliest
+
+    def _run(self, sources, target_sets, departure, max_rounds, max_seconds=None):
+        """执行RAPTOR轮次扫描，返回每轮到达时间、标签和当日零点；max_seconds限制自出发起的最长行程时间"""
+        tt = self.timetable
+        day_start = datetime.combine(departure.date(), datetime.min.time())
+        t0 = int((departure - day_start).total_seconds())
+        active = memoryview(tt.active_trips(departure.date()))
+
+        pattern_stops_ptr, pattern_stops = self._pattern_stops_ptr, self._pattern_stops
+        pattern_trips_ptr, pattern_times_ptr = self._pattern_trips_ptr, self._pattern_times_ptr
+        arrivals, departures = self._arrivals, self._departures
+        stop_patterns_ptr, stop_patterns, stop_pattern_pos = self._stop_patterns_ptr, self._stop_patterns, self._stop_pattern_pos
+        transfer_ptr, transfer_to, transfer_time = self._transfer_ptr, self._transfer_to, self._transfer_time
+
+        best_array = np.full(tt.num_stops, INF, dtype=np.int64)
+        best = memoryview(best_array)
+        arrivals_array = tt.arrivals
+        pattern_stops_array = tt.pattern_stops
+        rounds: List[Dict[int, int]] = []
+        labels: List[Dict[int, tuple]] = []
+
+        # 第0轮：步行到达起点站
+        tau = {stop: t0 + walk for stop, walk in sources.items()}
+        label = {stop: ("access", walk) for stop, walk in sources.items()}
+        for stop, arrival in tau.items():
+            best[stop] = arrival
+        rounds.append(tau)
+        labels.append(label)
+        marked = set(tau)
+        # 剪枝界限：所有终点各自最优到达时间中的最大值，晚于它的到达对任何终点都无用
+        target_sets = [targets for targets in target_sets if targets]
+        set_best = [INF] * len(target_sets)
+        horizon = t0 + max_seconds if max_seconds is not None else INF
+        target_best = horizon
+
+        for _ in range(max_rounds):
+            # 只需在上一轮被改进的站点尝试上车：未改进站点能赶上的班次在上一轮已扫描过
+            prev = rounds[-1]
+            tau: Dict[int, int] = {}
+            label: Dict[int, tuple] = {}
+
+            # 收集需要扫描的pattern及其上的标记站点位置
+            queue: Dict[int, List[int]] = {}
+            for stop in marked:
+                # 到达时间已不早于当前最优终点到达时间的站点无需继续扩展
+                if prev[stop] >= target_best:
+                    continue
+                for i in range(stop_patterns_ptr[stop], stop_patterns_ptr[stop + 1]):
+                    queue.setdefault(stop_patterns[i], []).append(stop_pattern_pos[i])
+
+            improved = set()
+            for p, positions in queue.items():
+                positions.sort()
+                s_begin = pattern_stops_ptr[p]
+                n_stops = pattern_stops_ptr[p + 1] - s_begin
+                trip_begin = pattern_trips_ptr[p]
+                n_trips = pattern_trips_ptr[p + 1] - trip_begin
+                times = pattern_times_ptr[p]
+                trip = -1
+                board_pos = -1
+                board_stop = -1
+                for idx, pos in enumerate(positions):
+                    # 在标记站点尝试换乘更早的班次
+                    stop = pattern_stops[s_begin + pos]
+                    col = times + pos * n_trips
+                    ready = prev[stop]
+                    if trip < 0 or ready <= departures[col + trip]:
+                        limit = trip if trip >= 0 else n_trips
+                        k = bisect.bisect_left(departures, ready, col, col + limit) - col
+                        while k < limit and not active[trip_begin + k]:
+                            k += 1
+                        if k < limit:
+                            trip = k
+                            board_pos = pos
+                            board_stop = stop
+                    if trip < 0:
+                        continue
+
+                    # 沿当前班次更新到下一个标记站点（含）为止的到达时间
+                    end = positions[idx + 1] + 1 if idx + 1 < len(positions) else n_stops
+                    if end - pos <= 16:
+                        for q in range(pos + 1, end):
+                            other = pattern_stops[s_begin + q]
+                            arr = arrivals[times + q * n_trips + trip]
+                            if arr < best[other] and arr < target_best:
+                                tau[other] = arr
+                                best[other] = arr
+                                label[other] = ("trip", p, trip, board_pos, q, board_stop)
+                                improved.add(other)
+                    else:
+                        # 长区间向量化比较
+                        seg_stops = pattern_stops_array[s_begin + pos + 1:s_begin + end]
+                        start = times + (pos + 1) * n_trips + trip
+                        seg_arr = arrivals_array[start:start + (end - pos - 1) * n_trips:n_trips]
+                        better = np.nonzero((seg_arr < best_array[seg_stops]) & (seg_arr < target_best))[0]
+                        if len(better):
+                            best_array[seg_stops[better]] = seg_arr[better]
+                            for q, other, arr in zip((better + pos + 1).tolist(), seg_stops[better].tolist(), seg_arr[better].tolist()):
+                                tau[other] = arr
+                                label[other] = ("trip", p, trip, board_pos, q, board_stop)
+                                improved.add(other)
+
+            # 站间步行换乘
+            for stop in list(improved):
+                arrival = tau[stop]
+                for i in range(transfer_ptr[stop], transfer_ptr[stop + 1]):
+                    other = transfer_to[i]
+                    reach = arrival + transfer_time[i]
+                    if reach < best[other] and reach < target_best:
+                        tau[other] = reach
+                        best[other] = reach
+                        label[other] = ("walk", stop, transfer_time[i])
+                        improved.add(other)
+
+            for idx, targets in enumerate(target_sets):
+                for stop, egress in targets.items():
+                    if stop in tau and tau[stop] + egress < set_best[idx]:
+                        set_best[idx] = tau[stop] + egress
+            if target_sets:
+                target_best = min(max(set_best), horizon)
+
+            rounds.append(tau)
+            labels.append(label)
+            marked = improved
+            if not marked:
+                break
+
+        return rounds, labels, day_start
+
+    def _collect_journeys(self, rounds, labels, targets, day_start) -> List[Dict[str, Any]]:
+        """按轮次提取到达时间严格改进的行程"""
+        journeys = []
+        best_arrival = INF
+        for k in range(1, len(rounds)):
+            candidates = [(rounds[k][s] + egress, s) for s, egress in targets.items() if s in rounds[k]]
+            if not candidates:
+                continue
+            arrival, stop = min(candidates)
+            if arrival >= best_arrival:
+                continue
+            legs = self._reconstruct(rounds, labels, k, stop)
+            if legs is None:
+                continue
+            best_arrival = arrival
+            journeys.append({
+                "transfers": k - 1,
+                "arrival": day_start + timedelta(seconds=arrival),
+                "egress_stop": stop,
+                "egress_seconds": targets[stop],
+                "legs": legs
+            })
+        return journeys
+
+    def _reconstruct(self, rounds, labels, k: int, stop: int) -> Optional[List[Dict[str, Any]]]:
+        tt = self.timetable
+        legs = []
+        while k > 0:
+            label = labels[k].get(stop)
+            if label is None:
+                # 该站点在本轮未改进，沿用上一轮的标签
+                k -= 1
+                continue
+            if label[0] == "walk":
+                _, origin, seconds = label
+                legs.append({"type": "walk", "from_stop": origin, "to_stop": stop, "duration": seconds})
+                stop = origin
+                continue
+            _, p, trip, board_pos, alight_pos, board_stop = label
+            n_trips = tt.pattern_trips_ptr[p + 1] - tt.pattern_trips_ptr[p]
+            times = tt.pattern_times_ptr[p]
+            stops = tt.pattern_stops[tt.pattern_stops_ptr[p] + board_pos:tt.pattern_stops_ptr[p] + alight_pos + 1]
+            legs.append({
+                "type": "ride",
+                "pattern": p,
+                "from_stop": board_stop,
+                "to_stop": stop,
+                "departure": int(tt.departures[times + board_pos * n_trips + trip]),
+                "arrival": int(tt.arrivals[times + alight_pos * n_trips + trip]),
+                "stops": stops.tolist()
+            })
+            stop = board_stop
+            k -= 1
+        if labels[0].get(stop) is None:
+            return None
+        legs.reverse()
+        return legs
+
+class TransitRouter:
+    """时刻表的延迟加载以及从坐标到坐标的公交行程规划"""
+
+    def __init__(self, timetable_path: str = None):
+        self.timetable_path = timetable_path or settings.GTFS_PATH
+        self._raptor: Optional[Raptor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def raptor(self) -> Optional[Raptor]:
+        if self._raptor is None and self.timetable_path and os.path.exists(self.timetable_path):
+            with self._lock:
+                if self._raptor is None:
+                    self.load(self.timetable_path)
+        return self._raptor
+
+    @property
+    def is_available(self) -> bool:
+        return self.raptor is not None
+
+    def load(self, path: str = None) -> TransitTimetable:
+        """加载（或重新加载）时刻表"""
+        timetable = TransitTimetable.load(path or self.timetable_path)
+        self._raptor = Raptor(timetable)
+        print(f"公交时刻表加载成功：{timetable.num_stops}个站点，{timetable.num_patterns}条线路模式")
+        return timetable
+
+    def nearby_stops(self, lat: float, lon: float, radius: float) -> Dict[int, int]:
+        """半径内的站点 -> 步行秒数"""
+        tt = self.raptor.timetable
+        distances = haversine_np(tt.stop_lat, tt.stop_lon, lat, lon)
+        stops = np.nonzero(distances <= radius)[0]
+        return {int(s): int(distances[s] / FOOTPATH_SPEED) for s in stops}
+
+    def plan(
+        self,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+        departure: datetime = None,
+        max_walking_distance: float = None,
+        max_rounds: int = 4
+    ) -> List[Dict[str, Any]]:
+        """规划公交/地铁行程，返回按换乘次数排列的可选方案"""
+        raptor = self.raptor
+        if raptor is None:
+            return []
+        departure = departure or datetime.now()
+        if departure.tzinfo is not None:
+            departure = departure.astimezone().replace(tzinfo=None)
+        radius = max_walking_distance or settings.TRANSIT_ACCESS_RADIUS
+        sources = self.nearby_stops(start_lat, start_lon, radius)
+        targets = self.nearby_stops(end_lat, end_lon, radius)
+        if not sources or not targets:
+            return []
+
+        journeys = raptor.search(sources, targets, departure, max_rounds)
+        return [self._format(j, sources, departure, (start_lat, start_lon), (end_lat, end_lon)) for j in journeys]
+
+    def reach(
+        self,
+        lat: float,
+        lon: float,
+        max_seconds: int,
+        departure: datetime = None,
+        max_walking_distance: float = None,
+        max_rounds: int = 4
+    ) -> Dict[int, int]:
+        """从坐标出发max_seconds内可乘公交/地铁到达的站点 -> 自出发起的秒数（含起点步行接驳）"""
+        raptor = self.raptor
+        if raptor is None:
+            return {}
+        departure = departure or datetime.now()
+        if departure.tzinfo is not None:
+            departure = departure.astimezone().replace(tzinfo=None)
+        sources = self.nearby_stops(lat, lon, max_walking_distance or settings.TRANSIT_ACCESS_RADIUS)
+        if not sources:
+            return {}
+        return raptor.reach(sources, departure, max_seconds, max_rounds)
+
+    def matrix(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+        departure: datetime = None,
+        max_walking_distance: float = None,
+        max_rounds: int = 4
+    ) -> List[List[Optional[Dict[str, Any]]]]:
+        """
+        多起点多终点的公交行程汇总，每个起点只做一次RAPTOR搜索
+        单元格为{"duration": 秒, "distance": 米, "ride_distance": {"bus": 米, "subway": 米}}，不可达为None
+        """
+        raptor = self.raptor
+        if raptor is None:
+            return [[None] * len(destinations) for _ in origins]
+        departure = departure or datetime.now()
+        if departure.tzinfo is not None:
+            departure = departure.astimezone().replace(tzinfo=None)
+        radius = max_walking_distance or settings.TRANSIT_ACCESS_RADIUS
+        target_sets = [self.nearby_stops(lat, lon, radius) for lat, lon in destinations]
+
+        rows = []
+        for lat, lon in origins:
+            sources = self.nearby_stops(lat, lon, radius)
+            if not sources:
+                rows.append([None] * len(destinations))
+                continue
+            journeys = raptor.search_many(sources, target_sets, departure, max_rounds)
+            rows.append([None if j is None else self._summarize(j, sources, departure) for j in journeys])
+        return rows
+
+    def _summarize(self, journey, sources, departure) -> Dict[str, Any]:
+        """行程的总耗时、总距离和各交通方式乘车距离"""
+        tt = self.raptor.timetable
+        legs = journey["legs"]
+        walk_seconds = sources[legs[0]["from_stop"]] + journey["egress_seconds"]
+        ride_distance = {"bus": 0.0, "subway": 0.0}
+        for leg in legs:
+            if leg["type"] == "walk":
+                walk_seconds += leg["duration"]
+                continue
+            stops = leg["stops"]
+            lats, lons = tt.stop_lat[stops], tt.stop_lon[stops]
+            mode = "subway" if int(tt.pattern_route_types[leg["pattern"]]) in SUBWAY_ROUTE_TYPES else "bus"
+            ride_distance[mode] += float(haversine_np(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
+        return {
+            "duration": (journey["arrival"] - departure).total_seconds(),
+            "distance": walk_seconds * FOOTPATH_SPEED + sum(ride_distance.values()),
+            "ride_distance": ride_distance
+        }
+
+    def _format(self, journey, sources, departure, origin, destination) -> Dict[str, Any]:
+        """将RAPTOR结果转换为带站点名称、时刻、距离的行程"""
+        tt = self.raptor.timetable
+        day_start = datetime.combine(departure.date(), datetime.min.time())
+
+        def clock(seconds: int) -> str:
+            return (day_start + timedelta(seconds=seconds)).strftime("%H:%M")
+
+        def stop_info(stop: int) -> Dict[str, Any]:
+            return {
+                "id": str(tt.stop_ids[stop]),
+                "name": str(tt.stop_names[stop]),
+                "location": {"lat": float(tt.stop_lat[stop]), "lon": float(tt.stop_lon[stop])}
+            }
+
+        legs = journey["legs"]
+        first_stop = legs[0]["from_stop"]
+        segments = [_walk_leg(origin, (tt.stop_lat[first_stop], tt.stop_lon[first_stop]), sources[first_stop])]
+        for leg in legs:
+            if leg["type"] == "walk":
+                a, b = leg["from_stop"], leg["to_stop"]
+                segments.append(_walk_leg((tt.stop_lat[a], tt.stop_lon[a]), (tt.stop_lat[b], tt.stop_lon[b]), leg["duration"]))
+                continue
+            stops = leg["stops"]
+            lats, lons = tt.stop_lat[stops], tt.stop_lon[stops]
+            distance = float(haversine_np(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum()) if len(stops) > 1 else 0.0
+            route_type = int(tt.pattern_route_types[leg["pattern"]])
+            segments.append({
+                "mode": "subway" if route_type in SUBWAY_ROUTE_TYPES else "bus",
+                "route": str(tt.pattern_route_names[leg["pattern"]]),
+                "distance": round(distance, 1),
+                "duration": round((leg["arrival"] - leg["departure"]) / 60, 1),
+                "departure_time": clock(leg["departure"]),
+                "arrival_time": clock(leg["arrival"]),
+                "start_station": stop_info(leg["from_stop"]),
+                "end_station": stop_info(leg["to_stop"]),
+                "num_stops": len(stops) - 1
+            })
+        last_stop = journey["egress_stop"]
+        segments.append(_walk_leg((tt.stop_lat[last_stop], tt.stop_lon[last_stop]), destination, journey["egress_seconds"]))
+
+        arrival = journey["arrival"]
+        return {
+            "departure_time": departure.strftime("%H:%M"),
+            "arrival_time": arrival.strftime("%H:%M"),
+            "distance": round(sum(s["distance"] for s in segments), 1),
+            "duration": round((arrival - departure).total_seconds() / 60, 1),
+            "transfers": journey["transfers"],
+            "segments": segments
+        }
+
+def _walk_leg(start, end, seconds: int) -> Dict[str, Any]:
+    distance = float(haversine_np(start[0], start[1], end[0], end[1]))
+    return {
+        "mode": "walking",
+        "distance": round(distance, 1),
+        "duration": round(seconds / 60, 1),
+        "start_point": {"lat": float(start[0]), "lon": float(start[1])},
+        "end_point": {"lat": float(end[0]), "lon": float(end[1])}
+    }
+
+transit_router = TransitRouter()
@@ -0,0 +1,97 @@
+"""
+按上游主机限流的令牌桶调度器，进程内共享
+"""
+import asyncio
+import time
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+from ..config.settings import settings
+
+class RateLimitExceeded(Exception):
+    """预计排队时间超过最大等待时间"""
+
+class TokenBucket:
+    """
+    令牌桶：rate为每秒补充的令牌数，burst为桶容量
+    以预约方式实现：每个请求按到达顺序预约下一个可用令牌的时刻，
+    令牌充足时立即执行，不足时按先来先到的顺序等待
+    """
+
+    def __init__(self, rate: float, burst: int = 1, max_wait: float = 10.0):
+        self.interval = 1.0 / rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._next_at = 0.0  # 桶被取空后下一个令牌的理论时刻
+        self.waiting = 0
+        self.stats = {"acquired": 0, "queued": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0, "max_queue_depth": 0}
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回实际等待秒数；预计等待超过max_wait时抛出RateLimitExceeded"""
+        now = time.monotonic()
+        next_at = max(self._next_at, now)
+        # 桶中最多可预存burst个令牌
+        wait = next_at - (self.burst - 1) * self.interval - now
+        if wait > self.max_wait:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded(f"预计等待{wait:.1f}秒，超过上限{self.max_wait}秒")
+        self._next_at = next_at + self.interval
+        self.stats["acquired"] += 1
+        if wait <= 0:
+            return 0.0
+
+        self.stats["queued"] += 1
+        self.waiting += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.waiting)
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+        self.stats["total_wait"] += wait
+        self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+        return wait
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "total_wait": round(self.stats["total_wait"], 3),
+            "max_wait": round(self.stats["max_wait"], 3),
+            "avg_wait": round(self.stats["total_wait"] / self.stats["acquired"], 3) if self.stats["acquired"] else 0.0,
+            "queue_depth": self.waiting
+        }
+
+class RateLimiter:
+    """按主机名管理令牌桶，未配置的主机不限流"""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def configure(self, host: str, rate: float, burst: int = 1, max_wait: float = 10.0) -> None:
+        self._buckets[host] = TokenBucket(rate, burst, max_wait)
+
+    def bucket(self, url: str) -> Optional[TokenBucket]:
+        return self._buckets.get(urlparse(url).hostname or url)
+
+    async def acquire(self, url: str) -> float:
+        """请求url前调用，按其主机的令牌桶排队"""
+        bucket = self.bucket(url)
+        if bucket is None:
+            return 0.0
+        return await bucket.acquire()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {host: bucket.get_stats() for host, bucket in self._buckets.items()}
+
+rate_limiter = RateLimiter()
+# Nominatim使用政策：每秒最多1个请求
+rate_limiter.configure(
+    "nominatim.openstreetmap.org",
+    settings.NOMINATIM_RATE_LIMIT,
+    settings.NOMINATIM_BURST,
+    settings.NOMINATIM_MAX_WAIT
+)
+# OpenWeatherMap免费版：每分钟最多60个请求
+rate_limiter.configure(
+    "api.openweathermap.org",
+    settings.WEATHER_RATE_LIMIT,
+    settings.WEATHER_BURST
+)
@@ -0,0 +1,98 @@
+"""
+路线结果缓存：起终点按geohash网格量化，过期后先返回旧结果再后台刷新（stale-while-revalidate）
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Awaitable, Tuple
+from ..config.settings import settings
+from .geo import geohash
+
+RouteKey = Tuple[str, str, str]
+
+class RouteCache:
+    """按(出行方式, 起点网格, 终点网格)缓存路线规划结果，LRU限制条目数"""
+
+    def __init__(self, max_size: int = None, fresh_ttl: float = None, stale_ttl: float = None, precision: int = None):
+        self.max_size = max_size or settings.ROUTE_CACHE_SIZE
+        self.fresh_ttl = fresh_ttl or settings.ROUTE_CACHE_FRESH_TTL
+        self.stale_ttl = stale_ttl or settings.ROUTE_CACHE_STALE_TTL
+        self.precision = precision or settings.ROUTE_CACHE_PRECISION
+        self._entries: "OrderedDict[RouteKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[RouteKey, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+
+    def key(self, mode: str, origin_lat: float, origin_lon: float, dest_lat: float, dest_lon: float) -> RouteKey:
+        return (
+            mode,
+            geohash(origin_lat, origin_lon, self.precision),
+            geohash(dest_lat, dest_lon, self.precision)
+        )
+
+    async def get_or_fetch(
+        self,
+        key: RouteKey,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        cacheable: Callable[[Dict[str, Any]], bool]
+    ) -> Dict[str, Any]:
+        """新鲜结果直接返回；过期但在容忍期内的结果立即返回并后台刷新；否则同步请求上游"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.fresh_ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if age < self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self._fetch(key, fetch, cacheable).add_done_callback(_refresh_done)
+                    self.stats["refreshes"] += 1
+                return entry[1]
+            del self._entries[key]
+
+        self.stats["misses"] += 1
+        # 任一调用方被取消（如客户端断开）都不会取消共享的上游请求
+        return await asyncio.shield(self._fetch(key, fetch, cacheable))
+
+    def _fetch(self, key: RouteKey, fetch, cacheable) -> asyncio.Task:
+        """请求上游并写入缓存，同一键同时只有一个上游请求"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_route(key, fetch, cacheable))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+        return task
+
+    async def _fetch_route(self, key: RouteKey, fetch, cacheable) -> Dict[str, Any]:
+        result = await fetch()
+        if cacheable(result):
+            self._put(key, result)
+        return result
+
+    def _fetch_done(self, key: RouteKey, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # 所有等待者都已取消时，取出异常避免“异常未被获取”的警告
+        if not task.cancelled():
+            task.exception()
+
+    def _put(self, key: RouteKey, result: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": round((self.stats["hits"] + self.stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        }
+
+def _refresh_done(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        print(f"路线缓存后台刷新失败：{str(task.exception())}")
+
+route_cache = RouteCache()
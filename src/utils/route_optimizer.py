@@ -1,110 +1,267 @@
-from typing import List, Dict, Any
-import random
+"""
+路线推荐：生成步行、骑行、共享单车、公交/地铁候选方案，
+按耗时、碳排放、步行距离、换乘次数做Pareto筛选，并根据实时天气与交通状况调整
+"""
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 import datetime
+from .geo import parse_lat_lon, haversine
+from .raptor import transit_router
+from .routing_engine import routing_engine
+from .osm_service import osm_service
+from .carbon import carbon_engine
 
-class RouteOptimizer:
-    def __init__(self):
-        self.traffic_data = {}  # 模拟交通数据
-        self.weather_data = {}  # 模拟天气数据
+# 无本地路网时按直线距离估算：绕行系数与平均速度（公里/小时）
+DETOUR_FACTOR = 1.3
+STREET_SPEEDS = {"walking": 4.7, "cycling": 15.0}
+
+# 直达步行/骑行方案的最大直线距离（公里），超过则不生成
+MAX_DIRECT_DISTANCE = {"walking": 5.0, "cycling": 20.0}
+
+# 收缩层次配置
+STREET_PROFILES = {"walking": "foot", "cycling": "bike"}
+
+# 户外出行方式，天气不佳时不推荐以这些方式为主的方案
+OUTDOOR_MODES = ("cycling", "shared_bike")
+TRANSIT_MODES = ("bus", "subway")
+
+# 不适合户外出行的天气描述关键词与风速上限（米/秒，6级风）
+BAD_WEATHER_KEYWORDS = ("雨", "雪", "雷", "冰雹", "霾", "沙尘")
+MAX_OUTDOOR_WIND_SPEED = 10.8
 
+# 排序时比较的目标：耗时（分钟）、碳排放（千克）、步行距离（公里）、换乘次数
+Objectives = Tuple[float, float, float, int]
+
+# 前沿内排序时各目标（归一化后）的权重
+RANK_WEIGHTS = (1.0, 0.5, 0.3, 0.2)
+
+class RouteOptimizer:
     def get_route_recommendations(
         self,
         start_location: str,
         end_location: str,
         departure_time: datetime.datetime = None,
-        consider_weather: bool = True,
-        consider_traffic: bool = True
+        weather: Optional[Dict[str, Any]] = None,
+        traffic: Optional[Dict[str, Any]] = None,
+        top_k: int = 5
     ) -> List[Dict[str, Any]]:
         """
-        获取路线推荐
+        获取路线推荐：保留不被其他方案支配的方案，按归一化目标之和排序后返回前top_k个
+        weather、traffic为天气服务和交通服务的查询结果，为None时不做相应调整
+        """
+        front: List[Tuple[Objectives, Dict[str, Any]]] = []
+        for route in self._candidates(start_location, end_location, departure_time):
+            route = self._adjust(route, weather, traffic)
+            if route is not None:
+                _insert(front, route)
+
+        routes = [route for _, route in sorted(front, key=_rank_key(front))[:top_k]]
+        for i, route in enumerate(routes, start=1):
+            route["id"] = i
+        return routes
+
+    def iter_route_recommendations(
+        self,
+        start_location: str,
+        end_location: str,
+        departure_time: datetime.datetime = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐个生成候选路线，计算代价低的先生成：直达步行/骑行无需搜索，共享单车需要路网搜索，公交/地铁需要时刻表搜索
+        天气与交通调整不在此处进行，由调用方另行标注
         """
-        # 模拟路线推荐
-        routes = [
-            {
-                "id": 1,
-                "total_distance": 5.2,
-                "total_duration": 25,
-                "total_carbon_emission": 0.8,
-                "segments": [
-                    {
-                        "mode": "walking",
-                        "distance": 0.5,
-                        "duration": 6,
-                        "instructions": ["步行到公交站"]
-                    },
-                    {
-                        "mode": "bus",
-                        "distance": 4.2,
-                        "duration": 15,
-                        "instructions": ["乘坐102路公交车"]
-                    },
-                    {
-                        "mode": "walking",
-                        "distance": 0.5,
-                        "duration": 4,
-                        "instructions": ["步行到目的地"]
-                    }
-                ]
-            },
-            {
-                "id": 2,
-                "total_distance": 4.8,
-                "total_duration": 35,
-                "total_carbon_emission": 0.2,
-                "segments": [
-                    {
-                        "mode": "walking",
-                        "distance": 1.2,
-                        "duration": 15,
-                        "instructions": ["步行到地铁站"]
-                    },
-                    {
-                        "mode": "subway",
-                        "distance": 3.0,
-                        "duration": 12,
-                        "instructions": ["乘坐1号线地铁"]
-                    },
-                    {
-                        "mode": "walking",
-                        "distance": 0.6,
-                        "duration": 8,
-                        "instructions": ["步行到目的地"]
-                    }
-                ]
-            },
-            {
-                "id": 3,
-                "total_distance": 5.0,
-                "total_duration": 20,
-                "total_carbon_emission": 0.0,
-                "segments": [
-                    {
-                        "mode": "cycling",
-                        "distance": 5.0,
-                        "duration": 20,
-                        "instructions": ["骑行到目的地"]
-                    }
-                ]
-            }
-        ]
-
-        # 根据天气和交通状况调整路线
-        if consider_weather and self._is_bad_weather():
-            routes = [r for r in routes if not any(s["mode"] in ["cycling", "walking"] for s in r["segments"])]
-        
-        if consider_traffic and self._is_traffic_congestion():
+        for route_id, route in enumerate(self._candidates(start_location, end_location, departure_time), start=1):
+            route["id"] = route_id
+            yield route
+
+    def annotate_weather(self, routes: List[Dict[str, Any]], weather: Dict[str, Any]) -> Dict[str, Any]:
+        """天气标注：天气不适合户外时，列出以骑行/步行为主的路线"""
+        suitable = not self._is_bad_weather(weather)
+        return {
+            "weather": weather,
+            "is_suitable_for_outdoor": suitable,
+            "affected_routes": [] if suitable else [r["id"] for r in routes if _is_outdoor(r)]
+        }
+
+    def annotate_traffic(self, routes: List[Dict[str, Any]], traffic: Dict[str, Any]) -> Dict[str, Any]:
+        """交通标注：按拥堵系数给出公交路段受影响路线的调整后总时长"""
+        factor = traffic.get("congestion_factor", 1.0)
+        adjustments = []
+        if factor > 1.0:
             for route in routes:
-                for segment in route["segments"]:
-                    if segment["mode"] in ["bus"]:
-                        segment["duration"] *= 1.5  # 拥堵时间延长50%
-                route["total_duration"] = sum(s["duration"] for s in route["segments"])
+                if any(s["mode"] == "bus" for s in route["segments"]):
+                    adjustments.append({
+                        "route_id": route["id"],
+                        "total_duration": round(sum(
+                            s["duration"] * (factor if s["mode"] == "bus" else 1.0) for s in route["segments"]
+                        ), 1)
+                    })
+        return {"traffic": traffic, "adjustments": adjustments}
 
+    def _candidates(
+        self,
+        start_location: str,
+        end_location: str,
+        departure_time: Optional[datetime.datetime]
+    ) -> Iterator[Dict[str, Any]]:
+        """按计算代价从低到高生成候选方案，坐标无法解析时抛出ValueError"""
+        start_lat, start_lon = parse_lat_lon(start_location)
+        end_lat, end_lon = parse_lat_lon(end_location)
+        straight = haversine(start_lat, start_lon, end_lat, end_lon) / 1000
+
+        for mode in ("walking", "cycling"):
+            if straight <= MAX_DIRECT_DISTANCE[mode]:
+                yield _finish(self._street_route(mode, start_lat, start_lon, end_lat, end_lon, straight))
+
+        if routing_engine.is_available:
+            route = self._shared_bike_route(start_lat, start_lon, end_lat, end_lon)
+            if route is not None:
+                yield _finish(route)
+
+        if transit_router.is_available:
+            for route in self._timetable_routes(start_lat, start_lon, end_lat, end_lon, departure_time):
+                yield _finish(route)
+
+    def _street_route(self, mode: str, start_lat: float, start_lon: float, end_lat: float, end_lon: float, straight: float) -> Dict[str, Any]:
+        """直达步行/骑行方案，有收缩层次时按路网计算，否则按直线距离估算"""
+        hierarchy = osm_service.get_hierarchy(STREET_PROFILES[mode])
+        route = hierarchy.route(start_lat, start_lon, end_lat, end_lon) if hierarchy is not None else None
+        # 路网距离短于直线距离说明起终点不在路网覆盖范围内
+        if route is not None and route["distance"] >= straight * 1000:
+            distance, duration = route["distance"] / 1000, route["duration"] / 60
+        else:
+            distance = straight * DETOUR_FACTOR
+            duration = distance / STREET_SPEEDS[mode] * 60
+        return {
+            "total_distance": round(distance, 2),
+            "total_duration": round(duration, 1),
+            "segments": [{
+                "mode": mode,
+                "distance": round(distance, 2),
+                "duration": round(duration, 1),
+                "instructions": ["步行到目的地" if mode == "walking" else "骑行到目的地"]
+            }]
+        }
+
+    def _shared_bike_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> Optional[Dict[str, Any]]:
+        """基于本地路网的步行-共享单车-步行方案，没有合适的单车站点时返回None"""
+        result = routing_engine.route(start_lat, start_lon, end_lat, end_lon, ["cycling"])
+        if result is None or not any(s["mode"] == "cycling" for s in result["segments"]):
+            return None
+        segments = []
+        for segment in result["segments"]:
+            if segment["mode"] == "cycling":
+                mode, instruction = "shared_bike", "骑共享单车"
+            else:
+                mode = "walking"
+                instruction = "步行到单车站点" if not segments else "步行到目的地"
+            segments.append({
+                "mode": mode,
+                "distance": round(segment["distance"] / 1000, 2),
+                "duration": segment["duration"],
+                "instructions": [instruction]
+            })
+        return {
+            "total_distance": round(result["distance"] / 1000, 2),
+            "total_duration": result["duration"],
+            "segments": segments
+        }
+
+    def _timetable_routes(
+        self,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+        departure_time: Optional[datetime.datetime]
+    ) -> List[Dict[str, Any]]:
+        """基于GTFS时刻表的公交/地铁方案（RAPTOR结果已按到达时间与换乘次数做过Pareto筛选）"""
+        routes = []
+        for itinerary in transit_router.plan(start_lat, start_lon, end_lat, end_lon, departure_time):
+            segments = []
+            for segment in itinerary["segments"]:
+                if segment["mode"] == "walking":
+                    instruction = "步行到公交站" if not segments else "步行到目的地" if segment is itinerary["segments"][-1] else "步行换乘"
+                else:
+                    line = segment["route"] + ("路公交车" if segment["mode"] == "bus" else "号线地铁" if segment["route"].isdigit() else "")
+                    instruction = (
+                        f"{segment['departure_time']} 在{segment['start_station']['name']}乘坐{line}，"
+                        f"经{segment['num_stops']}站到{segment['end_station']['name']}下车"
+                    )
+                segments.append({
+                    "mode": segment["mode"],
+                    "distance": round(segment["distance"] / 1000, 2),
+                    "duration": segment["duration"],
+                    "instructions": [instruction]
+                })
+            routes.append({
+                "total_distance": round(itinerary["distance"] / 1000, 2),
+                "total_duration": itinerary["duration"],
+                "departure_time": itinerary["departure_time"],
+                "arrival_time": itinerary["arrival_time"],
+                "transfers": itinerary["transfers"],
+                "segments": segments
+            })
         return routes
 
-    def _is_bad_weather(self) -> bool:
-        """模拟天气状况检查"""
-        return random.random() < 0.3  # 30%概率是坏天气
+    def _adjust(self, route: Dict[str, Any], weather: Optional[Dict[str, Any]], traffic: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """按天气排除户外方案、按拥堵系数延长公交耗时，被排除时返回None"""
+        if weather is not None:
+            if _is_outdoor(route) and self._is_bad_weather(weather):
+                return None
+            route["weather_condition"] = weather.get("weather_description")
+        if traffic is not None:
+            factor = traffic.get("congestion_factor", 1.0)
+            if factor > 1.0 and any(s["mode"] == "bus" for s in route["segments"]):
+                for segment in route["segments"]:
+                    if segment["mode"] == "bus":
+                        segment["duration"] = round(segment["duration"] * factor, 1)
+                route["total_duration"] = round(sum(s["duration"] for s in route["segments"]), 1)
+            route["traffic_condition"] = traffic.get("condition")
+        return route
+
+    def _is_bad_weather(self, weather: Dict[str, Any]) -> bool:
+        """天气是否不适合户外出行：优先使用天气服务给出的判断，否则按天气描述和风速判断"""
+        if "is_suitable_for_outdoor" in weather:
+            return not weather["is_suitable_for_outdoor"]
+        description = weather.get("weather_description") or ""
+        if any(keyword in description for keyword in BAD_WEATHER_KEYWORDS):
+            return True
+        return (weather.get("wind_speed") or 0) > MAX_OUTDOOR_WIND_SPEED
+
+def _is_outdoor(route: Dict[str, Any]) -> bool:
+    """以步行或骑行为主的方案：含骑行路段，或不含任何公交/地铁路段"""
+    modes = {s["mode"] for s in route["segments"]}
+    return bool(modes & set(OUTDOOR_MODES)) or not modes & set(TRANSIT_MODES)
+
+def _finish(route: Dict[str, Any]) -> Dict[str, Any]:
+    """补充碳排放、步行距离、换乘次数"""
+    segments = route["segments"]
+    route["total_carbon_emission"] = round(carbon_engine.route_emission(segments), 3)
+    route["walking_distance"] = round(sum((s["distance"] for s in segments if s["mode"] == "walking"), 0.0), 2)
+    route.setdefault("transfers", max(sum(1 for s in segments if s["mode"] != "walking") - 1, 0))
+    return route
+
+def _objectives(route: Dict[str, Any]) -> Objectives:
+    return (route["total_duration"], route["total_carbon_emission"], route["walking_distance"], route["transfers"])
+
+def _dominates(a: Objectives, b: Objectives) -> bool:
+    return all(x <= y for x, y in zip(a, b)) and a != b
+
+def _insert(front: List[Tuple[Objectives, Dict[str, Any]]], route: Dict[str, Any]) -> None:
+    """加入Pareto前沿：被支配（或与已有方案目标完全相同）的方案直接丢弃，被新方案支配的已有方案移除"""
+    objectives = _objectives(route)
+    if any(_dominates(other, objectives) or other == objectives for other, _ in front):
+        return
+    front[:] = [(other, r) for other, r in front if not _dominates(objectives, other)]
+    front.append((objectives, route))
+
+def _rank_key(front: List[Tuple[Objectives, Dict[str, Any]]]):
+    """各目标除以前沿中的最大值后加权求和，相同时依次比较各目标与方式序列，保证结果确定"""
+    scales = [max(objectives[i] for objectives, _ in front) or 1 for i in range(4)] if front else [1] * 4
+
+    def key(item: Tuple[Objectives, Dict[str, Any]]):
+        objectives, route = item
+        score = sum(weight * value / scale for weight, value, scale in zip(RANK_WEIGHTS, objectives, scales))
+        return (round(score, 9), objectives, [s["mode"] for s in route["segments"]])
 
-    def _is_traffic_congestion(self) -> bool:
-        """模拟交通拥堵检查"""
-        return random.random() < 0.4  # 40%概率是拥堵状态 
\ No newline at end of file
+    return key
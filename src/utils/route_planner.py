@@ -1,60 +1,101 @@
-from typing import Dict, List, Any
-import aiohttp
-import random
+from typing import Dict, List, Any, Optional
+import asyncio
 from datetime import datetime
+from ..config.settings import settings
+from .deadline import with_deadline
+from .geo import haversine
+from .overpass_cache import overpass_cache
+from .raptor import transit_router
+from .routing_engine import routing_engine
+from .routing_graph import NODE_BIKE_STATION, NODE_BUS_STOP, NODE_SUBWAY_STATION
+from .spatial_index import poi_index
+
+def _check_limit(limit: Optional[int]) -> None:
+    """limit为None表示不限条数，否则须为正整数"""
+    if limit is not None and limit < 1:
+        raise ValueError("limit必须为正整数")
 
 class RoutePlanner:
     def __init__(self):
         self.osrm_url = "https://router.project-osrm.org/route/v1"
-        self.overpass_url = "https://overpass-api.de/api/interpreter"
         self.transit_modes = ["walking", "cycling", "bus", "subway"]
     
-    async def get_transit_stops(self, lat: float, lon: float, radius: int = 1000) -> List[Dict]:
-        """获取指定位置周边的公交和地铁站"""
-        query = f"""
-        [out:json];
-        (
-          node["highway"="bus_stop"](around:{radius},{lat},{lon});
-          node["railway"="station"](around:{radius},{lat},{lon});
-        );
-        out body;
-        """
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.overpass_url, params={"data": query}) as response:
-                data = await response.json()
-                return [{
-                    "id": element["id"],
-                    "type": "bus_stop" if element.get("tags", {}).get("highway") == "bus_stop" else "subway",
-                    "name": element.get("tags", {}).get("name", "未命名站点"),
-                    "location": {
-                        "lat": element["lat"],
-                        "lon": element["lon"]
-                    }
-                } for element in data.get("elements", [])]
+    async def get_transit_stops(self, lat: float, lon: float, radius: int = 1000, limit: Optional[int] = None) -> List[Dict]:
+        """获取指定位置周边的公交和地铁站（按距离排序）"""
+        _check_limit(limit)
+        if poi_index.is_loaded:
+            return self._query_index(lat, lon, radius, limit, ("bus_stop", "subway"))
+        if routing_engine.graph is not None:
+            return self._graph_stations(lat, lon, radius, limit, transit=True)
+
+        # 未加载本地数据时查询Overpass（经瓦片缓存）
+        elements = await overpass_cache.elements_around(lat, lon, radius)
+        return self._sort_by_distance(lat, lon, limit, [{
+            "id": element["id"],
+            "type": "bus_stop" if element.get("tags", {}).get("highway") == "bus_stop" else "subway",
+            "name": element.get("tags", {}).get("name", "未命名站点"),
+            "location": {
+                "lat": element["lat"],
+                "lon": element["lon"]
+            }
+        } for element in elements if element.get("tags", {}).get("highway") == "bus_stop" or element.get("tags", {}).get("railway") == "station"])
+
+    async def get_bike_stations(self, lat: float, lon: float, radius: int = 1000, limit: Optional[int] = None) -> List[Dict]:
+        """获取共享单车站点（按距离排序）"""
+        _check_limit(limit)
+        if poi_index.is_loaded:
+            return self._query_index(lat, lon, radius, limit, ("bike",))
+        if routing_engine.graph is not None:
+            return self._graph_stations(lat, lon, radius, limit, transit=False)
+
+        # 未加载本地数据时查询Overpass（经瓦片缓存）
+        elements = await overpass_cache.elements_around(lat, lon, radius)
+        return self._sort_by_distance(lat, lon, limit, [{
+            "id": element["id"],
+            "name": element.get("tags", {}).get("name", "共享单车站点"),
+            "operator": element.get("tags", {}).get("operator", "未知运营商"),
+            "location": {
+                "lat": element["lat"],
+                "lon": element["lon"]
+            }
+        } for element in elements if element.get("tags", {}).get("amenity") == "bicycle_rental"])
+
+    @staticmethod
+    def _query_index(lat: float, lon: float, radius: float, limit: Optional[int], categories) -> List[Dict]:
+        """在内存索引中查询：指定limit时为半径内的k近邻，否则为半径内全部站点"""
+        if limit is not None:
+            return poi_index.nearest(lat, lon, limit, categories, max_distance=radius)
+        return poi_index.within(lat, lon, radius, categories)
+
+    @staticmethod
+    def _sort_by_distance(lat: float, lon: float, limit: Optional[int], stations: List[Dict]) -> List[Dict]:
+        """Overpass结果补充距离并排序，与索引查询结果保持一致"""
+        for station in stations:
+            station["distance"] = round(haversine(lat, lon, station["location"]["lat"], station["location"]["lon"]), 1)
+        stations.sort(key=lambda s: s["distance"])
+        return stations[:limit] if limit is not None else stations
 
-    async def get_bike_stations(self, lat: float, lon: float, radius: int = 1000) -> List[Dict]:
-        """获取共享单车站点"""
-        query = f"""
-        [out:json];
-        (
-          node["amenity"="bicycle_rental"](around:{radius},{lat},{lon});
-        );
-        out body;
-        """
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.overpass_url, params={"data": query}) as response:
-                data = await response.json()
-                return [{
-                    "id": element["id"],
-                    "name": element.get("tags", {}).get("name", "共享单车站点"),
-                    "operator": element.get("tags", {}).get("operator", "未知运营商"),
-                    "location": {
-                        "lat": element["lat"],
-                        "lon": element["lon"]
-                    }
-                } for element in data.get("elements", [])]
+    @staticmethod
+    def _graph_stations(lat: float, lon: float, radius: float, limit: Optional[int], transit: bool) -> List[Dict]:
+        """未导入站点快照时，使用路网图中的站点节点"""
+        graph = routing_engine.graph
+        if transit:
+            stations = [{
+                "id": poi["id"],
+                "type": "bus_stop" if poi["flags"] & NODE_BUS_STOP else "subway",
+                "name": poi["name"] or "未命名站点",
+                "location": poi["location"],
+                "distance": round(poi["distance"], 1)
+            } for poi in graph.nearby_pois(lat, lon, radius, NODE_BUS_STOP | NODE_SUBWAY_STATION)]
+        else:
+            stations = [{
+                "id": poi["id"],
+                "name": poi["name"] or "共享单车站点",
+                "operator": "未知运营商",
+                "location": poi["location"],
+                "distance": round(poi["distance"], 1)
+            } for poi in graph.nearby_pois(lat, lon, radius, NODE_BIKE_STATION)]
+        return stations[:limit] if limit is not None else stations
 
     async def calculate_multi_modal_route(
         self,
@@ -62,7 +103,8 @@ class RoutePlanner:
         start_lon: float,
         end_lat: float,
         end_lon: float,
-        preferences: Dict = None
+        preferences: Dict = None,
+        departure_time: datetime = None
     ) -> Dict[str, Any]:
         """计算多模式路线"""
         if preferences is None:
@@ -71,67 +113,67 @@ class RoutePlanner:
                 "preferred_modes": ["walking", "bus", "subway"]  # 偏好的交通方式
             }
 
-        # 获取周边公交站点
-        nearby_transit = await self.get_transit_stops(start_lat, start_lon, 1000)
-        
-        # 获取周边共享单车站点
-        nearby_bikes = await self.get_bike_stations(start_lat, start_lon, 1000)
+        modes = preferences.get("preferred_modes", ["walking"])
+        transit_modes = {m for m in modes if m in ("bus", "subway")}
+        use_timetable = bool(transit_modes) and transit_router.is_available
+        graph = routing_engine.graph
+        if graph is None and not use_timetable:
+            return {"status": "0", "error": "本地路网数据未加载"}
 
-        # 根据偏好选择路线
-        routes = []
-        total_distance = 0
-        total_duration = 0
-        
-        # 模拟路段生成（实际项目中应该根据真实数据计算）
-        for mode in preferences["preferred_modes"]:
-            if mode == "walking":
-                segment = {
-                    "mode": "walking",
-                    "distance": random.uniform(500, 1500),
-                    "duration": random.uniform(10, 30),
-                    "start_point": {"lat": start_lat, "lon": start_lon},
-                    "end_point": {"lat": start_lat + 0.01, "lon": start_lon + 0.01}
-                }
-            elif mode == "bus":
-                if nearby_transit:
-                    segment = {
-                        "mode": "bus",
-                        "distance": random.uniform(2000, 5000),
-                        "duration": random.uniform(15, 45),
-                        "start_station": nearby_transit[0],
-                        "end_station": {
-                            "name": "目标公交站",
-                            "location": {"lat": end_lat - 0.01, "lon": end_lon - 0.01}
-                        }
-                    }
-            elif mode == "subway":
-                if nearby_transit:
-                    segment = {
-                        "mode": "subway",
-                        "distance": random.uniform(5000, 15000),
-                        "duration": random.uniform(20, 60),
-                        "start_station": nearby_transit[0],
-                        "end_station": {
-                            "name": "目标地铁站",
-                            "location": {"lat": end_lat - 0.005, "lon": end_lon - 0.005}
-                        }
-                    }
-            
-            if "segment" in locals():
-                routes.append(segment)
-                total_distance += segment["distance"]
-                total_duration += segment["duration"]
-                del segment
+        # 各依赖并发执行，每个依赖有独立的截止时间；超时的部分被跳过，其余结果照常返回
+        loop = asyncio.get_running_loop()
+        skipped: List[str] = []
+        tasks = []
+        if use_timetable:
+            # 公交/地铁按时刻表规划，考虑出发时间
+            access_radius = min(settings.TRANSIT_ACCESS_RADIUS, preferences.get("max_walking_distance", settings.TRANSIT_ACCESS_RADIUS))
+            tasks.append(with_deadline(
+                "transit_route",
+                loop.run_in_executor(None, transit_router.plan, start_lat, start_lon, end_lat, end_lon, departure_time, access_radius),
+                settings.ROUTE_TRANSIT_TIMEOUT,
+                skipped,
+                []
+            ))
+        else:
+            tasks.append(asyncio.sleep(0, []))
+        if graph is not None:
+            # 步行/骑行（以及无时刻表时的公交/地铁）在本地路网上计算，不依赖外部服务
+            graph_modes = [m for m in modes if m not in transit_modes] if use_timetable else modes
+            tasks.append(with_deadline(
+                "street_route",
+                loop.run_in_executor(None, routing_engine.route, start_lat, start_lon, end_lat, end_lon, graph_modes),
+                settings.ROUTE_STREET_TIMEOUT,
+                skipped
+            ))
+        else:
+            tasks.append(asyncio.sleep(0, None))
+        # 起点周边的公交站点和共享单车站点
+        tasks.append(with_deadline("nearby_transit", self.get_transit_stops(start_lat, start_lon, 1000), settings.ROUTE_NEARBY_TIMEOUT, skipped, []))
+        tasks.append(with_deadline("nearby_bikes", self.get_bike_stations(start_lat, start_lon, 1000), settings.ROUTE_NEARBY_TIMEOUT, skipped, []))
+        itineraries, street_route, nearby_transit, nearby_bikes = await asyncio.gather(*tasks)
+
+        candidates = [
+            itinerary for itinerary in itineraries
+            if all(s["mode"] == "walking" or s["mode"] in transit_modes for s in itinerary["segments"])
+        ]
+        if street_route is not None:
+            candidates.append(street_route)
+        if not candidates:
+            if "transit_route" in skipped or "street_route" in skipped:
+                return {"status": "0", "error": "路线规划超时", "skipped": skipped}
+            return {"status": "0", "error": "起终点之间无可达路线"}
+        route = min(candidates, key=lambda r: r["duration"])
 
         return {
             "status": "1",
             "route": {
-                "distance": total_distance,
-                "duration": total_duration,
-                "segments": routes,
+                "distance": route["distance"],
+                "duration": route["duration"],
+                "segments": route["segments"],
                 "nearby_transit": nearby_transit,
                 "nearby_bikes": nearby_bikes
-            }
+            },
+            "skipped": skipped
         }
 
 route_planner = RoutePlanner() 
\ No newline at end of file
@@ -1,15 +1,64 @@
-from typing import Dict, Any, List
-import aiohttp
+from typing import Dict, Any, List, Optional
 from ..models.schemas import Location
-import polyline
+import numpy as np
 import random
 from src.config.settings import settings
+from src.utils.http_client import http_client
+from src.utils.route_cache import route_cache
+from src.utils.geometry import parse_amap_polyline, format_geometry
 
 class RouteService:
     def __init__(self):
         self.base_url = "https://restapi.amap.com/v3/direction/driving"
     
-    async def plan_route(self, origin: str, destination: str) -> Dict[str, Any]:
+    async def plan_route(self, origin, destination, zoom: Optional[int] = None, geometry_format: str = "list") -> Dict[str, Any]:
+        """
+        驾车路线规划，origin/destination为"经度,纬度"字符串或Location
+        zoom: 按地图缩放级别简化几何；geometry_format: list/array/encoded
+        """
+        origin = self._format_location(origin)
+        destination = self._format_location(destination)
+        # 相近起终点的结果复用缓存
+        try:
+            origin_lon, origin_lat = map(float, origin.split(","))
+            dest_lon, dest_lat = map(float, destination.split(","))
+        except ValueError:
+            result = await self._plan_route(origin, destination)
+        else:
+            result = await route_cache.get_or_fetch(
+                route_cache.key("driving", origin_lat, origin_lon, dest_lat, dest_lon),
+                lambda: self._plan_route(origin, destination),
+                lambda r: r.get("status") == "success"
+            )
+        return self._render(result, zoom, geometry_format)
+
+    @staticmethod
+    def _render(result: Dict[str, Any], zoom: Optional[int], geometry_format: str) -> Dict[str, Any]:
+        """将内部的坐标数组转换为响应格式"""
+        if result.get("status") != "success":
+            return result
+        return {
+            "status": "success",
+            "distance": result["distance"],
+            "duration": result["duration"],
+            "steps": [
+                {
+                    "instruction": step["instruction"],
+                    "distance": step["distance"],
+                    "polyline": format_geometry(step["geometry"], geometry_format, zoom)
+                } for step in result["steps"]
+            ],
+            "polyline": format_geometry(result["geometry"], geometry_format, zoom)
+        }
+
+    @staticmethod
+    def _format_location(location) -> str:
+        """高德地图坐标格式：经度在前，纬度在后"""
+        if isinstance(location, Location):
+            return f"{location.longitude},{location.latitude}"
+        return location
+
+    async def _plan_route(self, origin: str, destination: str) -> Dict[str, Any]:
         params = {
             "key": settings.AMAP_API_KEY,
             "origin": origin,
@@ -19,12 +68,12 @@ class RouteService:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.base_url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return self._parse_response(data)
-                    return {"status": "error", "message": "API请求失败"}
+            session = http_client.session
+            async with session.get(self.base_url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return self._parse_response(data)
+                return {"status": "error", "message": "API请求失败"}
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
@@ -33,18 +82,24 @@ class RouteService:
             return {"status": "error", "message": data.get("info", "未知错误")}
         
         route = data["route"]["paths"][0]
+        # 几何以numpy数组保存（缓存中也是），输出时再按需简化和格式化
+        steps = [
+            {
+                "instruction": step["instruction"],
+                "distance": step["distance"],
+                "geometry": parse_amap_polyline(step["polyline"])
+            } for step in route["steps"]
+        ]
+        if route.get("polyline"):
+            geometry = parse_amap_polyline(route["polyline"])
+        else:
+            geometry = np.concatenate([step["geometry"] for step in steps]) if steps else np.empty((0, 2))
         return {
             "status": "success",
             "distance": route["distance"],
             "duration": route["duration"],
-            "steps": [
-                {
-                    "instruction": step["instruction"],
-                    "distance": step["distance"],
-                    "polyline": step["polyline"].split(";")
-                } for step in route["steps"]
-            ],
-            "polyline": route["polyline"].split(";")
+            "steps": steps,
+            "geometry": geometry
         }
 
     def _extract_coordinates(self, coords: List[List[float]]) -> List[List[float]]:
@@ -0,0 +1,339 @@
+"""
+本地多模式路径规划引擎（A*搜索，无需外部服务）
+"""
+import heapq
+import os
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from ..config.settings import settings
+from .geo import haversine
+from .routing_graph import (
+    RoutingGraph,
+    EDGE_WALK,
+    EDGE_BIKE,
+    EDGE_BUS,
+    EDGE_SUBWAY,
+    NODE_BIKE_STATION,
+    NODE_BUS_STOP,
+    NODE_SUBWAY_STATION
+)
+
+# 搜索状态中的出行方式编号，与边掩码的位序一致
+WALKING, CYCLING, BUS, SUBWAY = 0, 1, 2, 3
+MODE_NAMES = ["walking", "cycling", "bus", "subway"]
+MODE_EDGE_MASKS = [EDGE_WALK, EDGE_BIKE, EDGE_BUS, EDGE_SUBWAY]
+
+# 各方式平均速度（米/秒）
+MODE_SPEEDS = [1.3, 4.2, 5.5, 10.0]
+
+# 换乘规则：(所需节点类型, 上车/取车耗时秒, 下车/还车耗时秒)
+MODE_TRANSFERS = {
+    CYCLING: (NODE_BIKE_STATION, 60.0, 30.0),
+    BUS: (NODE_BUS_STOP, 300.0, 0.0),
+    SUBWAY: (NODE_SUBWAY_STATION, 240.0, 60.0),
+}
+
+class _Heuristic(dict):
+    """A*启发值：直线距离除以可用方式的最高速度（可采纳），只为实际入堆的节点计算并缓存"""
+
+    def __init__(self, lat, lon, target: int, vmax: float):
+        super().__init__()
+        self._lat, self._lon = lat, lon
+        self._target_lat, self._target_lon = lat[target], lon[target]
+        self._vmax = vmax
+
+    def __missing__(self, node: int) -> float:
+        value = self[node] = haversine(self._lat[node], self._lon[node], self._target_lat, self._target_lon) / self._vmax
+        return value
+
+class MultiModalRouter:
+    """基于CSR路网图的多模式A*路径搜索"""
+
+    def __init__(self, graph: RoutingGraph):
+        self.graph = graph
+        # memoryview按下标取值直接返回Python标量，避免在搜索循环中产生numpy标量
+        self._indptr = memoryview(graph.indptr)
+        self._indices = memoryview(graph.indices)
+        self._length = memoryview(graph.edge_length)
+        self._modes = memoryview(graph.edge_modes)
+        self._flags = memoryview(graph.node_flags)
+        self._lat = memoryview(graph.node_lat)
+        self._lon = memoryview(graph.node_lon)
+
+    def route(
+        self,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+        modes: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """计算起终点间的多模式最快路线，无法到达时返回None"""
+        allowed = [WALKING] + [MODE_NAMES.index(m) for m in modes if m in MODE_NAMES and m != "walking"]
+        graph = self.graph
+        source = graph.nearest_node(start_lat, start_lon, EDGE_WALK)
+        target = graph.nearest_node(end_lat, end_lon, EDGE_WALK)
+
+        states = self._search(source, target, sorted(set(allowed)))
+        if states is None:
+            return None
+
+        segments = self._build_segments(states)
+        # 起终点到路网的接驳步行
+        head = haversine(start_lat, start_lon, graph.node_lat[source], graph.node_lon[source])
+        tail = haversine(end_lat, end_lon, graph.node_lat[target], graph.node_lon[target])
+        if segments and segments[0]["mode"] == "walking":
+            self._extend_walk(segments[0], head, (start_lat, start_lon), at_start=True)
+        elif head > 0:
+            segments.insert(0, self._walk_segment(head, (start_lat, start_lon), segments[0]["start_point"] if segments else (end_lat, end_lon)))
+        if segments and segments[-1]["mode"] == "walking":
+            self._extend_walk(segments[-1], tail, (end_lat, end_lon), at_start=False)
+        elif tail > 0:
+            segments.append(self._walk_segment(tail, segments[-1]["end_point"] if segments else (start_lat, start_lon), (end_lat, end_lon)))
+
+        return {
+            "distance": round(sum(s["distance"] for s in segments), 1),
+            "duration": round(sum(s["duration"] for s in segments), 1),
+            "segments": segments
+        }
+
+    def _search(self, source: int, target: int, allowed: List[int]) -> Optional[List[Tuple[int, int, float]]]:
+        """在(节点, 方式)状态空间上执行A*，返回路径上的(节点, 方式, 累计耗时)序列"""
+        heuristic = _Heuristic(self._lat, self._lon, target, max(MODE_SPEEDS[m] for m in allowed))
+
+        indptr, indices, length, edge_modes, flags = self._indptr, self._indices, self._length, self._modes, self._flags
+        transfers = [(m, MODE_TRANSFERS[m]) for m in allowed if m != WALKING]
+        speeds = MODE_SPEEDS
+        masks = MODE_EDGE_MASKS
+
+        start = source * 4 + WALKING
+        goal = target * 4 + WALKING
+        best = {start: 0.0}
+        parent = {start: -1}
+        heap = [(heuristic[source], 0.0, start)]
+        closed = set()
+        heappush, heappop, inf = heapq.heappush, heapq.heappop, float("inf")
+
+        while heap:
+            _, cost, state = heappop(heap)
+            if state in closed:
+                continue
+            if state == goal:
+                break
+            closed.add(state)
+            node, mode = divmod(state, 4)
+
+            # 同一节点上的方式切换
+            node_flags = flags[node]
+            if mode == WALKING:
+                for other, (required, board, _) in transfers:
+                    if node_flags & required:
+                        self._relax(heap, best, parent, heuristic, node * 4 + other, node, state, cost + board)
+            elif node_flags & MODE_TRANSFERS[mode][0]:
+                self._relax(heap, best, parent, heuristic, node * 4 + WALKING, node, state, cost + MODE_TRANSFERS[mode][2])
+
+            mask = masks[mode]
+            speed = speeds[mode]
+            base = mode
+            for i in range(indptr[node], indptr[node + 1]):
+                if edge_modes[i] & mask:
+                    nxt = indices[i]
+                    nxt_state = nxt * 4 + base
+                    nxt_cost = cost + length[i] / speed
+                    if nxt_cost < best.get(nxt_state, inf):
+                        best[nxt_state] = nxt_cost
+                        parent[nxt_state] = state
+                        heappush(heap, (nxt_cost + heuristic[nxt], nxt_cost, nxt_state))
+        else:
+            return None
+
+        if goal not in best:
+            return None
+        path = []
+        state = goal
+        while state != -1:
+            node, mode = divmod(state, 4)
+            path.append((node, mode, best[state]))
+            state = parent[state]
+        path.reverse()
+        return path
+
+    def one_to_all(self, seeds: Dict[int, float], allowed: List[int], max_cost: float) -> np.ndarray:
+        """
+        从多个起始节点（节点 -> 出发时已用秒数）出发的有界多模式Dijkstra，
+        返回各节点以任一方式到达的最早秒数，超过max_cost或不可达为inf
+        """
+        n = self.graph.num_nodes
+        indptr, indices, length, edge_modes, flags = self._indptr, self._indices, self._length, self._modes, self._flags
+        transfers = [(m, MODE_TRANSFERS[m]) for m in allowed if m != WALKING]
+        speeds = MODE_SPEEDS
+        masks = MODE_EDGE_MASKS
+        inf = float("inf")
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        dist = [inf] * (n * 4)
+        heap = []
+        for node, cost in seeds.items():
+            state = node * 4 + WALKING
+            if cost <= max_cost and cost < dist[state]:
+                dist[state] = cost
+                heap.append((cost, state))
+        heapq.heapify(heap)
+
+        while heap:
+            cost, state = heappop(heap)
+            if cost > dist[state]:
+                continue
+            node, mode = divmod(state, 4)
+
+            # 同一节点上的方式切换
+            node_flags = flags[node]
+            if mode == WALKING:
+                for other, (required, board, _) in transfers:
+                    if node_flags & required:
+                        nxt_cost = cost + board
+                        nxt_state = node * 4 + other
+                        if nxt_cost <= max_cost and nxt_cost < dist[nxt_state]:
+                            dist[nxt_state] = nxt_cost
+                            heappush(heap, (nxt_cost, nxt_state))
+            elif node_flags & MODE_TRANSFERS[mode][0]:
+                nxt_cost = cost + MODE_TRANSFERS[mode][2]
+                nxt_state = node * 4 + WALKING
+                if nxt_cost <= max_cost and nxt_cost < dist[nxt_state]:
+                    dist[nxt_state] = nxt_cost
+                    heappush(heap, (nxt_cost, nxt_state))
+
+            mask = masks[mode]
+            speed = speeds[mode]
+            for i in range(indptr[node], indptr[node + 1]):
+                if edge_modes[i] & mask:
+                    nxt_state = indices[i] * 4 + mode
+                    nxt_cost = cost + length[i] / speed
+                    if nxt_cost <= max_cost and nxt_cost < dist[nxt_state]:
+                        dist[nxt_state] = nxt_cost
+                        heappush(heap, (nxt_cost, nxt_state))
+
+        return np.array(dist).reshape(n, 4).min(axis=1)
+
+    @staticmethod
+    def _relax(heap, best, parent, heuristic, state, node, prev, cost) -> None:
+        if cost < best.get(state, float("inf")):
+            best[state] = cost
+            parent[state] = prev
+            heapq.heappush(heap, (cost + heuristic[node], cost, state))
+
+    def _build_segments(self, path: List[Tuple[int, int, float]]) -> List[Dict[str, Any]]:
+        """将状态序列按出行方式切分为路段"""
+        graph = self.graph
+        segments = []
+        i = 0
+        while i < len(path):
+            mode = path[i][1]
+            j = i
+            while j + 1 < len(path) and path[j + 1][1] == mode:
+                j += 1
+            nodes = [p[0] for p in path[i:j + 1]]
+            distance = 0.0
+            for a, b in zip(nodes, nodes[1:]):
+                distance += haversine(graph.node_lat[a], graph.node_lon[a], graph.node_lat[b], graph.node_lon[b])
+            if distance > 0:
+                start = (float(graph.node_lat[nodes[0]]), float(graph.node_lon[nodes[0]]))
+                end = (float(graph.node_lat[nodes[-1]]), float(graph.node_lon[nodes[-1]]))
+                segment = {
+                    "mode": MODE_NAMES[mode],
+                    "distance": round(distance, 1),
+                    # 路段耗时从上一路段结束时刻起算，包含候车/取车时间
+                    "duration": round((path[j][2] - path[max(i - 1, 0)][2]) / 60, 1),
+                    "start_point": {"lat": start[0], "lon": start[1]},
+                    "end_point": {"lat": end[0], "lon": end[1]},
+                    "geometry": [[float(graph.node_lat[n]), float(graph.node_lon[n])] for n in nodes]
+                }
+                if mode in (BUS, SUBWAY):
+                    segment["start_station"] = self._station(nodes[0])
+                    segment["end_station"] = self._station(nodes[-1])
+                segments.append(segment)
+            i = j + 1
+        return segments
+
+    def _station(self, node: int) -> Dict[str, Any]:
+        return {
+            "id": node,
+            "name": self.graph.node_name(node) or "未命名站点",
+            "location": {"lat": float(self.graph.node_lat[node]), "lon": float(self.graph.node_lon[node])}
+        }
+
+    @staticmethod
+    def _walk_segment(distance: float, start, end) -> Dict[str, Any]:
+        start = (start["lat"], start["lon"]) if isinstance(start, dict) else start
+        end = (end["lat"], end["lon"]) if isinstance(end, dict) else end
+        return {
+            "mode": "walking",
+            "distance": round(distance, 1),
+            "duration": round(distance / MODE_SPEEDS[WALKING] / 60, 1),
+            "start_point": {"lat": start[0], "lon": start[1]},
+            "end_point": {"lat": end[0], "lon": end[1]},
+            "geometry": [list(start), list(end)]
+        }
+
+    @staticmethod
+    def _extend_walk(segment: Dict[str, Any], distance: float, point: Tuple[float, float], at_start: bool) -> None:
+        if distance <= 0:
+            return
+        segment["distance"] = round(segment["distance"] + distance, 1)
+        segment["duration"] = round(segment["duration"] + distance / MODE_SPEEDS[WALKING] / 60, 1)
+        if at_start:
+            segment["start_point"] = {"lat": point[0], "lon": point[1]}
+            segment["geometry"].insert(0, list(point))
+        else:
+            segment["end_point"] = {"lat": point[0], "lon": point[1]}
+            segment["geometry"].append(list(point))
+
+class RoutingEngine:
+    """路网图的延迟加载与路径查询入口"""
+
+    def __init__(self, graph_path: str = None):
+        self.graph_path = graph_path or settings.ROUTING_GRAPH_PATH
+        self._router: Optional[MultiModalRouter] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_available(self) -> bool:
+        return self.router is not None
+
+    @property
+    def router(self) -> Optional[MultiModalRouter]:
+        if self._router is None and os.path.exists(self.graph_path):
+            with self._lock:
+                if self._router is None:
+                    self.load(self.graph_path)
+        return self._router
+
+    @property
+    def graph(self) -> Optional[RoutingGraph]:
+        router = self.router
+        return router.graph if router else None
+
+    def load(self, path: str = None) -> RoutingGraph:
+        """加载（或重新加载）路网图"""
+        graph = RoutingGraph.load(path or self.graph_path)
+        # 加载时建立吸附索引，避免首个请求等待
+        graph.snap_index(EDGE_WALK)
+        self._router = MultiModalRouter(graph)
+        print(f"路网图加载成功：{graph.num_nodes}个节点，{graph.num_edges}条边")
+        return graph
+
+    def route(
+        self,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+        modes: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        router = self.router
+        if router is None:
+            return None
+        return router.route(start_lat, start_lon, end_lat, end_lon, modes)
+
+routing_engine = RoutingEngine()
@@ -0,0 +1,336 @@
+"""
+本地路网图：将预处理后的OSM数据加载为CSR邻接数组
+"""
+import argparse
+import json
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from .geo import haversine_np
+from .spatial_index import GridIndex
+
+# 边的通行方式位掩码
+EDGE_WALK = 1
+EDGE_BIKE = 2
+EDGE_BUS = 4
+EDGE_SUBWAY = 8
+
+# 节点类型位掩码
+NODE_BIKE_STATION = 1
+NODE_BUS_STOP = 2
+NODE_SUBWAY_STATION = 4
+
+# 吸附坐标到路网节点所用网格索引的单元边长（米）
+SNAP_CELL_SIZE = 200.0
+
+# 各类道路允许的通行方式
+HIGHWAY_MODES = {
+    "footway": EDGE_WALK,
+    "pedestrian": EDGE_WALK,
+    "steps": EDGE_WALK,
+    "path": EDGE_WALK | EDGE_BIKE,
+    "cycleway": EDGE_WALK | EDGE_BIKE,
+    "living_street": EDGE_WALK | EDGE_BIKE,
+    "residential": EDGE_WALK | EDGE_BIKE,
+    "service": EDGE_WALK | EDGE_BIKE,
+    "unclassified": EDGE_WALK | EDGE_BIKE,
+    "tertiary": EDGE_WALK | EDGE_BIKE,
+    "tertiary_link": EDGE_WALK | EDGE_BIKE,
+    "secondary": EDGE_WALK | EDGE_BIKE,
+    "secondary_link": EDGE_WALK | EDGE_BIKE,
+    "primary": EDGE_WALK | EDGE_BIKE,
+    "primary_link": EDGE_WALK | EDGE_BIKE,
+    "track": EDGE_WALK | EDGE_BIKE,
+    "trunk": 0,
+    "trunk_link": 0,
+    "motorway": 0,
+    "motorway_link": 0,
+}
+
+# 轨道交通线路类型
+SUBWAY_RAILWAYS = {"subway", "light_rail", "monorail"}
+
+class RoutingGraph:
+    """CSR结构的多模式路网图"""
+
+    def __init__(
+        self,
+        node_lat: np.ndarray,
+        node_lon: np.ndarray,
+        node_flags: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        edge_length: np.ndarray,
+        edge_modes: np.ndarray,
+        poi_nodes: Optional[np.ndarray] = None,
+        poi_names: Optional[np.ndarray] = None
+    ):
+        self.node_lat = np.ascontiguousarray(node_lat, dtype=np.float64)
+        self.node_lon = np.ascontiguousarray(node_lon, dtype=np.float64)
+        self.node_flags = np.ascontiguousarray(node_flags, dtype=np.uint8)
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+        self.indices = np.ascontiguousarray(indices, dtype=np.int32)
+        self.edge_length = np.ascontiguousarray(edge_length, dtype=np.float32)
+        self.edge_modes = np.ascontiguousarray(edge_modes, dtype=np.uint8)
+        self.poi_nodes = np.asarray(poi_nodes if poi_nodes is not None else [], dtype=np.int32)
+        self.poi_names = np.asarray(poi_names if poi_names is not None else [], dtype=str)
+        self._names = dict(zip(self.poi_nodes.tolist(), self.poi_names.tolist()))
+        self._usable_cache: Dict[int, np.ndarray] = {}
+        self._snap_cache: Dict[int, Tuple[GridIndex, np.ndarray]] = {}
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_lat)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def node_name(self, node: int) -> Optional[str]:
+        """获取站点节点的名称"""
+        return self._names.get(node)
+
+    def nearest_node(self, lat: float, lon: float, edge_mask: int = EDGE_WALK) -> int:
+        """查找距离给定坐标最近、且至少有一条指定方式出边的节点"""
+        index, nodes = self.snap_index(edge_mask)
+        found = index.nearest(lat, lon, 1)
+        # 没有可通行节点时与全量扫描一致，返回0号节点
+        return int(nodes[found[0][1]]) if found else 0
+
+    def snap_index(self, edge_mask: int = EDGE_WALK) -> Tuple[GridIndex, np.ndarray]:
+        """有指定方式出边的节点的网格索引，返回(索引, 索引点编号 -> 节点编号)"""
+        cache = self._snap_cache
+        if edge_mask not in cache:
+            nodes = np.nonzero(self._nodes_with_edges(edge_mask))[0]
+            index = GridIndex(list(zip(self.node_lat[nodes].tolist(), self.node_lon[nodes].tolist())), SNAP_CELL_SIZE)
+            cache[edge_mask] = (index, nodes)
+        return cache[edge_mask]
+
+    def nearby_pois(self, lat: float, lon: float, radius: float, flag_mask: int) -> List[Dict[str, Any]]:
+        """查询半径范围内指定类型的站点，按距离排序"""
+        if not len(self.poi_nodes):
+            return []
+        nodes = self.poi_nodes[(self.node_flags[self.poi_nodes] & flag_mask) != 0]
+        distances = haversine_np(self.node_lat[nodes], self.node_lon[nodes], lat, lon)
+        within = distances <= radius
+        nodes, distances = nodes[within], distances[within]
+        order = np.argsort(distances, kind="stable")
+        return [{
+            "id": int(nodes[i]),
+            "flags": int(self.node_flags[nodes[i]]),
+            "name": self.node_name(int(nodes[i])),
+            "distance": float(distances[i]),
+            "location": {"lat": float(self.node_lat[nodes[i]]), "lon": float(self.node_lon[nodes[i]])}
+        } for i in order]
+
+    def _nodes_with_edges(self, edge_mask: int) -> np.ndarray:
+        cache = self._usable_cache
+        if edge_mask not in cache:
+            has_mode = (self.edge_modes & edge_mask) != 0
+            sources = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+            counts = np.bincount(sources[has_mode], minlength=self.num_nodes)
+            cache[edge_mask] = counts > 0
+        return cache[edge_mask]
+
+    def save(self, path: str) -> None:
+        """保存为压缩的npz文件"""
+        np.savez_compressed(
+            path,
+            node_lat=self.node_lat,
+            node_lon=self.node_lon,
+            node_flags=self.node_flags,
+            indptr=self.indptr,
+            indices=self.indices,
+            edge_length=self.edge_length,
+            edge_modes=self.edge_modes,
+            poi_nodes=self.poi_nodes,
+            poi_names=self.poi_names
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "RoutingGraph":
+        """从npz文件加载路网图"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{key: data[key] for key in data.files})
+
+    @classmethod
+    def from_osm_json(cls, data: Dict[str, Any]) -> "RoutingGraph":
+        """从Overpass JSON（way + node + relation）构建路网图"""
+        elements = data.get("elements", [])
+        nodes = {e["id"]: e for e in elements if e.get("type") == "node"}
+        ways = [e for e in elements if e.get("type") == "way"]
+
+        # 公交/地铁线路关系中引用的way
+        route_ways: Dict[int, int] = {}
+        for rel in elements:
+            if rel.get("type") != "relation":
+                continue
+            route = rel.get("tags", {}).get("route")
+            mask = EDGE_BUS if route in ("bus", "trolleybus") else EDGE_SUBWAY if route in ("subway", "light_rail") else 0
+            if not mask:
+                continue
+            for member in rel.get("members", []):
+                if member.get("type") == "way":
+                    route_ways[member["ref"]] = route_ways.get(member["ref"], 0) | mask
+
+        index: Dict[int, int] = {}
+
+        def node_index(osm_id: int) -> int:
+            if osm_id not in index:
+                index[osm_id] = len(index)
+            return index[osm_id]
+
+        src: List[int] = []
+        dst: List[int] = []
+        modes: List[int] = []
+
+        for way in ways:
+            tags = way.get("tags", {})
+            mask = _way_modes(tags) | route_ways.get(way["id"], 0)
+            if not mask:
+                continue
+            refs = [ref for ref in way.get("nodes", []) if ref in nodes]
+            oneway = tags.get("oneway") in ("yes", "1", "true") and tags.get("oneway:bicycle") != "no"
+            for a, b in zip(refs, refs[1:]):
+                u, v = node_index(a), node_index(b)
+                src.append(u)
+                dst.append(v)
+                modes.append(mask)
+                # 单行道仅限制骑行的逆向通行
+                back = mask & ~EDGE_BIKE if oneway else mask
+                if back:
+                    src.append(v)
+                    dst.append(u)
+                    modes.append(back)
+
+        # 站点节点
+        pois: List[int] = []
+        poi_names: List[str] = []
+        poi_flags: Dict[int, int] = {}
+        for osm_id, node in nodes.items():
+            flags = _node_flags(node.get("tags", {}))
+            if flags:
+                poi_flags[osm_id] = flags
+
+        n_way_nodes = len(index)
+        ordered = sorted(index, key=index.get)
+        lat = [nodes[i]["lat"] for i in ordered]
+        lon = [nodes[i]["lon"] for i in ordered]
+
+        # 不在道路上的站点通过连接边挂接到最近的可通行节点：
+        # 步行连接到步行路网，单车站点/公交站/地铁站另外连接到对应路网
+        way_lat = np.asarray(lat, dtype=np.float64)
+        way_lon = np.asarray(lon, dtype=np.float64)
+        way_modes = np.zeros(n_way_nodes, dtype=np.uint8)
+        if src:
+            np.bitwise_or.at(way_modes, np.asarray(src), np.asarray(modes, dtype=np.uint8))
+        for osm_id, flags in poi_flags.items():
+            node = nodes[osm_id]
+            if osm_id not in index:
+                if not n_way_nodes:
+                    continue
+                distances = haversine_np(way_lat, way_lon, node["lat"], node["lon"])
+                u = node_index(osm_id)
+                lat.append(node["lat"])
+                lon.append(node["lon"])
+                connectors = [EDGE_WALK]
+                if flags & NODE_BIKE_STATION:
+                    connectors.append(EDGE_BIKE)
+                if flags & NODE_BUS_STOP:
+                    connectors.append(EDGE_BUS)
+                if flags & NODE_SUBWAY_STATION:
+                    connectors.append(EDGE_SUBWAY)
+                for mask in connectors:
+                    candidates = np.where((way_modes & mask) != 0, distances, np.inf)
+                    nearest = int(np.argmin(candidates))
+                    if not np.isfinite(candidates[nearest]):
+                        continue
+                    src.extend([u, nearest])
+                    dst.extend([nearest, u])
+                    modes.extend([mask, mask])
+            pois.append(index[osm_id])
+            poi_names.append(node.get("tags", {}).get("name", ""))
+
+        node_lat = np.asarray(lat, dtype=np.float64)
+        node_lon = np.asarray(lon, dtype=np.float64)
+        node_flags = np.zeros(len(index), dtype=np.uint8)
+        for osm_id, flags in poi_flags.items():
+            if osm_id in index:
+                node_flags[index[osm_id]] = flags
+
+        src_arr = np.asarray(src, dtype=np.int64)
+        dst_arr = np.asarray(dst, dtype=np.int32)
+        length = haversine_np(node_lat[src_arr], node_lon[src_arr], node_lat[dst_arr], node_lon[dst_arr])
+        return cls.from_edges(
+            node_lat, node_lon, node_flags, src_arr, dst_arr, length,
+            np.asarray(modes, dtype=np.uint8), pois, poi_names
+        )
+
+    @classmethod
+    def from_edges(
+        cls,
+        node_lat: np.ndarray,
+        node_lon: np.ndarray,
+        node_flags: np.ndarray,
+        src: np.ndarray,
+        dst: np.ndarray,
+        length: np.ndarray,
+        modes: np.ndarray,
+        poi_nodes=None,
+        poi_names=None
+    ) -> "RoutingGraph":
+        """由边列表构建CSR数组"""
+        order = np.argsort(src, kind="stable")
+        counts = np.bincount(src, minlength=len(node_lat))
+        indptr = np.zeros(len(node_lat) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(
+            node_lat, node_lon, node_flags, indptr,
+            np.asarray(dst)[order], np.asarray(length)[order], np.asarray(modes)[order],
+            poi_nodes, poi_names
+        )
+
+def _way_modes(tags: Dict[str, str]) -> int:
+    """根据way标签确定允许的通行方式"""
+    if tags.get("railway") in SUBWAY_RAILWAYS:
+        return EDGE_SUBWAY
+    highway = tags.get("highway")
+    if highway is None:
+        return 0
+    mask = HIGHWAY_MODES.get(highway, EDGE_WALK | EDGE_BIKE)
+    if tags.get("foot") == "no":
+        mask &= ~EDGE_WALK
+    elif tags.get("foot") in ("yes", "designated"):
+        mask |= EDGE_WALK
+    if tags.get("bicycle") in ("no", "dismount"):
+        mask &= ~EDGE_BIKE
+    elif tags.get("bicycle") in ("yes", "designated"):
+        mask |= EDGE_BIKE
+    return mask
+
+def _node_flags(tags: Dict[str, str]) -> int:
+    """根据节点标签确定站点类型"""
+    flags = 0
+    if tags.get("amenity") == "bicycle_rental":
+        flags |= NODE_BIKE_STATION
+    if tags.get("highway") == "bus_stop":
+        flags |= NODE_BUS_STOP
+    if tags.get("railway") == "station" or tags.get("station") == "subway":
+        flags |= NODE_SUBWAY_STATION
+    return flags
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口：python -m src.utils.routing_graph build <osm.json> <graph.npz>"""
+    parser = argparse.ArgumentParser(description="预处理OSM数据生成本地路网图")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="由Overpass JSON构建路网图")
+    build.add_argument("source", help="Overpass JSON文件路径")
+    build.add_argument("output", help="输出的npz文件路径")
+    args = parser.parse_args(argv)
+
+    with open(args.source, "r", encoding="utf-8") as f:
+        graph = RoutingGraph.from_osm_json(json.load(f))
+    graph.save(args.output)
+    print(f"路网图已保存: {args.output}（{graph.num_nodes}个节点，{graph.num_edges}条边）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+快速响应序列化：默认使用orjson输出JSON，客户端Accept声明MessagePack时输出二进制
+"""
+import functools
+import inspect
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable
+import msgpack
+import numpy as np
+import orjson
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# 流式输出格式及对应的媒体类型
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+# 当前请求是否接受MessagePack，由路由处理函数在调用端点前设置
+_accept_msgpack: ContextVar[bool] = ContextVar("accept_msgpack", default=False)
+
+def _default(obj: Any) -> Any:
+    """orjson/msgpack无法直接处理的类型"""
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+class FastResponse(Response):
+    """按内容协商选择orjson或MessagePack编码的响应"""
+
+    media_type = "application/json"
+
+    def __init__(self, content: Any = None, status_code: int = 200, headers: dict = None, **kwargs):
+        headers = dict(headers or {})
+        headers.setdefault("vary", "Accept")
+        super().__init__(content, status_code, headers, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if _accept_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+            return msgpack.packb(content, default=_default, use_bin_type=True)
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+def encode_event(event: str, data: Any, fmt: str = "ndjson") -> bytes:
+    """编码一条流式事件：ndjson为每行一个{"event", "data"}对象，sse为Server-Sent Events"""
+    if fmt == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, default=_default, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+    return orjson.dumps({"event": event, "data": data}, default=_default, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+def accepts_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+class FastResponseRoute(APIRoute):
+    """
+    路由类：记录请求的Accept头供FastResponse使用；
+    未声明response_model的端点直接返回FastResponse，跳过jsonable_encoder的逐层转换
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if kwargs.get("response_model") is None:
+            endpoint = _wrap_endpoint(endpoint, kwargs.get("status_code") or 200)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            token = _accept_msgpack.set(accepts_msgpack(request))
+            try:
+                return await handler(request)
+            finally:
+                _accept_msgpack.reset(token)
+
+        return route_handler
+
+def _wrap_endpoint(endpoint: Callable, status_code: int) -> Callable:
+    """端点返回普通对象时直接包装为FastResponse"""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            return result if isinstance(result, Response) else FastResponse(result, status_code)
+    else:
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            result = await run_in_threadpool(endpoint, *args, **kwargs)
+            return result if isinstance(result, Response) else FastResponse(result, status_code)
+    return wrapper
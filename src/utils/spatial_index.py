@@ -0,0 +1,231 @@
+"""
+公交站点与共享单车站点的内存空间索引（投影坐标上的均匀网格）
+"""
+import asyncio
+import heapq
+import json
+import math
+import os
+from typing import Dict, Any, List, Optional, Tuple
+from ..config.settings import settings
+from .geo import EARTH_RADIUS
+
+class GridIndex:
+    """平面投影坐标上的均匀网格索引，支持半径查询和k近邻查询"""
+
+    def __init__(self, points: List[Tuple[float, float]], cell_size: float = 250.0, origin_lat: float = None):
+        self.cell_size = cell_size
+        if origin_lat is None:
+            origin_lat = sum(p[0] for p in points) / len(points) if points else 0.0
+        self._kx = math.radians(1) * EARTH_RADIUS * math.cos(math.radians(origin_lat))
+        self._ky = math.radians(1) * EARTH_RADIUS
+        self._xs: List[float] = []
+        self._ys: List[float] = []
+        self._ids: List[int] = []
+        self._cells: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+        # 按网格单元排序后，每个单元对应连续区间
+        projected = []
+        for i, (lat, lon) in enumerate(points):
+            x, y = self.project(lat, lon)
+            projected.append((self._cell(x, y), x, y, i))
+        projected.sort()
+        for key, x, y, i in projected:
+            if key not in self._cells:
+                self._cells[key] = (len(self._ids), len(self._ids))
+            start, _ = self._cells[key]
+            self._xs.append(x)
+            self._ys.append(y)
+            self._ids.append(i)
+            self._cells[key] = (start, len(self._ids))
+        if self._cells:
+            self._min_cx = min(k[0] for k in self._cells)
+            self._max_cx = max(k[0] for k in self._cells)
+            self._min_cy = min(k[1] for k in self._cells)
+            self._max_cy = max(k[1] for k in self._cells)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def project(self, lat: float, lon: float) -> Tuple[float, float]:
+        """等距圆柱投影到米制平面坐标"""
+        return lon * self._kx, lat * self._ky
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def within(self, lat: float, lon: float, radius: float) -> List[Tuple[float, int]]:
+        """半径内的点，返回按距离升序的(距离米, 点编号)"""
+        if not self._ids:
+            return []
+        x, y = self.project(lat, lon)
+        cx0, cy0 = self._cell(x - radius, y - radius)
+        cx1, cy1 = self._cell(x + radius, y + radius)
+        r2 = radius * radius
+        xs, ys, ids, cells = self._xs, self._ys, self._ids, self._cells
+        found = []
+        for cx in range(max(cx0, self._min_cx), min(cx1, self._max_cx) + 1):
+            for cy in range(max(cy0, self._min_cy), min(cy1, self._max_cy) + 1):
+                span = cells.get((cx, cy))
+                if span is None:
+                    continue
+                for j in range(span[0], span[1]):
+                    dx = xs[j] - x
+                    dy = ys[j] - y
+                    d2 = dx * dx + dy * dy
+                    if d2 <= r2:
+                        found.append((d2, ids[j]))
+        found.sort()
+        return [(math.sqrt(d2), i) for d2, i in found]
+
+    def nearest(self, lat: float, lon: float, k: int = 1, max_distance: float = math.inf) -> List[Tuple[float, int]]:
+        """k近邻查询：逐圈扩展网格，直到第k近的点不可能被更外圈的点超越"""
+        if not self._ids or k <= 0:
+            return []
+        x, y = self.project(lat, lon)
+        cx, cy = self._cell(x, y)
+        xs, ys, ids, cells = self._xs, self._ys, self._ids, self._cells
+        heap: List[Tuple[float, int]] = []  # 大顶堆（取负距离）
+        max_ring = max(
+            abs(cx - self._min_cx), abs(cx - self._max_cx),
+            abs(cy - self._min_cy), abs(cy - self._max_cy)
+        )
+        limit2 = max_distance * max_distance
+        ring = 0
+        while ring <= max_ring:
+            for key in _ring_cells(cx, cy, ring):
+                span = cells.get(key)
+                if span is None:
+                    continue
+                for j in range(span[0], span[1]):
+                    dx = xs[j] - x
+                    dy = ys[j] - y
+                    d2 = dx * dx + dy * dy
+                    if d2 > limit2:
+                        continue
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d2, ids[j]))
+                    elif d2 < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d2, ids[j]))
+            # 第ring圈之外的点距离至少为ring * cell_size
+            reach = ring * self.cell_size
+            if len(heap) == k and reach * reach >= -heap[0][0]:
+                break
+            if reach * reach > limit2:
+                break
+            ring += 1
+        return [(math.sqrt(-d2), i) for d2, i in sorted(heap, reverse=True)]
+
+def _ring_cells(cx: int, cy: int, ring: int):
+    """与中心单元切比雪夫距离为ring的所有网格单元"""
+    if ring == 0:
+        yield cx, cy
+        return
+    for dx in range(-ring, ring + 1):
+        yield cx + dx, cy - ring
+        yield cx + dx, cy + ring
+    for dy in range(-ring + 1, ring):
+        yield cx - ring, cy + dy
+        yield cx + ring, cy + dy
+
+class PoiIndex:
+    """由Overpass/OSM快照导入的公交站、地铁站、共享单车站点索引"""
+
+    CATEGORIES = ("bus_stop", "subway", "bike")
+
+    def __init__(self, snapshot_path: str = None, cell_size: float = None):
+        self.snapshot_path = snapshot_path or settings.POI_SNAPSHOT_PATH
+        self.cell_size = cell_size or settings.POI_INDEX_CELL_SIZE
+        self._indexes: Optional[Dict[str, Tuple[GridIndex, List[Dict[str, Any]]]]] = None
+        self._mtime: Optional[float] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._indexes is not None
+
+    def load(self, path: str = None) -> Dict[str, int]:
+        """从快照文件构建索引并原子替换当前索引"""
+        path = path or self.snapshot_path
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        indexes = self.build(data.get("elements", []), self.cell_size)
+        # 整体替换引用，正在进行的查询继续使用旧索引
+        self._indexes = indexes
+        self.snapshot_path = path
+        self._mtime = os.path.getmtime(path)
+        counts = {category: len(records) for category, (_, records) in indexes.items()}
+        print(f"站点索引加载成功：{counts}")
+        return counts
+
+    async def refresh(self, path: str = None) -> Dict[str, int]:
+        """在线程池中重建索引，不阻塞事件循环，也无需重启服务"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.load, path)
+
+    async def watch(self, interval: float) -> None:
+        """定期检查快照文件，有更新时自动重新加载"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if os.path.exists(self.snapshot_path) and os.path.getmtime(self.snapshot_path) != self._mtime:
+                    await self.refresh()
+            except Exception as e:
+                print(f"站点索引刷新失败：{str(e)}")
+
+    @classmethod
+    def build(cls, elements: List[Dict[str, Any]], cell_size: float) -> Dict[str, Tuple[GridIndex, List[Dict[str, Any]]]]:
+        """按类别构建网格索引"""
+        records: Dict[str, List[Dict[str, Any]]] = {category: [] for category in cls.CATEGORIES}
+        for element in elements:
+            if element.get("type", "node") != "node" or "lat" not in element:
+                continue
+            tags = element.get("tags", {})
+            location = {"lat": element["lat"], "lon": element["lon"]}
+            if tags.get("highway") == "bus_stop":
+                records["bus_stop"].append({
+                    "id": element["id"],
+                    "type": "bus_stop",
+                    "name": tags.get("name", "未命名站点"),
+                    "location": location
+                })
+            elif tags.get("railway") == "station":
+                records["subway"].append({
+                    "id": element["id"],
+                    "type": "subway",
+                    "name": tags.get("name", "未命名站点"),
+                    "location": location
+                })
+            if tags.get("amenity") == "bicycle_rental":
+                records["bike"].append({
+                    "id": element["id"],
+                    "name": tags.get("name", "共享单车站点"),
+                    "operator": tags.get("operator", "未知运营商"),
+                    "location": location
+                })
+
+        all_points = [(r["location"]["lat"], r["location"]["lon"]) for items in records.values() for r in items]
+        origin_lat = sum(p[0] for p in all_points) / len(all_points) if all_points else 0.0
+        return {
+            category: (GridIndex([(r["location"]["lat"], r["location"]["lon"]) for r in items], cell_size, origin_lat), items)
+            for category, items in records.items()
+        }
+
+    def within(self, lat: float, lon: float, radius: float, categories: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """半径查询，多个类别的结果合并后按距离排序"""
+        results = []
+        for category in categories:
+            index, records = self._indexes[category]
+            results.extend((d, category, i) for d, i in index.within(lat, lon, radius))
+        results.sort(key=lambda item: item[0])
+        return [dict(self._indexes[c][1][i], distance=round(d, 1)) for d, c, i in results]
+
+    def nearest(self, lat: float, lon: float, k: int, categories: Tuple[str, ...], max_distance: float = math.inf) -> List[Dict[str, Any]]:
+        """k近邻查询，多个类别合并后取最近的k个"""
+        results = []
+        for category in categories:
+            index, records = self._indexes[category]
+            results.extend((d, category, i) for d, i in index.nearest(lat, lon, k, max_distance))
+        results.sort(key=lambda item: item[0])
+        return [dict(self._indexes[c][1][i], distance=round(d, 1)) for d, c, i in results[:k]]
+
+poi_index = PoiIndex()
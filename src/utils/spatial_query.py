@@ -0,0 +1,129 @@
+"""
+数据库空间查询：坐标存为浮点列并按固定经纬度网格编号（B树索引），范围与半径过滤在SQL中完成
+"""
+import argparse
+import math
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from ..config.settings import settings
+from ..models.database import SessionLocal, SPATIAL_COLUMNS, TrafficData, WeatherData, TransportationService
+from .geo import EARTH_RADIUS, haversine, parse_location, grid_cell
+
+# 对外开放范围查询的数据集（出行历史属于用户数据，不在此列）
+SPATIAL_DATASETS = {
+    "traffic": TrafficData,
+    "weather": WeatherData,
+    "transport_services": TransportationService
+}
+
+def spatial_columns(model, which: int = 0):
+    """模型的(纬度列, 经度列, 网格单元列)；出行历史which=0为起点，1为终点"""
+    _, lat_attr, lon_attr, cell_attr = SPATIAL_COLUMNS[model][which]
+    return getattr(model, lat_attr), getattr(model, lon_attr), getattr(model, cell_attr)
+
+def bbox_clause(model, south: float, west: float, north: float, east: float, which: int = 0):
+    """范围过滤条件：每个网格行内的单元编号连续，按行生成编号区间走索引，再用坐标列精确过滤"""
+    lat_col, lon_col, cell_col = spatial_columns(model, which)
+    exact = and_(lat_col.between(south, north), lon_col.between(west, east))
+    degrees = settings.SPATIAL_CELL_DEGREES
+    first, last = grid_cell(south, west, degrees), grid_cell(north, east, degrees)
+    columns = round(360 / degrees)
+    row0, row1 = first // columns, last // columns
+    col0, col1 = first % columns, last % columns
+    if row1 - row0 + 1 > settings.SPATIAL_MAX_CELL_ROWS or col1 < col0:
+        # 范围过大或跨越180度经线时不使用网格单元
+        return exact
+    ranges = [cell_col.between(row * columns + col0, row * columns + col1) for row in range(row0, row1 + 1)]
+    return and_(or_(*ranges), exact)
+
+def radius_clause(model, lat: float, lon: float, radius: float, which: int = 0):
+    """半径过滤条件：外接矩形走索引，距离用以中心纬度展开的平面近似在SQL中计算（城市范围内误差可忽略）"""
+    lat_col, lon_col, _ = spatial_columns(model, which)
+    dlat = math.degrees(radius / EARTH_RADIUS)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    ky = math.radians(1) * EARTH_RADIUS
+    kx = ky * math.cos(math.radians(lat))
+    dy = (lat_col - lat) * ky
+    dx = (lon_col - lon) * kx
+    return and_(
+        bbox_clause(model, lat - dlat, lon - dlon, lat + dlat, lon + dlon, which),
+        dx * dx + dy * dy <= radius * radius
+    )
+
+def query_bbox(db: Session, model, south: float, west: float, north: float, east: float, limit: int = None, which: int = 0) -> List:
+    limit = max(1, min(limit or settings.SPATIAL_QUERY_LIMIT, settings.SPATIAL_QUERY_LIMIT))
+    return db.query(model).filter(bbox_clause(model, south, west, north, east, which)).limit(limit).all()
+
+def query_radius(db: Session, model, lat: float, lon: float, radius: float, limit: int = None, which: int = 0) -> List[Tuple[float, Any]]:
+    """半径内的记录，返回按距离升序的(距离米, 记录)"""
+    limit = max(1, min(limit or settings.SPATIAL_QUERY_LIMIT, settings.SPATIAL_QUERY_LIMIT))
+    lat_attr, lon_attr = SPATIAL_COLUMNS[model][which][1:3]
+    rows = db.query(model).filter(radius_clause(model, lat, lon, radius, which)).limit(limit).all()
+    found = [(haversine(lat, lon, getattr(r, lat_attr), getattr(r, lon_attr)), r) for r in rows]
+    found.sort(key=lambda item: item[0])
+    return found
+
+def to_dict(row) -> Dict[str, Any]:
+    """记录转为字典（日期转为ISO字符串）"""
+    result = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.name)
+        result[column.name] = value.isoformat() if hasattr(value, "isoformat") else value
+    return result
+
+def backfill_coordinates(batch_size: int = None) -> Dict[str, int]:
+    """迁移：解析旧数据的位置字符串，补全坐标列与网格单元列，返回每个表更新的记录数"""
+    batch_size = batch_size or settings.SPATIAL_BACKFILL_BATCH
+    degrees = settings.SPATIAL_CELL_DEGREES
+    updated = {}
+    db = SessionLocal()
+    try:
+        for model, specs in SPATIAL_COLUMNS.items():
+            count = 0
+            for location_attr, lat_attr, lon_attr, cell_attr in specs:
+                location_col, lat_col = getattr(model, location_attr), getattr(model, lat_attr)
+                last_id = 0
+                while True:
+                    # 按主键分批，无法解析的记录保持为空，本次运行中不会重复扫描
+                    rows = db.query(model.id, location_col).filter(
+                        model.id > last_id,
+                        lat_col.is_(None),
+                        location_col.isnot(None)
+                    ).order_by(model.id).limit(batch_size).all()
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+                    mappings = []
+                    for row_id, location in rows:
+                        point = parse_location(location)
+                        if point is not None:
+                            mappings.append({
+                                "id": row_id,
+                                lat_attr: point[0],
+                                lon_attr: point[1],
+                                cell_attr: grid_cell(point[0], point[1], degrees)
+                            })
+                    db.bulk_update_mappings(model, mappings)
+                    db.commit()
+                    count += len(mappings)
+            updated[model.__tablename__] = count
+    finally:
+        db.close()
+    return updated
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口：python -m src.utils.spatial_query backfill"""
+    parser = argparse.ArgumentParser(description="坐标列迁移")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="由位置字符串补全坐标列与网格单元列")
+    backfill.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from ..models.database import create_tables
+    create_tables()
+    for table, count in backfill_coordinates(args.batch_size).items():
+        print(f"{table}：更新{count}条")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
-import random
 from typing import Dict, Any, Optional, List
 from ..models.schemas import Location
 from ..config.settings import settings
+from .geo import parse_lat_lon
+from .traffic_store import traffic_store, congestion_condition
+from .congestion_profile import congestion_profile
 import numpy as np
 from datetime import datetime, time
 
@@ -35,11 +37,21 @@ class TrafficService:
         }
         
     async def get_traffic_status(self) -> Dict[str, Any]:
-        """获取交通状况信息"""
+        """获取交通状况信息，有实时读数时覆盖拥堵指数、状态和平均速度"""
         try:
+            traffic = self.traffic_data
+            live = traffic_store.condition(None, None)
+            if live is not None:
+                traffic = {
+                    **traffic,
+                    "congestion_index": live["congestion_factor"],
+                    "status": live["condition"],
+                    "average_speed": live["average_speed"],
+                    "updated_at": live["updated_at"]
+                }
             return {
                 "status": "1",
-                "traffic": self.traffic_data
+                "traffic": traffic
             }
         except Exception as e:
             print(f"获取交通状况时发生错误：{str(e)}")
@@ -47,16 +59,23 @@ class TrafficService:
         
     async def get_traffic_condition(self, start_location: str, end_location: str) -> Dict[str, Any]:
         """
-        获取指定路线的交通状况（模拟数据）
+        获取指定路线的交通状况：取起终点连线附近路段的最新读数（内存），不访问数据库
         """
-        condition = random.choice(self.conditions)
-        
-        return {
-            "condition": condition,
-            "congestion_factor": self.congestion_factors[condition],
-            "average_speed": random.randint(10, 60),
-            "incident_count": random.randint(0, 5)
-        }
+        try:
+            start, end = parse_lat_lon(start_location), parse_lat_lon(end_location)
+        except ValueError:
+            start = end = None
+        condition = traffic_store.condition(start, end)
+        if condition is None:
+            # 沿途没有有效读数时按畅通处理，不调整行程时间
+            return {
+                "condition": "畅通",
+                "congestion_factor": self.congestion_factors["畅通"],
+                "average_speed": None,
+                "incident_count": 0,
+                "segments": 0
+            }
+        return condition
         
     def _simulate_traffic_condition(self) -> Dict[str, Any]:
         """模拟交通状况数据"""
@@ -88,13 +107,21 @@ class TrafficService:
         location: Location,
         future_time: datetime
     ) -> Dict[str, Any]:
-        """预测未来某个时间点的交通状况"""
-        # TODO: 实现基于历史数据的交通预测模型
+        """按拥堵画像（位置所在网格×星期×小时）预测未来某个时间点的交通状况"""
+        profile = congestion_profile.predict(location.latitude, location.longitude, future_time)
+        if profile is None:
+            # 没有任何历史读数时按畅通处理，置信度为0
+            return {
+                "condition": "预计畅通",
+                "congestion_factor": 1.0,
+                "timestamp": future_time.isoformat(),
+                "confidence": 0.0,
+                "samples": 0
+            }
         return {
-            "condition": "预计通畅",
-            "congestion_factor": 1.2,
+            "condition": f"预计{congestion_condition(profile['congestion_factor'])}",
             "timestamp": future_time.isoformat(),
-            "confidence": 0.6
+            **profile
         }
         
     def get_realtime_bus_info(self, route_id: str) -> Optional[Dict[str, Any]]:
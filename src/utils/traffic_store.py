@@ -0,0 +1,201 @@
+"""
+交通数据采集：批量读数分事务写入TrafficData，同时在内存中按路段保留最新N条读数，路况查询不访问数据库
+"""
+import json
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from ..config.settings import settings
+from ..models.database import SessionLocal, TrafficData
+from .congestion_profile import congestion_profile
+from .db_executor import db_executor
+from .geo import EARTH_RADIUS, grid_cell
+
+# 拥堵系数分级：(上限, 路况)
+CONDITION_LEVELS = ((1.15, "畅通"), (1.45, "轻度拥堵"), (1.8, "中度拥堵"), (math.inf, "严重拥堵"))
+
+# 内存中的一条读数：(时间, 拥堵系数, 平均速度, 事件类型)
+Reading = Tuple[datetime, float, float, Optional[str]]
+
+def congestion_condition(level: float) -> str:
+    """拥堵系数对应的路况描述"""
+    for upper, condition in CONDITION_LEVELS:
+        if level < upper:
+            return condition
+    return CONDITION_LEVELS[-1][1]
+
+class TrafficStore:
+    """路段读数的环形缓冲区与批量持久化"""
+
+    def __init__(self, buffer_size: int = None, ttl: float = None, write_batch: int = None):
+        self.buffer_size = buffer_size or settings.TRAFFIC_BUFFER_SIZE
+        self.ttl = ttl or settings.TRAFFIC_READING_TTL
+        self.write_batch = write_batch or settings.TRAFFIC_WRITE_BATCH
+        self._buffers: Dict[str, deque] = {}
+        self._locations: Dict[str, Tuple[float, float]] = {}
+        # 有位置的路段坐标数组，路段位置变化后重建
+        self._located: Optional[Tuple[List[str], np.ndarray, np.ndarray]] = None
+        self.stats = {"ingested": 0, "written": 0, "write_errors": 0}
+        # 批量导入在后台线程写入缓冲区，事件循环同时在读取
+        self._lock = threading.Lock()
+
+    @property
+    def has_data(self) -> bool:
+        return bool(self._buffers)
+
+    def rows(self, readings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """读数转为数据库行，不修改内存状态"""
+        now = datetime.now()
+        rows = []
+        for reading in readings:
+            lat, lon = reading.get("latitude"), reading.get("longitude")
+            located = lat is not None and lon is not None
+            rows.append({
+                "segment_id": reading["segment_id"],
+                "location": json.dumps({"lat": lat, "lon": lon}) if located else None,
+                "latitude": lat if located else None,
+                "longitude": lon if located else None,
+                "grid_cell": grid_cell(lat, lon, settings.SPATIAL_CELL_DEGREES) if located else None,
+                "timestamp": local_time(reading.get("timestamp")) or now,
+                "congestion_level": reading["congestion_level"],
+                "average_speed": reading["average_speed"],
+                "incident_type": reading.get("incident_type"),
+                "data_source": reading.get("data_source") or "api"
+            })
+        return rows
+
+    def apply(self, rows: List[Dict[str, Any]]) -> None:
+        """数据库行放入各路段的缓冲区并计入拥堵画像"""
+        with self._lock:
+            for row in rows:
+                segment_id = row["segment_id"]
+                self._append(segment_id, (row["timestamp"], row["congestion_level"], row["average_speed"], row["incident_type"]))
+                if row["latitude"] is not None and self._locations.get(segment_id) != (row["latitude"], row["longitude"]):
+                    self._locations[segment_id] = (row["latitude"], row["longitude"])
+                    self._located = None
+            self.stats["ingested"] += len(rows)
+        congestion_profile.update(rows)
+
+    def _append(self, segment_id: str, reading: Reading) -> None:
+        """调用方需持有self._lock"""
+        buffer = self._buffers.get(segment_id)
+        if buffer is None:
+            buffer = self._buffers[segment_id] = deque(maxlen=self.buffer_size)
+        if not buffer or reading[0] >= buffer[-1][0]:
+            buffer.append(reading)
+        elif len(buffer) < buffer.maxlen or reading[0] > buffer[0][0]:
+            # 乱序到达的读数按时间插入
+            self._buffers[segment_id] = deque(sorted([*buffer, reading], key=lambda r: r[0]), maxlen=self.buffer_size)
+
+    async def ingest(self, readings: List[Dict[str, Any]]) -> Dict[str, int]:
+        """接收一批读数：在线程池中分事务写入数据库，提交成功的读数随后更新内存"""
+        rows = self.rows(readings)
+        written = await db_executor.call(self.write, rows)
+        return {"accepted": len(rows), "written": written}
+
+    def write(self, rows: List[Dict[str, Any]]) -> int:
+        """每write_batch条一个事务批量插入，提交成功的批次再放入内存并计入拥堵画像，返回成功写入的条数"""
+        written = 0
+        db = SessionLocal()
+        try:
+            for start in range(0, len(rows), self.write_batch):
+                chunk = rows[start:start + self.write_batch]
+                try:
+                    db.bulk_insert_mappings(TrafficData, chunk)
+                    db.commit()
+                    written += len(chunk)
+                    self.apply(chunk)
+                except Exception as e:
+                    db.rollback()
+                    self.stats["write_errors"] += 1
+                    print(f"交通读数写入失败：{str(e)}")
+        finally:
+            db.close()
+        congestion_profile.flush()
+        self.stats["written"] += written
+        return written
+
+    def warm(self) -> int:
+        """启动时从数据库加载有效期内的读数到内存"""
+        since = datetime.now() - timedelta(seconds=self.ttl)
+        db = SessionLocal()
+        try:
+            rows = db.query(TrafficData).filter(
+                TrafficData.segment_id.isnot(None),
+                TrafficData.timestamp >= since
+            ).order_by(TrafficData.timestamp).all()
+        finally:
+            db.close()
+        with self._lock:
+            for row in rows:
+                self._append(row.segment_id, (row.timestamp, row.congestion_level, row.average_speed, row.incident_type))
+                if row.latitude is not None and row.segment_id not in self._locations:
+                    self._locations[row.segment_id] = (row.latitude, row.longitude)
+                    self._located = None
+        return len(rows)
+
+    def history(self, segment_id: str) -> List[Dict[str, Any]]:
+        """路段在内存中的最近读数，按时间升序"""
+        with self._lock:
+            readings = list(self._buffers.get(segment_id, ()))
+        return [{
+            "timestamp": timestamp.isoformat(),
+            "congestion_level": level,
+            "average_speed": speed,
+            "incident_type": incident
+        } for timestamp, level, speed, incident in readings]
+
+    def condition(self, start: Optional[Tuple[float, float]], end: Optional[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+        """起终点连线附近路段的当前路况；未给出起终点时为全城路况，没有有效读数时返回None"""
+        cutoff = datetime.now() - timedelta(seconds=self.ttl)
+        with self._lock:
+            segments = self._corridor(start, end, settings.TRAFFIC_CORRIDOR_WIDTH) if start and end else list(self._buffers)
+            latest = [self._buffers[s][-1] for s in segments if self._buffers[s] and self._buffers[s][-1][0] >= cutoff]
+        if not latest:
+            return None
+        level = sum(r[1] for r in latest) / len(latest)
+        return {
+            "condition": congestion_condition(level),
+            "congestion_factor": round(level, 3),
+            "average_speed": round(sum(r[2] for r in latest) / len(latest), 1),
+            "incident_count": sum(1 for r in latest if r[3]),
+            "segments": len(latest),
+            "updated_at": max(r[0] for r in latest).isoformat()
+        }
+
+    def _corridor(self, start: Tuple[float, float], end: Tuple[float, float], width: float) -> List[str]:
+        """到起终点线段的距离不超过width米的路段，调用方需持有self._lock"""
+        if self._located is None:
+            ids = list(self._locations)
+            coords = np.array([self._locations[s] for s in ids], dtype=np.float64).reshape(-1, 2)
+            self._located = (ids, coords[:, 0], coords[:, 1])
+        ids, lats, lons = self._located
+        if not ids:
+            return []
+        # 以起点为原点投影到平面米制坐标
+        kx = math.radians(1) * EARTH_RADIUS * math.cos(math.radians(start[0]))
+        ky = math.radians(1) * EARTH_RADIUS
+        px, py = (lons - start[1]) * kx, (lats - start[0]) * ky
+        ex, ey = (end[1] - start[1]) * kx, (end[0] - start[0]) * ky
+        length2 = ex * ex + ey * ey
+        t = np.clip((px * ex + py * ey) / length2, 0.0, 1.0) if length2 else np.zeros_like(px)
+        distances = np.hypot(px - t * ex, py - t * ey)
+        return [ids[i] for i in np.nonzero(distances <= width)[0]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "segments": len(self._buffers), "located_segments": len(self._locations)}
+
+def local_time(value) -> Optional[datetime]:
+    """统一为本地时间的naive datetime"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+traffic_store = TrafficStore()
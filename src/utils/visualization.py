@@ -2,9 +2,11 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from ..models.database import TravelHistory, TrafficData, WeatherData
+from .carbon import carbon_engine
+from .spatial_query import bbox_clause
 from sqlalchemy.orm import Session
 
 class DataVisualization:
@@ -158,19 +160,22 @@ class DataVisualization:
         fig.update_layout(height=800, title_text="月度统计概览")
         return fig.to_dict()
         
-    def create_traffic_heatmap(self, date: datetime) -> Dict:
-        """创建交通热力图"""
-        # 获取指定日期的交通数据
-        traffic_data = pd.DataFrame([
-            {
-                "latitude": float(d.location.split(",")[0]),
-                "longitude": float(d.location.split(",")[1]),
-                "congestion_level": d.congestion_level
-            }
-            for d in self.db.query(TrafficData).filter(
-                TrafficData.timestamp.date() == date.date()
-            ).all()
-        ])
+    def create_traffic_heatmap(self, date: datetime, bbox: Optional[Tuple[float, float, float, float]] = None) -> Dict:
+        """创建交通热力图，bbox为(南, 西, 北, 东)时只取范围内的读数（在数据库中过滤）"""
+        # 获取指定日期的交通数据，只查询坐标和拥堵系数三列
+        day_start = datetime.combine(date.date(), datetime.min.time())
+        query = self.db.query(
+            TrafficData.latitude,
+            TrafficData.longitude,
+            TrafficData.congestion_level
+        ).filter(
+            TrafficData.timestamp >= day_start,
+            TrafficData.timestamp < day_start + timedelta(days=1),
+            TrafficData.latitude.isnot(None)
+        )
+        if bbox is not None:
+            query = query.filter(bbox_clause(TrafficData, *bbox))
+        traffic_data = pd.DataFrame(query.all(), columns=["latitude", "longitude", "congestion_level"])
         
         if traffic_data.empty:
             return {"error": "无交通数据"}
@@ -229,9 +234,7 @@ class DataVisualization:
         
     def _create_carbon_savings_chart(self, history: pd.DataFrame) -> Dict:
         """创建碳排放节省图表"""
-        car_emission_factor = 0.2  # kg CO2/km
-        
-        history["baseline_emission"] = history["distance"] * car_emission_factor
+        history["baseline_emission"] = carbon_engine.baseline(history["distance"].to_numpy())
         history["savings"] = history["baseline_emission"] - history["carbon_emission"]
         
         fig = go.Figure()
@@ -1,14 +1,29 @@
-import aiohttp
-from typing import Dict, Any
-import os
+"""
+天气服务：按网格单元缓存天气，临近过期的热点单元在后台提前刷新；路线规划只读缓存，不等待上游
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
+from ..config.settings import settings
+from .geo import EARTH_RADIUS
+from .http_client import http_client
+from .rate_limiter import rate_limiter
 
 # 加载环境变量
 load_dotenv()
 
-class WeatherService:
+Cell = Tuple[int, int]
+
+WIND_DIRECTIONS = ("北风", "东北风", "东风", "东南风", "南风", "西南风", "西风", "西北风")
+
+class StaticWeatherProvider:
+    """固定天气数据，未配置WEATHER_API_KEY时及测试中使用"""
+
     def __init__(self):
-        # 使用固定的天气数据
         self.weather_data = {
             "temperature": 18.4,
             "apparent_temperature": 18.4,
@@ -17,16 +32,207 @@ class WeatherService:
             "wind_speed": 3.3,
             "wind_direction": "北风"
         }
-    
+
+    async def fetch(self, lat: float, lon: float) -> Dict[str, Any]:
+        return dict(self.weather_data)
+
+class OpenWeatherProvider:
+    """OpenWeatherMap当前天气接口"""
+
+    def __init__(self, api_key: str, url: str = "https://api.openweathermap.org/data/2.5/weather"):
+        self.api_key = api_key
+        self.url = url
+
+    async def fetch(self, lat: float, lon: float) -> Dict[str, Any]:
+        await rate_limiter.acquire(self.url)
+        params = {"lat": lat, "lon": lon, "appid": self.api_key, "units": "metric", "lang": "zh_cn"}
+        async with http_client.session.get(self.url, params=params) as response:
+            if response.status != 200:
+                raise RuntimeError(f"天气服务错误 (HTTP {response.status})")
+            data = await response.json()
+        main, wind = data.get("main", {}), data.get("wind", {})
+        condition = (data.get("weather") or [{}])[0]
+        return {
+            "temperature": main.get("temp"),
+            "apparent_temperature": main.get("feels_like"),
+            "weather_description": condition.get("description", ""),
+            "humidity": main.get("humidity"),
+            "wind_speed": wind.get("speed"),
+            "wind_direction": _wind_direction(wind.get("deg"))
+        }
+
+class WeatherService:
+    """天气网格缓存：坐标按WEATHER_CELL_SIZE吸附到单元中心，每个单元只向上游查询一次"""
+
+    def __init__(self, provider=None, cell_size: float = None, ttl: float = None, stale_ttl: float = None, max_cells: int = None):
+        if provider is None:
+            provider = OpenWeatherProvider(settings.WEATHER_API_KEY) if settings.WEATHER_API_KEY else StaticWeatherProvider()
+        self.provider = provider
+        self.cell_size = cell_size or settings.WEATHER_CELL_SIZE
+        self.ttl = ttl or settings.WEATHER_CACHE_TTL
+        self.stale_ttl = stale_ttl or settings.WEATHER_STALE_TTL
+        self.max_cells = max_cells or settings.WEATHER_CACHE_CELLS
+        self._dlat = math.degrees(self.cell_size / EARTH_RADIUS)
+        # 单元 -> (获取时刻, 天气)
+        self._cells: "OrderedDict[Cell, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._last_access: Dict[Cell, float] = {}
+        self._inflight: Dict[Cell, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "fetches": 0, "fetch_errors": 0, "refreshes": 0}
+
+    def cell_of(self, lat: float, lon: float) -> Cell:
+        row = math.floor(lat / self._dlat)
+        return row, math.floor(lon / self._dlon(row))
+
+    def cell_center(self, cell: Cell) -> Tuple[float, float]:
+        row, col = cell
+        return (row + 0.5) * self._dlat, (col + 0.5) * self._dlon(row)
+
+    def _dlon(self, row: int) -> float:
+        """经向宽度按该行中心纬度换算"""
+        return self._dlat / max(math.cos(math.radians((row + 0.5) * self._dlat)), 1e-6)
+
     async def get_weather(self, lat: float, lon: float) -> Dict[str, Any]:
-        """获取指定位置的天气信息"""
+        """获取指定位置的天气信息，缓存未命中时等待上游查询"""
         try:
-            return {
-                "status": "1",
-                "weather": self.weather_data
-            }
+            cell = self.cell_of(lat, lon)
+            weather = self._lookup(cell)
+            if weather is None:
+                self.stats["misses"] += 1
+                weather = await asyncio.shield(self._fetch(cell))
+            return {"status": "1", "weather": weather}
         except Exception as e:
             print(f"获取天气信息时发生错误：{str(e)}")
             return {"status": "0", "error": f"获取天气信息失败: {str(e)}"}
 
-weather_service = WeatherService() 
\ No newline at end of file
+    def peek_weather(self, lat: float, lon: float) -> Dict[str, Any]:
+        """只读缓存（过期但未超过stale_ttl的也可用），未命中时在后台查询并立即返回失败"""
+        cell = self.cell_of(lat, lon)
+        weather = self._lookup(cell)
+        if weather is not None:
+            return {"status": "1", "weather": weather}
+        self.stats["misses"] += 1
+        self._fetch(cell)
+        return {"status": "0", "error": "该位置的天气尚未缓存"}
+
+    def _lookup(self, cell: Cell) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        entry = self._cells.get(cell)
+        if entry is None or now - entry[0] >= self.stale_ttl:
+            return None
+        self._last_access[cell] = now
+        self._cells.move_to_end(cell)
+        if now - entry[0] < self.ttl:
+            self.stats["hits"] += 1
+        else:
+            # 过期的结果先返回，同时后台刷新
+            self.stats["stale_hits"] += 1
+            self._fetch(cell)
+        return entry[1]
+
+    def _fetch(self, cell: Cell) -> asyncio.Task:
+        """同一单元同时只有一个上游查询"""
+        task = self._inflight.get(cell)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_cell(cell))
+            self._inflight[cell] = task
+            task.add_done_callback(lambda t: self._fetch_done(cell, t))
+        return task
+
+    def _fetch_done(self, cell: Cell, task: asyncio.Task) -> None:
+        self._inflight.pop(cell, None)
+        # 后台查询无人等待时，取出异常避免未处理异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch_cell(self, cell: Cell) -> Dict[str, Any]:
+        lat, lon = self.cell_center(cell)
+        self.stats["fetches"] += 1
+        try:
+            weather = await self.provider.fetch(lat, lon)
+        except Exception:
+            self.stats["fetch_errors"] += 1
+            raise
+        weather["updated_at"] = datetime.now().isoformat()
+        self._cells[cell] = (time.monotonic(), weather)
+        self._cells.move_to_end(cell)
+        self._last_access.setdefault(cell, time.monotonic())
+        while len(self._cells) > self.max_cells:
+            evicted, _ = self._cells.popitem(last=False)
+            self._last_access.pop(evicted, None)
+        return weather
+
+    async def prefetch(self, south: float, west: float, north: float, east: float) -> Dict[str, Any]:
+        """批量获取范围内所有单元的天气，并标记为热点单元以便后台持续刷新"""
+        row0, row1 = self.cell_of(south, west)[0], self.cell_of(north, east)[0]
+        # 先按行列数计算单元总数，未超过上限才生成单元列表；每行至少一个单元，超限后即停止累加
+        spans = []
+        count = 0
+        for row in range(row0, row1 + 1):
+            dlon = self._dlon(row)
+            col0, col1 = math.floor(west / dlon), math.floor(east / dlon)
+            spans.append((row, col0, col1))
+            count += col1 - col0 + 1
+            if count > settings.WEATHER_PREFETCH_MAX_CELLS:
+                return {"status": "0", "error": f"单元数超过上限{settings.WEATHER_PREFETCH_MAX_CELLS}"}
+        cells = [(row, col) for row, col0, col1 in spans for col in range(col0, col1 + 1)]
+        now = time.monotonic()
+        semaphore = asyncio.Semaphore(settings.WEATHER_PREFETCH_CONCURRENCY)
+
+        async def fetch_one(cell: Cell) -> bool:
+            self._last_access[cell] = now
+            entry = self._cells.get(cell)
+            if entry is not None and now - entry[0] < self.ttl:
+                return True
+            async with semaphore:
+                try:
+                    await asyncio.shield(self._fetch(cell))
+                    return True
+                except Exception:
+                    return False
+
+        results = await asyncio.gather(*(fetch_one(cell) for cell in cells))
+        return {"status": "1", "cells": len(cells), "failed": results.count(False)}
+
+    async def refresh_due(self) -> int:
+        """刷新最近被访问过且即将过期的单元，返回刷新的单元数"""
+        now = time.monotonic()
+        due = [
+            cell for cell, (fetched_at, _) in self._cells.items()
+            if now - fetched_at >= self.ttl * settings.WEATHER_REFRESH_AHEAD
+            and now - self._last_access.get(cell, 0) <= settings.WEATHER_HOT_WINDOW
+        ]
+        semaphore = asyncio.Semaphore(settings.WEATHER_PREFETCH_CONCURRENCY)
+
+        async def refresh(cell: Cell) -> None:
+            async with semaphore:
+                await asyncio.shield(self._fetch(cell))
+
+        results = await asyncio.gather(*(refresh(cell) for cell in due), return_exceptions=True)
+        refreshed = sum(1 for r in results if not isinstance(r, BaseException))
+        self.stats["refreshes"] += refreshed
+        return refreshed
+
+    async def watch(self, interval: float) -> None:
+        """定期在后台提前刷新热点单元"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_due()
+            except Exception as e:
+                print(f"天气缓存刷新失败：{str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "provider": type(self.provider).__name__,
+            "cached_cells": len(self._cells),
+            "inflight": len(self._inflight)
+        }
+
+def _wind_direction(degrees: Optional[float]) -> str:
+    """风向角（风的来向）转为八方位"""
+    if degrees is None:
+        return ""
+    return WIND_DIRECTIONS[int((degrees % 360 + 22.5) // 45) % 8]
+
+weather_service = WeatherService()
@@ -0,0 +1,40 @@
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from src.models.database import Base, SessionLocal, User, UserPreference
+from src.utils.auth import create_access_token, get_current_user
+
+def test_current_user_preferences_available_after_session_closed():
+    # 使用临时数据库，避免改动本地的app.db
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'auth.db')}")
+    Base.metadata.create_all(engine)
+    original = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    try:
+        db = SessionLocal()
+        try:
+            user = User(username="alice", email="alice@example.com", hashed_password="unused")
+            db.add(user)
+            db.commit()
+            db.add(UserPreference(user_id=user.id, avoid_traffic=False))
+            db.commit()
+        finally:
+            db.close()
+
+        # 依赖返回时查询会话已关闭，偏好设置应已预先加载
+        current_user = asyncio.run(get_current_user(create_access_token({"sub": "alice"})))
+        assert current_user.username == "alice"
+        assert [p.avoid_traffic for p in current_user.preferences] == [False]
+    finally:
+        SessionLocal.configure(bind=original)
+        engine.dispose()
+
+if __name__ == "__main__":
+    test_current_user_preferences_available_after_session_closed()
+    print("当前用户依赖测试通过")
@@ -0,0 +1,62 @@
+import asyncio
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.route_cache import RouteCache
+
+def test_cancelled_first_caller_does_not_cancel_fetch():
+    async def run():
+        cache = RouteCache(max_size=10, fresh_ttl=60, stale_ttl=120, precision=7)
+        key = cache.key("walking", 39.9, 116.4, 39.91, 116.41)
+        calls = []
+        release = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return {"status": "1", "distance": 1000}
+
+        first = asyncio.ensure_future(cache.get_or_fetch(key, fetch, lambda r: r["status"] == "1"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_fetch(key, fetch, lambda r: r["status"] == "1"))
+        await asyncio.sleep(0)
+
+        # 第一个调用方（如客户端断开）被取消，上游请求应继续完成
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert (await second)["distance"] == 1000
+        assert first.cancelled()
+        assert len(calls) == 1
+        assert not cache._inflight
+        assert cache.get_stats()["size"] == 1
+
+    asyncio.run(run())
+
+def test_failed_fetch_is_not_cached():
+    async def run():
+        cache = RouteCache(max_size=10, fresh_ttl=60, stale_ttl=120, precision=7)
+        key = cache.key("walking", 39.9, 116.4, 39.91, 116.41)
+
+        async def fetch():
+            raise RuntimeError("上游不可用")
+
+        try:
+            await cache.get_or_fetch(key, fetch, lambda r: True)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("上游异常应传递给调用方")
+        assert not cache._inflight
+        assert cache.get_stats()["size"] == 0
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_cancelled_first_caller_does_not_cancel_fetch()
+    test_failed_fetch_is_not_cached()
+    print("路线缓存单飞测试通过")
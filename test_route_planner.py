@@ -0,0 +1,58 @@
+import asyncio
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.dependencies.utils import request_params_to_args
+from src.main import app
+from src.config.settings import settings
+from src.utils.overpass_cache import OverpassTileCache
+from src.utils.route_planner import route_planner
+
+def query_errors(path: str, params: dict) -> list:
+    """按接口声明校验查询参数，返回校验错误"""
+    route = next(r for r in app.routes if getattr(r, "path", None) == path)
+    _, errors = request_params_to_args(route.dependant.query_params, params)
+    return errors
+
+def test_nearby_limit_must_be_positive():
+    for path in ("/api/v1/transit/nearby", "/api/v1/bikes/nearby"):
+        base = {"lat": "39.9", "lon": "116.4"}
+        assert query_errors(path, {**base, "limit": "0"}), f"{path} limit=0 应被拒绝"
+        assert query_errors(path, {**base, "limit": "-1"}), f"{path} limit=-1 应被拒绝"
+        assert not query_errors(path, {**base, "limit": "5"})
+        assert not query_errors(path, base)
+
+def test_route_planner_rejects_non_positive_limit():
+    for limit in (0, -1):
+        for query in (route_planner.get_transit_stops, route_planner.get_bike_stations):
+            try:
+                asyncio.run(query(39.9, 116.4, 1000, limit))
+            except ValueError:
+                continue
+            raise AssertionError(f"{query.__name__} limit={limit} 应抛出ValueError")
+
+def test_nearby_radius_is_bounded():
+    for path in ("/api/v1/transit/nearby", "/api/v1/bikes/nearby"):
+        base = {"lat": "39.9", "lon": "116.4"}
+        assert query_errors(path, {**base, "radius": "0"}), f"{path} radius=0 应被拒绝"
+        assert query_errors(path, {**base, "radius": str(settings.NEARBY_MAX_RADIUS + 1)}), f"{path} 超大radius应被拒绝"
+        assert not query_errors(path, {**base, "radius": str(settings.NEARBY_MAX_RADIUS)})
+
+def test_overpass_tiles_are_capped():
+    cache = OverpassTileCache()
+    assert len(cache._tiles_around(39.9, 116.4, settings.NEARBY_MAX_RADIUS)) <= settings.OVERPASS_MAX_QUERY_TILES
+    try:
+        asyncio.run(cache.elements_around(39.9, 116.4, 10_000_000))
+    except ValueError:
+        return
+    raise AssertionError("覆盖瓦片过多的查询应抛出ValueError")
+
+if __name__ == "__main__":
+    test_nearby_limit_must_be_positive()
+    test_route_planner_rejects_non_positive_limit()
+    test_nearby_radius_is_bounded()
+    test_overpass_tiles_are_capped()
+    print("周边站点参数校验测试通过")